@@ -3,7 +3,9 @@ from pathlib import Path
 import pandas as pd
 import streamlit as st
 from datetime import date
-from io import BytesIO
+
+from utils.exportacao_utils import FORMATOS_EXPORTACAO, excel_bytes, exportar_bytes
+from utils.interface_utils import conteudo_sob_demanda
 
 # ``set_page_config`` deve ser chamado antes de qualquer outro elemento
 # Streamlit.  Ele define layout amplo para toda a aplicação e um título
@@ -155,10 +157,23 @@ def load_and_filter_estoque(empresa: str, busca: str) -> pd.DataFrame:
 
 def _df_to_excel(df: pd.DataFrame) -> bytes:
     """Converte ``DataFrame`` para bytes de um arquivo Excel."""
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False)
-    return output.getvalue()
+    return excel_bytes(df)
+
+
+def _botoes_colunares(df: pd.DataFrame, nome_base: str) -> None:
+    """Adiciona botões de download em Parquet e CSV compactado."""
+    for formato in ("parquet", "csv.gz"):
+        _, mime = FORMATOS_EXPORTACAO[formato]
+        nome_arquivo = f"{nome_base}.{formato}"
+        st.download_button(
+            f"📥 Exportar {formato.upper()}",
+            conteudo_sob_demanda(
+                nome_arquivo, lambda fmt=formato: exportar_bytes(df, fmt), df
+            ),
+            file_name=nome_arquivo,
+            mime=mime,
+            key=f"download_{nome_base}_{formato}",
+        )
 
 
 def _link_painel() -> None:
@@ -242,12 +257,15 @@ def show_reports() -> None:
         df = load_and_filter_vendidos(empresa, start_date, end_date, busca)
         st.download_button(
             "📥 Exportar Excel",
-            _df_to_excel(df),
+            conteudo_sob_demanda(
+                "relatorio_vendidos.xlsx", lambda: _df_to_excel(df), df
+            ),
             file_name="relatorio_vendidos.xlsx",
             mime=(
                 "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
             ),
         )
+        _botoes_colunares(df, "relatorio_vendidos")
         st.dataframe(df, use_container_width=True)
         st.markdown("### 📊 Lucro por Mês")
         if not df.empty:
@@ -268,12 +286,15 @@ def show_reports() -> None:
         m2.metric("Média Compra", f"R$ {avg_compra:,.2f}")
         st.download_button(
             "📥 Exportar Excel",
-            _df_to_excel(df_estoque),
+            conteudo_sob_demanda(
+                "relatorio_estoque.xlsx", lambda: _df_to_excel(df_estoque), df_estoque
+            ),
             file_name="relatorio_estoque.xlsx",
             mime=(
                 "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
             ),
         )
+        _botoes_colunares(df_estoque, "relatorio_estoque")
         st.dataframe(df_estoque, use_container_width=True)
 
 
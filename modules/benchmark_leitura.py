@@ -0,0 +1,85 @@
+"""Mede o processamento sequencial de XMLs com e sem leitura antecipada.
+
+Uso::
+
+    python -m modules.benchmark_leitura caminho/xmls --threads 0 2 4 8
+
+Antes de cada rodada as páginas dos arquivos são descartadas do cache do
+sistema operacional (``posix_fadvise(POSIX_FADV_DONTNEED)``), de modo que
+as leituras vão ao disco como numa primeira execução. Em sistemas sem
+``posix_fadvise`` as rodadas usam o cache quente.
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import statistics
+import time
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+from modules.estoque_veiculos import processar_xmls
+
+
+def descartar_cache(caminhos: Sequence[str]) -> bool:
+    """Remove os arquivos do cache de páginas; ``False`` se não suportado."""
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    for caminho in caminhos:
+        fd = os.open(caminho, os.O_RDONLY)
+        try:
+            os.fdatasync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    return True
+
+
+def medir(
+    caminhos: List[str], threads: Sequence[int], repeticoes: int = 3, cnpj: str = ""
+) -> Dict[int, List[float]]:
+    """Retorna os tempos, em segundos, de cada rodada por número de threads."""
+    tempos: Dict[int, List[float]] = {n: [] for n in threads}
+    for _ in range(repeticoes):
+        # Alterna as configurações para que nenhuma se beneficie da ordem
+        for n in threads:
+            descartar_cache(caminhos)
+            inicio = time.perf_counter()
+            # Em série: o executor "auto" poderia escolher threads ou
+            # processos, que ignoram ``leitores``
+            processar_xmls(
+                caminhos, cnpj, erros=[], triar=False, executor="serial", leitores=n
+            )
+            tempos[n].append(time.perf_counter() - inicio)
+    return tempos
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pasta", help="Pasta com os XMLs (busca recursiva)")
+    parser.add_argument("--threads", type=int, nargs="+", default=[0, 4])
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--cnpj", default="")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.WARNING)
+    caminhos = sorted(str(p) for p in Path(args.pasta).rglob("*.xml"))
+    if not caminhos:
+        parser.error(f"Nenhum XML em {args.pasta}")
+    if not descartar_cache(caminhos):
+        print("posix_fadvise indisponível: medindo com cache quente")
+
+    tempos = medir(caminhos, args.threads, args.repeticoes, args.cnpj)
+    print(f"{len(caminhos)} XMLs, {args.repeticoes} rodadas por configuração")
+    for n, valores in tempos.items():
+        rotulo = "sem leitura antecipada" if n == 0 else f"{n} threads de leitura"
+        print(
+            f"{rotulo:>24}: mediana {statistics.median(valores):.2f}s "
+            f"(mín {min(valores):.2f}s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
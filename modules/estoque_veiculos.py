@@ -1,4 +1,10 @@
+import mmap
+import multiprocessing
 import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
 import pandas as pd
 import xml.etree.ElementTree as ET
@@ -6,8 +12,18 @@ import json
 import re
 import logging
 from modules.configurador_planilha import configurar_planilha
+from utils.exportacao_utils import FORMATOS_EXPORTACAO, escrever_excel, exportar_dados
+from utils.arquivos_utils import ler_antecipado
+from utils.triagem_xml import indice_padrao, triar_xmls
+from utils.quarentena_xml import Quarentena, quarentena_padrao, resumo_conteudo
+from utils.metricas_utils import coletar_metricas, contar, etapa
 from datetime import datetime
-from typing import List, Dict, Any, Optional, Union, Tuple
+
+try:
+    from lxml import etree as LET
+except ImportError:  # pragma: no cover - lxml é opcional
+    LET = None
+from typing import List, Dict, Any, Optional, Set, Union, Tuple
 
 log = logging.getLogger(__name__)
 
@@ -77,6 +93,45 @@ except Exception as e:
         "CHAVE XML": {"tipo": "str", "ordem": 100}
     }
 
+# XMLs a partir deste tamanho são mapeados em memória em vez de copiados
+LIMITE_MMAP_BYTES = 1024 * 1024
+# Threads que leem XMLs adiante no processamento sequencial
+THREADS_LEITURA_PADRAO = 4
+# Seleção automática do executor em processar_xmls
+MODOS_EXECUCAO = ("serial", "thread", "process", "auto")
+AMOSTRA_EXECUTOR = 8
+LIMITE_SERIAL_S = 0.2
+# Medidos com fork (Linux); com spawn cada worker reimporta pandas e o módulo
+CUSTO_INICIO_PROCESSOS_S = {"fork": 0.1, "forkserver": 0.5, "spawn": 2.0}
+CUSTO_IPC_POR_XML_S = 0.00005
+# Erros do expat para codificação desconhecida ou incorreta e para token inválido
+_ERROS_ENCODING_EXPAT = {18, 19}
+_ERRO_TOKEN_INVALIDO = 4
+# Erros do libxml2 (lxml) para codificação não suportada e bytes inválidos
+_ERROS_ENCODING_LXML = {32, 81}
+_ERROS_PARSE = (ET.ParseError, LookupError) + ((LET.XMLSyntaxError,) if LET else ())
+# Limites contra XMLs patológicos: tempo de extração por arquivo e tamanho
+# do texto entregue a cada expressão regular
+_LIMITES_EXTRACAO = CONFIG_EXTRACAO.get("limites_extracao", {})
+TEMPO_MAXIMO_ARQUIVO_S = float(_LIMITES_EXTRACAO.get("tempo_maximo_arquivo_s", 10))
+TAMANHO_TEXTO_REGEX = {"padrao": 4000, **_LIMITES_EXTRACAO.get("tamanho_texto_regex", {})}
+
+
+class TempoExcedido(TimeoutError):
+    """A extração de um XML passou de :data:`TEMPO_MAXIMO_ARQUIVO_S`."""
+
+
+def _backend_xml() -> str:
+    """Parser configurado em ``XML_BACKEND``; lxml por padrão, quando instalado."""
+    if LET is None or os.getenv("XML_BACKEND", "lxml").lower() == "etree":
+        return "etree"
+    return "lxml"
+
+
+# lxml libera o GIL durante o parse, o que permite extrair com threads
+BACKEND_XML = _backend_xml()
+_parsers_lxml = threading.local()
+
 # Pré-compilar as expressões regulares para melhor performance
 REGEX_COMPILADOS = {}
 try:
@@ -269,11 +324,29 @@ def extrair_placa(texto_completo: str) -> Optional[str]:
 
     return None
 
+def _texto_para_regex(texto: str, campo: str) -> str:
+    """Trunca ``texto`` ao limite de :data:`TAMANHO_TEXTO_REGEX` do campo."""
+    limite = TAMANHO_TEXTO_REGEX.get(campo, TAMANHO_TEXTO_REGEX["padrao"])
+    return texto[:limite] if limite and len(texto) > limite else texto
+
+
+def _verificar_prazo(prazo: float, xml_path: str) -> None:
+    if time.monotonic() > prazo:
+        raise TempoExcedido(
+            f"{xml_path}: extração abandonada após {TEMPO_MAXIMO_ARQUIVO_S:g}s"
+        )
+
+
 def extrair_info_com_regex(texto_completo: str, campo: str) -> Optional[str]:
-    """Extrai informações usando regex em um texto."""
+    """Extrai informações usando regex em um texto.
+
+    O texto é truncado ao limite do campo em ``limites_extracao``, o que
+    limita o custo de padrões com retrocesso em descrições muito longas.
+    """
     if not texto_completo or not campo:
         return None
-    
+    texto_completo = _texto_para_regex(texto_completo, campo)
+
     # Caso especial para Placa que tem um padrão mais complexo
     if campo == "Placa":
         return extrair_placa(texto_completo)
@@ -314,45 +387,168 @@ def normalizar_cnpj(cnpj: Optional[str]) -> Optional[str]:
     return re.sub(r'\D', '', str(cnpj))
 
 
-def safe_parse_xml(xml_path):
-    if not os.path.exists(xml_path):
-        logging.warning(f"XML não encontrado, pulando: {xml_path}")
-        return None, f"Não encontrado: {xml_path}"
+def _parse_bytes(data):
+    if BACKEND_XML == "lxml":
+        # Parsers do lxml não podem ser compartilhados entre threads
+        parser = getattr(_parsers_lxml, "parser", None)
+        if parser is None:
+            parser = _parsers_lxml.parser = LET.XMLParser(
+                resolve_entities=False, no_network=True
+            )
+        return LET.fromstring(data, parser)
+    parser = ET.XMLParser()
+    parser.feed(data)
+    return parser.close()
+
+
+def _falha_de_encoding(erro: Exception, data) -> bool:
+    """Indica se ``erro`` vem de bytes incompatíveis com a codificação declarada."""
+    if isinstance(erro, LookupError):
+        return True
+    codigo = getattr(erro, "code", None)
+    if LET is not None and isinstance(erro, LET.XMLSyntaxError):
+        return codigo in _ERROS_ENCODING_LXML
+    if codigo in _ERROS_ENCODING_EXPAT:
+        return True
+    if codigo == _ERRO_TOKEN_INVALIDO:
+        # Bytes Latin-1 em XML declarado (ou presumido) UTF-8
+        try:
+            bytes(data).decode("utf-8")
+        except UnicodeDecodeError:
+            return True
+    return False
+
+
+def parse_conteudo_xml(data, origem: str = "<memória>"):
+    """Faz o parse dos bytes de ``data`` respeitando a codificação declarada.
+
+    ``data`` pode ser ``bytes`` ou qualquer objeto com *buffer protocol*
+    (como um ``memoryview`` sobre ``mmap``). O parser é o de
+    :data:`BACKEND_XML`. Apenas se os bytes não
+    corresponderem à codificação declarada o conteúdo é decodificado como
+    Latin-1 e analisado novamente. Retorna ``(tree, None)`` em caso de
+    sucesso ou ``(None, mensagem)``.
+    """
+    try:
+        return ET.ElementTree(_parse_bytes(data)), None
+    except _ERROS_PARSE as e:
+        erro: Exception = e
+    if _falha_de_encoding(erro, data):
+        log.debug(f"Codificação declarada não confere em {origem}; relendo como Latin-1")
+        try:
+            return ET.ElementTree(ET.fromstring(bytes(data).decode("latin-1"))), None
+        except ET.ParseError as e:
+            erro = e
+    logging.error(f"Erro de parse em {origem}: {erro}")
+    return None, f"ParseError: {origem} -> {erro}"
+
+
+def _parse_verificado(data, origem: str, quarentena: Optional[Quarentena]):
+    """:func:`parse_conteudo_xml` consultando e alimentando ``quarentena``."""
+    if quarentena is None:
+        return parse_conteudo_xml(data, origem)
+    resumo = resumo_conteudo(data)
+    motivo = quarentena.motivo(resumo)
+    if motivo is not None:
+        return None, f"Em quarentena: {origem} -> {motivo}"
+    tree, err = parse_conteudo_xml(data, origem)
+    if err:
+        quarentena.registrar(resumo, origem, err)
+    return tree, err
+
+
+def safe_parse_xml(xml_path, quarentena: Optional[Quarentena] = None):
+    """Lê e faz o parse de ``xml_path``; arquivos grandes são mapeados com ``mmap``.
+
+    Com ``quarentena``, um conteúdo que já falhou não é analisado de novo e
+    uma nova falha de parse é registrada nela.
+    """
     try:
         with open(xml_path, "rb") as f:
+            if os.fstat(f.fileno()).st_size >= LIMITE_MMAP_BYTES:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapa, memoryview(mapa) as dados:
+                    return _parse_verificado(dados, xml_path, quarentena)
             data = f.read()
-        for enc in ("utf-8", "latin-1", "iso-8859-1"):
-            try:
-                text = data.decode(enc)
-                tree = ET.ElementTree(ET.fromstring(text))
-                return tree, None
-            except UnicodeDecodeError:
-                continue
-            except ET.ParseError as e:
-                logging.error(f"Erro de parse em {xml_path}: {e}")
-                return None, f"ParseError: {xml_path} -> {e}"
-        logging.error(f"Falha de encoding ao ler {xml_path}")
-        return None, f"EncodingError: {xml_path}"
+    except FileNotFoundError:
+        logging.warning(f"XML não encontrado, pulando: {xml_path}")
+        return None, f"Não encontrado: {xml_path}"
     except OSError as e:
         logging.error(f"Erro de leitura em {xml_path}: {e}")
         return None, f"IOError: {xml_path} -> {e}"
+    return _parse_verificado(data, xml_path, quarentena)
 
 def extrair_dados_xml(
-    xml_path: str, erros: Optional[List[str]] = None
+    xml_path: str,
+    erros: Optional[List[str]] = None,
+    quarentena: Optional[Quarentena] = None,
+    contadores: Optional[Counter] = None,
 ) -> List[Dict[str, Any]]:
     """Extrai dados de um arquivo XML de NFe.
 
     ``erros`` é uma lista opcional onde mensagens de erro serão acumuladas.
+    ``quarentena`` é repassada a :func:`safe_parse_xml`. ``contadores``
+    recebe as contagens da extração (ver :func:`resumo_contadores`).
+    """
+    tree, err = safe_parse_xml(xml_path, quarentena)
+    return _extrair_dados_arvore(tree, err, xml_path, erros, contadores)
+
+
+def extrair_dados_conteudo(
+    conteudo: bytes,
+    xml_path: str,
+    erros: Optional[List[str]] = None,
+    quarentena: Optional[Quarentena] = None,
+    contadores: Optional[Counter] = None,
+) -> List[Dict[str, Any]]:
+    """Igual a :func:`extrair_dados_xml`, a partir do conteúdo já em memória.
+
+    ``xml_path`` identifica a nota nos registros (coluna ``XML Path``) e nas
+    mensagens de erro; o arquivo não precisa existir em disco.
     """
-    tree, err = safe_parse_xml(xml_path)
+    tree, err = _parse_verificado(conteudo, xml_path, quarentena)
+    return _extrair_dados_arvore(tree, err, xml_path, erros, contadores)
+
+
+def resumo_contadores(contadores: Counter) -> str:
+    """Uma linha com as contagens acumuladas por :func:`extrair_dados_xml`.
+
+    As chaves são ``xmls``, ``itens``, ``alto_valor`` e, por campo,
+    ``ausente:<campo>`` e ``invalido:<campo>``.
+    """
+    partes = [
+        f"{contadores['xmls']} XMLs",
+        f"{contadores['itens']} itens",
+        f"{contadores['alto_valor']} de alto valor",
+    ]
+    for prefixo, rotulo in (("ausente:", "campos ausentes"), ("invalido:", "valores inválidos")):
+        campos = sorted(
+            (chave[len(prefixo):], total)
+            for chave, total in contadores.items()
+            if chave.startswith(prefixo) and total
+        )
+        if campos:
+            partes.append(f"{rotulo}: " + ", ".join(f"{c}={t}" for c, t in campos))
+    return "Extração: " + "; ".join(partes)
+
+
+def _extrair_dados_arvore(
+    tree,
+    err: Optional[str],
+    xml_path: str,
+    erros: Optional[List[str]],
+    contadores: Optional[Counter] = None,
+) -> List[Dict[str, Any]]:
     if err:
         if erros is not None:
             erros.append(err)
         else:
             log.warning(err)
         return []
+    if contadores is None:
+        contadores = Counter()
+    prazo = time.monotonic() + TEMPO_MAXIMO_ARQUIVO_S
     try:
-        log.info(f"Processando XML: {xml_path}")
+        log.debug("Processando XML: %s", xml_path)
         root = tree.getroot()
         
         # Detectar namespace automaticamente
@@ -361,13 +557,13 @@ def extrair_dados_xml(
         ns = {'nfe': ns_uri} if ns_uri else {}
         
         # Log para debug do namespace
-        log.debug(f"Namespace detectado: {ns}")
+        log.debug("Namespace detectado: %s", ns)
 
         # Obter número da NF para referência em logs
         try:
             xpath_num_nf = CONFIG_EXTRACAO.get("xpath_campos", {}).get("Número NF", ".//nfe:ide/nfe:nNF")
             num_nf = root.findtext(xpath_num_nf, namespaces=ns) or "Desconhecido"
-            log.info(f"Processando NF número: {num_nf}")
+            log.debug("Processando NF número: %s", num_nf)
         except Exception as e:
             log.warning(f"Erro ao obter número da NF: {e}")
             num_nf = "Desconhecido"
@@ -422,7 +618,7 @@ def extrair_dados_xml(
                 namespaces=ns,
             ),
         }
-        log.debug(f"Cabeçalho extraído: {cabecalho}")
+        log.debug("Cabeçalho extraído: %s", cabecalho)
 
         registros = []
         # Campos padrão baseados nas chaves do LAYOUT_COLUNAS + campos adicionais
@@ -430,7 +626,7 @@ def extrair_dados_xml(
 
         # Procura por itens (produtos) na NFe
         itens = root.findall('.//nfe:det', ns)
-        log.info(f"Encontrados {len(itens)} itens na NF")
+        log.debug("Encontrados %d itens na NF", len(itens))
 
         # Extrair informações adicionais gerais da nota
         obs_fisco = root.findtext('.//nfe:infAdic/nfe:infAdFisco', namespaces=ns) or ""
@@ -438,6 +634,7 @@ def extrair_dados_xml(
         infos_gerais = f"{obs_fisco} {obs_complementares}".strip()
         
         for i, item in enumerate(itens, 1):
+            _verificar_prazo(prazo, xml_path)
             dados = {col: None for col in campos_padrao}
             dados.update(cabecalho)
             dados['XML Path'] = xml_path
@@ -453,7 +650,7 @@ def extrair_dados_xml(
             
             dados['Produto'] = limpar_texto(xProd)
 
-            log.debug(f"Processando item {i}: {dados['Produto'][:50]}...")
+            log.debug("Processando item %d: %.50s...", i, dados['Produto'])
 
             # Dados de ICMS do item
             try:
@@ -490,7 +687,7 @@ def extrair_dados_xml(
                     dados['Combustível'] = veiculo.findtext('nfe:tpComb', namespaces=ns)
                     dados['Cor'] = veiculo.findtext('nfe:xCor', namespaces=ns) 
                     dados['Potência'] = veiculo.findtext('nfe:potencia', namespaces=ns)
-                    log.info(f"Dados de veículo encontrados no nó veicProd para item {i}")
+                    log.debug("Dados de veículo encontrados no nó veicProd para item %d", i)
             except Exception as e:
                 log.warning(f"Erro ao buscar nó de veículo: {e}")
 
@@ -499,12 +696,13 @@ def extrair_dados_xml(
                 # Se já encontrou o valor na estrutura XML, não sobrescrever
                 if campo in dados and dados[campo]:
                     continue
+                _verificar_prazo(prazo, xml_path)
 
                 if campo == "Ano Modelo":
                     anos = extrair_info_com_regex(produto_completo, campo)
                     # Se encontrou ano modelo, tenta extrair também ano fabricação
                     if anos:
-                        match = REGEX_COMPILADOS.get(campo, re.compile(CONFIG_EXTRACAO["regex_extracao"][campo], re.IGNORECASE)).search(produto_completo)
+                        match = REGEX_COMPILADOS.get(campo, re.compile(CONFIG_EXTRACAO["regex_extracao"][campo], re.IGNORECASE)).search(_texto_para_regex(produto_completo, campo))
                         if match:
                             # Verifica qual formato foi usado
                             if match.group(1) and match.group(2):  # Formato principal
@@ -513,12 +711,12 @@ def extrair_dados_xml(
                             elif match.group(3) and match.group(4):  # Formato alternativo
                                 dados["Ano Fabricação"] = match.group(3)
                                 dados["Ano Modelo"] = match.group(4)
-                            log.debug(f"Extraído Ano Fab/Modelo: {dados.get('Ano Fabricação')}/{dados.get('Ano Modelo')}")
+                            log.debug("Extraído Ano Fab/Modelo: %s/%s", dados.get('Ano Fabricação'), dados.get('Ano Modelo'))
                 else:
                     valor = extrair_info_com_regex(produto_completo, campo)
                     if valor:
                         dados[campo] = valor
-                        log.debug(f"Extraído {campo}: {valor}")
+                        log.debug("Extraído %s: %s", campo, valor)
 
             # Caso especial: chassi presente apenas como sufixo em xProd
             if not dados.get("Chassi") and xProd:
@@ -533,21 +731,24 @@ def extrair_dados_xml(
                 if validar_chassi(dados["Chassi"]):
                     dados["Chassi"] = dados["Chassi"].upper()
                 else:
-                    log.warning(f"Chassi inválido encontrado: {dados['Chassi']}")
+                    contadores["invalido:Chassi"] += 1
+                    log.debug("Chassi inválido encontrado: %s", dados['Chassi'])
                     dados["Chassi"] = None
             
             if dados.get("Placa"):
                 if validar_placa(dados["Placa"]):
                     dados["Placa"] = dados["Placa"].upper()
                 else:
-                    log.warning(f"Placa inválida encontrada: {dados['Placa']}")
+                    contadores["invalido:Placa"] += 1
+                    log.debug("Placa inválida encontrada: %s", dados['Placa'])
                     dados["Placa"] = None
             
             if dados.get("Renavam"):
                 if validar_renavam(dados["Renavam"]):
                     dados["Renavam"] = re.sub(r'\D', '', dados["Renavam"])
                 else:
-                    log.warning(f"Renavam inválido encontrado: {dados['Renavam']}")
+                    contadores["invalido:Renavam"] += 1
+                    log.debug("Renavam inválido encontrado: %s", dados['Renavam'])
                     dados["Renavam"] = None
 
             # Adicionar valor do item
@@ -555,74 +756,317 @@ def extrair_dados_xml(
                 valor_item = float(item.findtext('.//nfe:prod/nfe:vProd', namespaces=ns) or "0")
                 dados["Valor Item"] = valor_item
                 if valor_item > 50000:  # Veículos de alto valor
-                    log.info(f"Item de alto valor detectado: R${valor_item:.2f}")
+                    contadores["alto_valor"] += 1
+                    log.debug("Item de alto valor detectado: R$%.2f", valor_item)
             except Exception as e:
                 log.warning(f"Erro ao processar valor do item: {e}")
                 dados["Valor Item"] = None
 
             for campo_obg in ["Chassi", "Placa", "CFOP", "Valor Total", "Data Emissão"]:
                 if not dados.get(campo_obg):
-                    log.warning(
-                        f"Campo obrigatório '{campo_obg}' ausente no item {i} do XML {xml_path}"
+                    contadores[f"ausente:{campo_obg}"] += 1
+                    log.debug(
+                        "Campo obrigatório '%s' ausente no item %d do XML %s", campo_obg, i, xml_path
                     )
 
             registros.append(dados)
 
-        log.info(f"Total de {len(registros)} registros extraídos do XML")
+        contadores["xmls"] += 1
+        contadores["itens"] += len(registros)
+        log.debug("Total de %d registros extraídos do XML", len(registros))
         return registros
 
+    except TempoExcedido as e:
+        mensagem = f"TempoExcedido: {e}"
+        if erros is not None:
+            erros.append(mensagem)
+        else:
+            log.warning(mensagem)
+        return []
     except (ET.ParseError, ValueError, AttributeError, KeyError) as e:
         log.error(f"Erro ao processar {xml_path}: {e}")
         import traceback
         log.error(traceback.format_exc())
         return []
 
+def threads_leitura() -> int:
+    """Threads de leitura antecipada, configuráveis por ``XML_THREADS_LEITURA``."""
+    try:
+        return max(0, int(os.getenv("XML_THREADS_LEITURA", THREADS_LEITURA_PADRAO)))
+    except ValueError:
+        return THREADS_LEITURA_PADRAO
+
+
+_quarentena_processo: Optional[Quarentena] = None
+
+
+def _iniciar_processo(entradas_quarentena: Optional[Dict[str, list]]) -> None:
+    """Inicializador dos workers: cópia local da quarentena do processo principal."""
+    global _quarentena_processo
+    if entradas_quarentena is None:
+        _quarentena_processo = None
+        return
+    _quarentena_processo = Quarentena()
+    _quarentena_processo.incluir(entradas_quarentena)
+
+
+def _extrair_com_erros(
+    xml_path: str,
+) -> Tuple[List[Dict[str, Any]], List[str], Dict[str, list], Counter]:
+    """Executado nos processos: devolve registros, erros, novas quarentenas e contadores."""
+    erros: List[str] = []
+    contadores: Counter = Counter()
+    registros = extrair_dados_xml(xml_path, erros, _quarentena_processo, contadores)
+    novas = _quarentena_processo.novas() if _quarentena_processo is not None else {}
+    return registros, erros, novas, contadores
+
+
+def _tamanho(xml_path: str) -> int:
+    try:
+        return os.path.getsize(xml_path)
+    except OSError:
+        return 0
+
+
+def _metodo_inicio_processos() -> str:
+    # Sem fixar o método: o primeiro de get_all_start_methods é o padrão
+    return (
+        multiprocessing.get_start_method(allow_none=True)
+        or multiprocessing.get_all_start_methods()[0]
+    )
+
+
+def escolher_executor(
+    segundos_por_byte: float,
+    fracao_parse: float,
+    total_bytes: int,
+    total_xmls: int,
+    max_workers: int,
+    backend: str = BACKEND_XML,
+) -> str:
+    """Escolhe ``"serial"``, ``"thread"`` ou ``"process"`` pelo menor tempo estimado.
+
+    ``segundos_por_byte`` e ``fracao_parse`` (parte do tempo gasta no parse)
+    vêm de uma amostra processada em série. Threads só aceleram o parse, e
+    apenas com lxml, que libera o GIL; processos aceleram tudo, mas pagam a
+    criação do pool e a serialização dos registros.
+    """
+    serial = segundos_por_byte * total_bytes
+    if max_workers < 2 or serial < LIMITE_SERIAL_S:
+        return "serial"
+    estimativas = {"serial": serial}
+    if backend == "lxml":
+        estimativas["thread"] = serial * ((1 - fracao_parse) + fracao_parse / max_workers)
+    estimativas["process"] = (
+        serial / max_workers
+        + CUSTO_INICIO_PROCESSOS_S.get(_metodo_inicio_processos(), 2.0)
+        + CUSTO_IPC_POR_XML_S * total_xmls
+    )
+    # Em empate, a opção mais simples
+    return min(estimativas, key=lambda modo: (estimativas[modo], MODOS_EXECUCAO.index(modo)))
+
+
+def _amostrar(
+    xml_paths: List[str],
+    erros: Optional[List[str]],
+    quarentena: Optional[Quarentena] = None,
+    contadores: Optional[Counter] = None,
+) -> Tuple[List[Dict[str, Any]], float, float, int]:
+    """Processa ``xml_paths`` em série medindo ``(registros, s/byte, fração de parse, bytes)``."""
+    registros: List[Dict[str, Any]] = []
+    tempo_parse = tempo_total = 0.0
+    total_bytes = 0
+    for xml_path in xml_paths:
+        inicio = time.perf_counter()
+        tree, err = safe_parse_xml(xml_path, quarentena)
+        meio = time.perf_counter()
+        registros.extend(_extrair_dados_arvore(tree, err, xml_path, erros, contadores))
+        tempo_parse += meio - inicio
+        tempo_total += time.perf_counter() - inicio
+        total_bytes += _tamanho(xml_path)
+    por_byte = tempo_total / total_bytes if total_bytes else 0.0
+    fracao = tempo_parse / tempo_total if tempo_total else 0.0
+    return registros, por_byte, fracao, total_bytes
+
+
+def _executar_em_pool(pool, funcao, xml_paths: List[str]) -> List[Any]:
+    """Resultados de ``funcao`` para cada XML, na ordem de ``xml_paths``.
+
+    Um envio por arquivo, coletado com ``as_completed``: um XML lento ocupa
+    apenas o seu worker, e os demais continuam sendo distribuídos.
+    """
+    futuros = {pool.submit(funcao, xml_path): i for i, xml_path in enumerate(xml_paths)}
+    resultados: List[Any] = [None] * len(xml_paths)
+    for futuro in as_completed(futuros):
+        resultados[futuros[futuro]] = futuro.result()
+    return resultados
+
+
+def _extrair_registros(
+    xml_paths: List[str],
+    erros: Optional[List[str]],
+    quarentena: Quarentena,
+    contadores: Counter,
+    leitores: Optional[int],
+    executor: str,
+    max_workers: Optional[int],
+) -> List[Dict[str, Any]]:
+    """Extrai os registros de ``xml_paths`` no modo de :func:`processar_xmls`."""
+    todos_registros: List[Dict[str, Any]] = []
+    total_xmls = len(xml_paths)
+    log.info(f"Iniciando processamento de {total_xmls} arquivos XML")
+    max_workers = max_workers or min(multiprocessing.cpu_count(), 8)  # Limitar a 8 workers
+
+    restantes = list(xml_paths)
+    if executor == "auto":
+        if total_xmls <= AMOSTRA_EXECUTOR:
+            executor = "serial"
+        else:
+            amostra, restantes = restantes[:AMOSTRA_EXECUTOR], restantes[AMOSTRA_EXECUTOR:]
+            registros, por_byte, fracao, _ = _amostrar(amostra, erros, quarentena, contadores)
+            todos_registros.extend(registros)
+            executor = escolher_executor(
+                por_byte,
+                fracao,
+                sum(_tamanho(p) for p in restantes),
+                len(restantes),
+                max_workers,
+            )
+            log.info(
+                f"Executor escolhido: {executor} ({por_byte * 1e6:.2f} s/MB, "
+                f"{fracao:.0%} do tempo no parse, backend {BACKEND_XML})"
+            )
+
+    if executor == "thread":
+        log.info(f"Usando processamento com {max_workers} threads")
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="extracao") as pool:
+            def _extrair(xml_path: str):
+                # Contadores por arquivo, somados nesta thread
+                parcial: Counter = Counter()
+                return extrair_dados_xml(xml_path, erros, quarentena, parcial), parcial
+
+            for registros, parcial in _executar_em_pool(pool, _extrair, restantes):
+                todos_registros.extend(registros)
+                contadores.update(parcial)
+    elif executor == "process":
+        try:
+            log.info(f"Usando processamento paralelo com {max_workers} workers")
+            with ProcessPoolExecutor(
+                max_workers=max_workers,
+                initializer=_iniciar_processo,
+                initargs=(quarentena.entradas(),),
+            ) as pool:
+                for registros, erros_xml, novas, parcial in _executar_em_pool(
+                    pool, _extrair_com_erros, restantes
+                ):
+                    todos_registros.extend(registros)
+                    quarentena.incluir(novas)
+                    contadores.update(parcial)
+                    if erros is not None:
+                        erros.extend(erros_xml)
+                    else:
+                        for erro in erros_xml:
+                            log.warning(erro)
+        except (OSError, ValueError) as e:
+            log.warning(
+                f"Erro no processamento paralelo: {e}. Usando processamento sequencial."
+            )
+            executor = "serial"
+
+    # Processamento sequencial como fallback ou opção principal
+    if executor == "serial":
+        leitores = threads_leitura() if leitores is None else leitores
+        if leitores > 0 and len(restantes) > 1:
+            # Lê os próximos arquivos enquanto o atual é processado
+            arquivos = ler_antecipado(restantes, leitores, limite_bytes=LIMITE_MMAP_BYTES)
+        else:
+            arquivos = ((xml_path, None) for xml_path in restantes)
+        for i, (xml_path, conteudo) in enumerate(arquivos, total_xmls - len(restantes) + 1):
+            log.debug("Processando arquivo %d/%d: %s", i, total_xmls, xml_path)
+            if conteudo is not None:
+                registros = extrair_dados_conteudo(conteudo, xml_path, erros, quarentena, contadores)
+            else:
+                registros = extrair_dados_xml(xml_path, erros, quarentena, contadores)
+            if registros:
+                todos_registros.extend(registros)
+                log.debug("Extraídos %d registros do arquivo %d", len(registros), i)
+            else:
+                log.debug("Nenhum registro extraído do XML: %s", xml_path)
+
+    return todos_registros
+
+
 def processar_xmls(
     xml_paths: List[str],
     cnpj_empresa: Union[str, List[str]],
     erros: Optional[List[str]] = None,
+    duplicadas: Optional[List[str]] = None,
+    canceladas: Optional[Set[str]] = None,
+    triar: bool = True,
+    leitores: Optional[int] = None,
+    executor: str = "auto",
+    max_workers: Optional[int] = None,
+    quarentena: Optional[Quarentena] = None,
 ) -> pd.DataFrame:
-    """Processa múltiplos arquivos XML e retorna um DataFrame consolidado."""
-    todos_registros = []
-    total_xmls = len(xml_paths)
-    log.info(f"Iniciando processamento de {total_xmls} arquivos XML")
+    """Processa múltiplos arquivos XML e retorna um DataFrame consolidado.
 
-    # Usar paralelismo para processamento mais rápido com muitos arquivos XML
-    use_parallel = total_xmls > 10 and erros is None
+    Com ``triar``, os arquivos passam antes por
+    :func:`utils.triagem_xml.triar_xmls`: apenas NF-e são extraídas, uma
+    vez por chave de acesso (os caminhos repetidos vão para
+    ``duplicadas``), e eventos de cancelamento alimentam ``canceladas``.
 
-    if use_parallel:
-        try:
-            # Importação condicional para não depender desta lib se não for usada
-            from concurrent.futures import ProcessPoolExecutor
-            import multiprocessing
-            
-            max_workers = min(multiprocessing.cpu_count(), 8)  # Limitar a 8 workers
-            log.info(f"Usando processamento paralelo com {max_workers} workers")
-            
-            with ProcessPoolExecutor(max_workers=max_workers) as executor:
-                results = list(executor.map(extrair_dados_xml, xml_paths))
-                
-            for registros in results:
-                if registros:
-                    todos_registros.extend(registros)
-                    
-        except (OSError, ValueError) as e:
-            log.warning(
-                f"Erro no processamento paralelo: {e}. Usando processamento sequencial."
+    ``executor`` define como os XMLs são extraídos: ``"serial"``,
+    ``"thread"`` (pool de threads, sem serializar registros; útil com lxml),
+    ``"process"`` ou ``"auto"``, que processa uma amostra em série e escolhe
+    o modo mais rápido para o restante (ver :func:`escolher_executor`). No
+    modo serial, ``leitores`` threads (padrão: :func:`threads_leitura`;
+    ``0`` desativa) leem os próximos arquivos enquanto o atual é extraído.
+
+    Um XML cuja extração passa de :data:`TEMPO_MAXIMO_ARQUIVO_S` é
+    abandonado e registrado em ``erros`` como ``TempoExcedido``.
+
+    XMLs que falham no parse entram em ``quarentena`` (padrão:
+    :func:`utils.quarentena_xml.quarentena_padrao`) e, enquanto o conteúdo
+    não mudar, são descartados sem novo parse com um erro ``Em quarentena``.
+    """
+    if executor not in MODOS_EXECUCAO:
+        raise ValueError(f"executor deve ser um de {MODOS_EXECUCAO}: {executor!r}")
+    if triar:
+        ignoradas: List[str] = []
+        with etapa("triagem", entrada=xml_paths) as medida:
+            xml_paths = medida.saida(triar_xmls(xml_paths, indice_padrao(), ignoradas, canceladas))
+        if ignoradas:
+            log.info(f"{len(ignoradas)} XMLs ignorados por chave de acesso repetida")
+        if duplicadas is not None:
+            duplicadas.extend(ignoradas)
+    if quarentena is None:
+        quarentena = quarentena_padrao()
+    contadores: Counter = Counter()
+    with etapa("parse", entrada=xml_paths) as medida:
+        todos_registros = medida.saida(
+            _extrair_registros(
+                xml_paths, erros, quarentena, contadores, leitores, executor, max_workers
             )
-            use_parallel = False
-    
-    # Processamento sequencial como fallback ou opção principal
-    if not use_parallel:
-        for i, xml_path in enumerate(xml_paths, 1):
-            log.info(f"Processando arquivo {i}/{total_xmls}: {xml_path}")
-            registros = extrair_dados_xml(xml_path, erros)
-            if registros:
-                todos_registros.extend(registros)
-                log.info(f"Extraídos {len(registros)} registros do arquivo {i}")
-            else:
-                log.warning(f"Nenhum registro extraído do XML: {xml_path}")
+        )
+    try:
+        quarentena.salvar()
+    except OSError as e:
+        log.warning(f"Não foi possível gravar a quarentena: {e}")
+    log.info(resumo_contadores(contadores))
+    for nome, total in contadores.items():
+        contar(nome, total)
+    return consolidar_registros(todos_registros, cnpj_empresa)
+
+
+def consolidar_registros(
+    todos_registros: List[Dict[str, Any]],
+    cnpj_empresa: Union[str, List[str]],
+) -> pd.DataFrame:
+    """Monta o DataFrame final a partir dos registros extraídos dos XMLs.
 
+    Aplica a classificação das notas e dos produtos, o layout configurado
+    e a ordem padrão das colunas.
+    """
     if not todos_registros:
         log.error("Nenhum dado extraído de nenhum XML.")
         return pd.DataFrame()
@@ -644,26 +1088,29 @@ def processar_xmls(
 
     df['Empresa CNPJ'] = empresa_padrao
 
-    df[['Tipo Nota', 'Alerta Auditoria']] = df.apply(
-        lambda row: classificar_tipo_nota(
-            row['Emitente CNPJ/CPF'],
-            row['Destinatário CNPJ/CPF'],
-            cnpj_empresa,
-            row.get('CFOP'),
-            retornar_alerta=True,
-        ),
-        axis=1,
-        result_type='expand',
-    )
-    df['Tipo Produto'] = df.apply(classificar_produto, axis=1)
+    with etapa("classificacao", entrada=df) as medida:
+        df[['Tipo Nota', 'Alerta Auditoria']] = df.apply(
+            lambda row: classificar_tipo_nota(
+                row['Emitente CNPJ/CPF'],
+                row['Destinatário CNPJ/CPF'],
+                cnpj_empresa,
+                row.get('CFOP'),
+                retornar_alerta=True,
+            ),
+            axis=1,
+            result_type='expand',
+        )
+        df['Tipo Produto'] = df.apply(classificar_produto, axis=1)
+
+        if 'Data Emissão' in df.columns:
+            df['Mês Emissão'] = pd.to_datetime(
+                df['Data Emissão'], errors='coerce'
+            ).dt.strftime('%m/%Y')
+        medida.saida(df)
 
-    if 'Data Emissão' in df.columns:
-        df['Mês Emissão'] = pd.to_datetime(
-            df['Data Emissão'], errors='coerce'
-        ).dt.strftime('%m/%Y')
-   
     # Aplicar configuração de layout e tipagem
-    df = configurar_planilha(df)
+    with etapa("configurar_planilha", entrada=df) as medida:
+        df = medida.saida(configurar_planilha(df))
 
     # Estatísticas para validação
     veiculos = df[df['Tipo Produto'] == 'Veículo'].shape[0]
@@ -745,92 +1192,15 @@ def exportar_para_excel(df: pd.DataFrame, caminho_saida: str) -> bool:
         return False
     
     try:
-        # Importar apenas se necessário
-        import xlsxwriter
-        
         log.info(f"Exportando dados para Excel: {caminho_saida}")
-        
-        # Criar diretório de saída se não existir
-        diretorio_saida = os.path.dirname(caminho_saida)
-        if diretorio_saida and not os.path.exists(diretorio_saida):
-            os.makedirs(diretorio_saida)
-        
-        # Configurar o writer com opções
-        writer = pd.ExcelWriter(
-            caminho_saida,
-            engine='xlsxwriter',
-            engine_kwargs={'options': {'strings_to_numbers': True}}
-        )
-        
-        # Exportar DataFrame
-        df.to_excel(writer, sheet_name='Dados Extraídos', index=False)
-        
-        # Acessar o workbook e a planilha
-        workbook = writer.book
-        worksheet = writer.sheets['Dados Extraídos']
-        
-        # Definir formatos
-        formato_cabecalho = workbook.add_format({
-            'bold': True,
-            'text_wrap': True,
-            'valign': 'top',
-            'fg_color': '#D7E4BC',
-            'border': 1
-        })
-        
-        formato_veiculo = workbook.add_format({
-            'bg_color': '#E0F7FA',
-            'valign': 'top'
-        })
-        
-        
-        formato_numero = workbook.add_format({
-            'num_format': '#,##0.00',
-            'valign': 'top'
-        })
-        
-        formato_data = workbook.add_format({
-            'num_format': 'dd/mm/yyyy',
-            'valign': 'top'
-        })
-        
-        # Aplicar formato ao cabeçalho
-        for col_num, value in enumerate(df.columns.values):
-            worksheet.write(0, col_num, value, formato_cabecalho)
-        
-        # Definir a largura das colunas baseada no conteúdo
-        for i, coluna in enumerate(df.columns):
-            max_len = max(
-                df[coluna].astype(str).apply(len).max(),
-                len(str(coluna))
+        with etapa(f"exportacao {os.path.basename(caminho_saida)}", entrada=df):
+            escrever_excel(
+                df,
+                caminho_saida,
+                'Dados Extraídos',
+                strings_to_numbers=True,
+                layout=LAYOUT_COLUNAS,
             )
-            worksheet.set_column(i, i, max_len + 2)
-        
-        # Aplicar formatação condicional para veículos se a coluna existir
-        if 'Tipo Produto' in df.columns:
-            from xlsxwriter.utility import xl_col_to_name
-            col_idx = df.columns.get_loc('Tipo Produto')
-            col_letter = xl_col_to_name(col_idx)
-            worksheet.conditional_format(
-                1,
-                0,
-                len(df) + 1,
-                len(df.columns) - 1,
-                {
-                    'type': 'formula',
-                    'criteria': f'=${col_letter}2="Veículo"',
-                    'format': formato_veiculo,
-                },
-            )
-        
-        # Configurar filtros
-        worksheet.autofilter(0, 0, len(df), len(df.columns) - 1)
-        
-        # Congelar primeira linha
-        worksheet.freeze_panes(1, 0)
-        
-        # Fechar o writer e salvar o arquivo
-        writer.close()
         log.info(f"Arquivo Excel salvo com sucesso: {caminho_saida}")
         return True
         
@@ -840,9 +1210,77 @@ def exportar_para_excel(df: pd.DataFrame, caminho_saida: str) -> bool:
         log.error(traceback.format_exc())
         return False
 
+def _caminho_com_formato(caminho: str, formato: str, sufixo: str = "") -> str:
+    """Troca a extensão de ``caminho`` pela do ``formato`` e aplica ``sufixo``."""
+    base = caminho
+    for ext in FORMATOS_EXPORTACAO:
+        if base.lower().endswith(f".{ext}"):
+            base = base[: -len(ext) - 1]
+            break
+    return f"{base}{sufixo}.{formato}"
+
+def exportar_resultado(
+    df: pd.DataFrame, caminho_saida: str, formato: str = "xlsx"
+) -> bool:
+    """Exporta as notas extraídas em ``xlsx``, ``parquet`` ou ``csv.gz``."""
+    if formato == "xlsx":
+        return exportar_para_excel(df, caminho_saida)
+    if df.empty:
+        log.error(f"DataFrame vazio, não é possível exportar para {formato}")
+        return False
+    try:
+        log.info(f"Exportando dados para {formato}: {caminho_saida}")
+        with etapa(f"exportacao {os.path.basename(caminho_saida)}", entrada=df):
+            exportar_dados(df, caminho_saida, formato, layout=LAYOUT_COLUNAS)
+        log.info(f"Arquivo salvo com sucesso: {caminho_saida}")
+        return True
+    except Exception as e:
+        log.error(f"Erro ao exportar para {formato}: {e}")
+        return False
+
+def exportar_relatorios(
+    df: pd.DataFrame,
+    caminho_saida: str,
+    formato: str = "xlsx",
+    canceladas: Optional[Set[str]] = None,
+) -> List[str]:
+    """Gera estoque, resumo mensal e apuração ao lado de ``caminho_saida``.
+
+    Notas com a chave de acesso em ``canceladas`` ficam fora do estoque.
+    Retorna os caminhos dos arquivos gravados.
+    """
+    from modules.transformadores_veiculos import gerar_estoque_fiscal, gerar_resumo_mensal
+    from modules.apuracao_fiscal import calcular_apuracao
+
+    df_entrada = df[df["Tipo Nota"] == "Entrada"]
+    df_saida = df[df["Tipo Nota"] == "Saída"]
+    with etapa("gerar_estoque_fiscal", entrada=df) as medida:
+        df_estoque = medida.saida(gerar_estoque_fiscal(df_entrada, df_saida, canceladas))
+    with etapa("apuracao", entrada=df_estoque) as medida:
+        df_apuracao, _ = calcular_apuracao(df_estoque)
+        medida.saida(df_apuracao)
+    with etapa("resumo_mensal", entrada=df_estoque) as medida:
+        df_resumo = medida.saida(gerar_resumo_mensal(df_estoque))
+    relatorios = {
+        "_estoque": df_estoque.drop(columns=["_merge"], errors="ignore"),
+        "_resumo_mensal": df_resumo,
+        "_apuracao": df_apuracao,
+    }
+    gerados = []
+    for sufixo, df_relatorio in relatorios.items():
+        caminho = _caminho_com_formato(caminho_saida, formato, sufixo)
+        with etapa(f"exportacao {os.path.basename(caminho)}", entrada=df_relatorio):
+            exportar_dados(df_relatorio, caminho, formato, layout=LAYOUT_COLUNAS)
+        log.info(f"Relatório salvo: {caminho}")
+        gerados.append(caminho)
+    return gerados
+
 # Exemplo de uso
 if __name__ == "__main__":
     import argparse
+    from contextlib import nullcontext
+
+    from utils.perfil_utils import perfilar
     logging.basicConfig(
         level=logging.INFO,
         format="%(asctime)s - %(levelname)s: %(message)s",
@@ -853,8 +1291,26 @@ if __name__ == "__main__":
     parser.add_argument("--dir", type=str, help="Diretório contendo arquivos XML")
     parser.add_argument("--xml", type=str, nargs="+", help="Caminhos de arquivos XML específicos")
     parser.add_argument("--cnpj", type=str, required=True, help="CNPJ da empresa para classificação da nota")
-    parser.add_argument("--saida", type=str, default="resultado_extracao.xlsx", help="Caminho do arquivo de saída Excel")
+    parser.add_argument("--saida", type=str, default="resultado_extracao.xlsx", help="Caminho do arquivo de saída")
+    parser.add_argument("--formato", choices=list(FORMATOS_EXPORTACAO), default="xlsx", help="Formato do arquivo de saída")
+    parser.add_argument("--relatorios", action="store_true", help="Gerar também estoque, resumo mensal e apuração")
     parser.add_argument("--debug", action="store_true", help="Ativar modo debug (logs detalhados)")
+    parser.add_argument(
+        "--metricas",
+        type=str,
+        help="Grava tempo, linhas e memória por etapa (.prom/.txt: Prometheus; demais: JSON)",
+    )
+    parser.add_argument(
+        "--perfil", "--profile", dest="perfil", action="store_true",
+        help="Grava um perfil de CPU (cProfile) da execução; a extração roda em série",
+    )
+    parser.add_argument(
+        "--rastrear-memoria", "--trace-memory", dest="rastrear_memoria", action="store_true",
+        help="Grava um snapshot do tracemalloc com os maiores pontos de alocação",
+    )
+    parser.add_argument(
+        "--perfil-dir", default="perfil", help="Pasta dos artefatos de --perfil e --rastrear-memoria"
+    )
     
     args = parser.parse_args()
     
@@ -879,12 +1335,38 @@ if __name__ == "__main__":
         parser.print_help()
         exit(1)
     
-    # Processar XMLs
-    df = processar_xmls(xml_paths, args.cnpj)
-    
-    # Exportar resultado
-    if not df.empty:
-        log.info(f"Processamento concluído com {len(df)} registros extraídos")
-        exportar_para_excel(df, args.saida)
-    else:
-        log.error("Nenhum dado extraído dos XMLs")
+    perfilando = args.perfil or args.rastrear_memoria
+    contexto_perfil = (
+        perfilar(args.perfil_dir, cpu=args.perfil, memoria=args.rastrear_memoria)
+        if perfilando
+        else nullcontext()
+    )
+    # Chaves das notas canceladas por eventos, excluídas do estoque dos relatórios
+    canceladas: Set[str] = set()
+    with contexto_perfil as perfil, coletar_metricas() as medidor:
+        # Processar XMLs (o cProfile só acompanha a thread principal)
+        df = processar_xmls(
+            xml_paths,
+            args.cnpj,
+            canceladas=canceladas,
+            executor="serial" if args.perfil else "auto",
+        )
+
+        # Exportar resultado
+        if not df.empty:
+            log.info(f"Processamento concluído com {len(df)} registros extraídos")
+            saida = _caminho_com_formato(args.saida, args.formato)
+            exportar_resultado(df, saida, args.formato)
+            if args.relatorios:
+                exportar_relatorios(df, saida, args.formato, canceladas)
+        else:
+            log.error("Nenhum dado extraído dos XMLs")
+
+    if args.metricas:
+        medidor.salvar(args.metricas)
+        log.info(f"Métricas salvas: {args.metricas}")
+    if perfilando:
+        for resumo in (perfil.cpu, perfil.memoria):
+            if resumo:
+                log.info("\n%s", resumo)
+        log.info(f"Artefatos de perfil: {', '.join(perfil.arquivos)}")
@@ -0,0 +1,398 @@
+"""Pipeline Drive → ZIP → XML → DataFrame com etapas sobrepostas.
+
+O download do ZIP, a extração dos membros e o parse das notas rodam ao
+mesmo tempo, ligados por filas limitadas:
+
+* uma thread baixa o ZIP em blocos e os entrega a um :class:`FluxoBlocos`;
+* outra percorre os cabeçalhos locais do ZIP à medida que os bytes chegam,
+  grava cada XML em disco e o coloca na fila de parse;
+* a thread chamadora distribui os XMLs entre os workers de extração.
+
+Filas cheias bloqueiam a etapa anterior, de modo que a memória usada fica
+limitada mesmo para ZIPs grandes.
+"""
+
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import zipfile
+from collections import Counter
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union
+
+import pandas as pd
+
+from modules import estoque_veiculos
+from modules.estoque_veiculos import (
+    consolidar_registros,
+    extrair_dados_conteudo,
+    processar_xmls,
+    resumo_contadores,
+)
+from utils import cache_drive
+from utils.arquivos_utils import (
+    FluxoBlocos,
+    ZipNaoSequencial,
+    caminho_seguro,
+    iterar_zip_em_fluxo,
+)
+from utils.quarentena_xml import Quarentena, quarentena_padrao, resumo_conteudo
+from utils.triagem_xml import (
+    BYTES_TRIAGEM,
+    TIPO_EVENTO,
+    TIPO_OUTRO,
+    chave_cancelada,
+    triar_conteudo,
+)
+from utils.drive_utils import (
+    baixar_arquivo,
+    parametros_validacao,
+    selecionar_zip_empresa,
+)
+
+log = logging.getLogger(__name__)
+
+# Blocos menores que o padrão do download para entregar os primeiros XMLs cedo
+TAMANHO_BLOCO_PIPELINE = 4 * 1024 * 1024
+BLOCOS_EM_FILA = 8
+_FIM = object()
+
+
+def _extrair_membro(
+    conteudo: bytes, caminho: str
+) -> Tuple[List[Dict[str, Any]], List[str], Dict[str, list], Counter]:
+    """Executado nos workers: devolve registros, erros, quarentena e contadores do XML.
+
+    A consulta à quarentena já foi feita pela thread de extração; aqui só
+    se registra uma eventual falha de parse.
+    """
+    erros: List[str] = []
+    quarentena = Quarentena()
+    contadores: Counter = Counter()
+    registros = extrair_dados_conteudo(conteudo, caminho, erros, quarentena, contadores)
+    return registros, erros, quarentena.novas(), contadores
+
+
+def _colocar(fila: "queue.Queue", item, cancelado: threading.Event) -> None:
+    while not cancelado.is_set():
+        try:
+            fila.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+    raise InterruptedError("Pipeline cancelado")
+
+
+def _criar_executor(max_workers: int, usar_processos: Optional[bool]) -> Executor:
+    """Workers de extração, criados antes das threads de download e do ZIP.
+
+    Sem ``usar_processos``, usa threads com o lxml (que libera o GIL durante
+    o parse, sem enviar o conteúdo de cada XML a outro processo) e processos
+    com o ``xml.etree``. Os processos partem de ``forkserver`` ou ``spawn``:
+    um ``fork`` copiaria travas mantidas pelas threads do pipeline.
+    """
+    if usar_processos is None:
+        usar_processos = estoque_veiculos.BACKEND_XML != "lxml"
+    if usar_processos:
+        metodo = (
+            "forkserver"
+            if "forkserver" in multiprocessing.get_all_start_methods()
+            else "spawn"
+        )
+        try:
+            return ProcessPoolExecutor(
+                max_workers=max_workers, mp_context=multiprocessing.get_context(metodo)
+            )
+        except (OSError, ValueError) as e:
+            log.warning(f"Processos indisponíveis ({e}); usando threads")
+    return ThreadPoolExecutor(max_workers=max_workers)
+
+
+def processar_zip_drive(
+    service,
+    arquivo: Dict[str, Any],
+    zip_path: str,
+    pasta_extraidos: str,
+    cnpj_empresa: Union[str, List[str]],
+    erros: Optional[List[str]] = None,
+    *,
+    max_workers: Optional[int] = None,
+    usar_processos: Optional[bool] = None,
+    tamanho_bloco: int = TAMANHO_BLOCO_PIPELINE,
+    progresso: Optional[Callable[[int], None]] = None,
+    duplicadas: Optional[List[str]] = None,
+    canceladas: Optional[Set[str]] = None,
+    quarentena: Optional[Quarentena] = None,
+) -> Tuple[List[str], pd.DataFrame]:
+    """Baixa ``arquivo`` (metadados do Drive) e processa seus XMLs em paralelo.
+
+    O ZIP é gravado em ``zip_path`` e os XMLs em ``pasta_extraidos`` conforme
+    são extraídos. Retorna a lista ordenada dos XMLs e o DataFrame
+    consolidado, equivalente ao de :func:`processar_xmls`. ``progresso(n)``
+    é chamado na thread chamadora a cada XML processado. Se o ZIP não puder
+    ser lido em fluxo, a extração continua pelo diretório central quando o
+    download termina. Os XMLs passam pela mesma triagem de
+    :func:`processar_xmls`: notas com chave de acesso repetida são gravadas
+    mas não processadas (um ``nfeProc`` prevalece sobre o ``NFe`` avulso) e
+    vão para ``duplicadas``; eventos de cancelamento alimentam
+    ``canceladas``; outros documentos são apenas gravados. Conteúdos em
+    ``quarentena`` também são só gravados, e novas falhas de parse entram nela.
+    ``usar_processos`` escolhe processos ou threads para o parse; o padrão
+    depende do backend XML (ver :func:`_criar_executor`).
+    """
+    max_workers = max_workers or min(multiprocessing.cpu_count(), 8)
+    if quarentena is None:
+        quarentena = quarentena_padrao()
+    os.makedirs(pasta_extraidos, exist_ok=True)
+    fluxo = FluxoBlocos(BLOCOS_EM_FILA)
+    fila_xmls: "queue.Queue" = queue.Queue(maxsize=max_workers * 4)
+    falhas: Dict[str, BaseException] = {}
+    download_concluido = threading.Event()
+    chaves: Dict[str, Tuple[str, bool]] = {}
+    descartados: List[str] = []
+    em_quarentena: List[str] = []
+
+    def _baixar() -> None:
+        try:
+            baixar_arquivo(
+                service,
+                arquivo["id"],
+                zip_path,
+                tamanho_bloco=tamanho_bloco,
+                ao_receber=fluxo.alimentar,
+                **parametros_validacao(arquivo),
+            )
+            fluxo.encerrar()
+        except BaseException as exc:
+            falhas["download"] = exc
+            fluxo.encerrar(exc)
+        finally:
+            download_concluido.set()
+
+    def _gravar(nome: str, conteudo: bytes) -> None:
+        if not nome.lower().endswith(".xml"):
+            return
+        caminho = caminho_seguro(pasta_extraidos, nome)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        with open(caminho, "wb") as f:
+            f.write(conteudo)
+        if not _deve_extrair(caminho, conteudo):
+            conteudo = None
+        _colocar(fila_xmls, (caminho, conteudo), fluxo.cancelado)
+
+    def _deve_extrair(caminho: str, conteudo: bytes) -> bool:
+        tipo, chave, autorizada = triar_conteudo(conteudo[:BYTES_TRIAGEM])
+        if tipo == TIPO_EVENTO:
+            cancelada = chave_cancelada(conteudo)
+            if cancelada and canceladas is not None:
+                canceladas.add(cancelada)
+            return False
+        if tipo == TIPO_OUTRO:
+            return False
+        motivo = quarentena.motivo(resumo_conteudo(conteudo))
+        if motivo is not None:
+            em_quarentena.append(f"Em quarentena: {caminho} -> {motivo}")
+            return False
+        if chave is None:
+            return True
+        anterior = chaves.get(chave)
+        if anterior is not None and (anterior[1] or not autorizada):
+            descartados.append(caminho)
+            return False
+        if anterior is not None:
+            descartados.append(anterior[0])
+        chaves[chave] = (caminho, autorizada)
+        return True
+
+    def _extrair() -> None:
+        vistos = set()
+        try:
+            try:
+                for nome, conteudo in iterar_zip_em_fluxo(fluxo):
+                    vistos.add(nome)
+                    _gravar(nome, conteudo)
+                # O diretório central ainda precisa chegar para validar o download
+                fluxo.descartar_restante()
+            except ZipNaoSequencial as exc:
+                log.info(f"ZIP não pode ser lido em fluxo ({exc}); aguardando o download")
+                fluxo.descartar_restante()
+                download_concluido.wait()
+                with zipfile.ZipFile(zip_path) as zf:
+                    for nome in zf.namelist():
+                        if nome not in vistos and not nome.endswith("/"):
+                            _gravar(nome, zf.read(nome))
+        except BaseException as exc:
+            if "download" not in falhas:
+                falhas["extracao"] = exc
+            fluxo.cancelar()
+        finally:
+            try:
+                _colocar(fila_xmls, _FIM, fluxo.cancelado)
+            except InterruptedError:
+                pass
+
+    executor = _criar_executor(max_workers, usar_processos)
+    threads = [
+        threading.Thread(target=_baixar, name="pipeline-download", daemon=True),
+        threading.Thread(target=_extrair, name="pipeline-zip", daemon=True),
+    ]
+    for t in threads:
+        t.start()
+
+    xml_paths: List[str] = []
+    todos_registros: List[Dict[str, Any]] = []
+    contadores: Counter = Counter()
+    processados = 0
+
+    def _coletar(concluidos) -> None:
+        nonlocal processados
+        for futuro in concluidos:
+            registros, erros_xml, novas, parcial = futuro.result()
+            todos_registros.extend(registros)
+            quarentena.incluir(novas)
+            contadores.update(parcial)
+            if erros is not None:
+                erros.extend(erros_xml)
+            else:
+                for erro in erros_xml:
+                    log.warning(erro)
+            processados += 1
+            if progresso is not None:
+                progresso(processados)
+
+    pendentes = set()
+    try:
+        while True:
+            try:
+                item = fila_xmls.get(timeout=0.1)
+            except queue.Empty:
+                if fluxo.cancelado.is_set():
+                    break
+                continue
+            if item is _FIM:
+                break
+            caminho, conteudo = item
+            xml_paths.append(caminho)
+            if conteudo is None:
+                continue
+            pendentes.add(executor.submit(_extrair_membro, conteudo, caminho))
+            if len(pendentes) >= max_workers * 2:
+                concluidos, pendentes = wait(pendentes, return_when=FIRST_COMPLETED)
+                _coletar(concluidos)
+        _coletar(wait(pendentes).done)
+    except BaseException:
+        fluxo.cancelar()
+        raise
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        for t in threads:
+            t.join()
+
+    # Um erro na extração cancela o download; a causa original tem prioridade
+    if "extracao" in falhas:
+        raise falhas["extracao"]
+    if "download" in falhas:
+        raise falhas["download"]
+
+    if em_quarentena:
+        if erros is not None:
+            erros.extend(em_quarentena)
+        else:
+            for erro in em_quarentena:
+                log.warning(erro)
+    try:
+        quarentena.salvar()
+    except OSError as e:
+        log.warning(f"Não foi possível gravar a quarentena: {e}")
+
+    if descartados:
+        ignorados = set(descartados)
+        todos_registros = [r for r in todos_registros if r.get("XML Path") not in ignorados]
+        log.info(f"{len(descartados)} XMLs ignorados por chave de acesso repetida")
+        if duplicadas is not None:
+            duplicadas.extend(descartados)
+    log.info(resumo_contadores(contadores))
+    log.info(f"Pipeline concluído: {len(xml_paths)} XMLs de {arquivo['name']}")
+    todos_registros.sort(key=lambda r: (r.get("XML Path") or "", r.get("Item") or 0))
+    return sorted(xml_paths), consolidar_registros(todos_registros, cnpj_empresa)
+
+
+def processar_zip_empresa_drive(
+    service,
+    pasta_principal_id: str,
+    nome_empresa: str,
+    destino: str,
+    cnpj_empresa: Union[str, List[str]],
+    erros: Optional[List[str]] = None,
+    usar_cache: bool = True,
+    duplicadas: Optional[List[str]] = None,
+    canceladas: Optional[Set[str]] = None,
+    quarentena: Optional[Quarentena] = None,
+    **opcoes,
+) -> Tuple[List[str], pd.DataFrame]:
+    """Busca o ZIP da empresa e devolve ``(xml_paths, DataFrame)`` em uma só etapa.
+
+    Os XMLs ficam em ``destino/<nome do ZIP sem extensão>``. Com o ZIP
+    inalterado no cache local (ativo por padrão), apenas os XMLs em cache
+    são vinculados em ``destino`` e processados; caso contrário o download,
+    a extração e o parse são sobrepostos por :func:`processar_zip_drive`.
+    """
+    alvo = selecionar_zip_empresa(service, pasta_principal_id, nome_empresa)
+    if alvo is None:
+        return [], pd.DataFrame()
+    log.info(f"Arquivo ZIP escolhido: {alvo['name']} (id={alvo['id']})")
+
+    pasta_xmls = os.path.join(destino, Path(alvo["name"]).stem)
+    pasta_cache = cache_drive.diretorio_cache() if usar_cache else None
+    if pasta_cache and cache_drive.cacheavel(alvo):
+        xmls = cache_drive.obter_xmls(pasta_cache, alvo, pasta_xmls)
+        if xmls is not None:
+            df = (
+                processar_xmls(
+                    xmls, cnpj_empresa, erros, duplicadas, canceladas, quarentena=quarentena
+                )
+                if xmls
+                else pd.DataFrame()
+            )
+        else:
+            resultado: Dict[str, pd.DataFrame] = {}
+
+            def _preencher(zip_path: str, pasta_extraidos: str) -> None:
+                _, resultado["df"] = processar_zip_drive(
+                    service, alvo, zip_path, pasta_extraidos, cnpj_empresa, erros,
+                    duplicadas=duplicadas, canceladas=canceladas, quarentena=quarentena,
+                    **opcoes
+                )
+
+            xmls = cache_drive.armazenar(pasta_cache, alvo, _preencher, destino=pasta_xmls)
+            df = resultado["df"]
+    else:
+        os.makedirs(destino, exist_ok=True)
+        xmls, df = processar_zip_drive(
+            service,
+            alvo,
+            os.path.join(destino, alvo["name"]),
+            pasta_xmls,
+            cnpj_empresa,
+            erros,
+            duplicadas=duplicadas,
+            canceladas=canceladas,
+            quarentena=quarentena,
+            **opcoes,
+        )
+
+    if not xmls:
+        log.error(f"Nenhum XML encontrado no ZIP de {nome_empresa}")
+        raise FileNotFoundError(f"Nenhum XML encontrado em {alvo['name']}")
+    return xmls, df
@@ -5,6 +5,8 @@ import re
 import os
 import json
 
+from utils.exportacao_utils import escrever_excel
+
 # Colunas finais do relatório
 COLUMNS = [
     "CPF/CNPJ", "Razão Social", "UF", "Município", "Endereço",
@@ -119,19 +121,16 @@ def _resolver_xml_path(row: pd.Series) -> Optional[str]:
             return path
     return None
 
-def gerar_relatorio_fiscal_excel(
+def montar_relatorio_fiscal(
     df_notas: pd.DataFrame,
-    caminho_saida: str,
     codigo_por_chassi: Optional[Dict[str, str]] = None,
 ) -> pd.DataFrame:
-    """Gera planilha de apuração fiscal a partir de notas de veículos.
+    """Calcula as colunas do relatório fiscal sem gravar arquivo.
 
     Parameters
     ----------
     df_notas : pd.DataFrame
         DataFrame com as informações das notas fiscais.
-    caminho_saida : str
-        Caminho do arquivo ``.xlsx`` a ser gerado.
     codigo_por_chassi : Optional[Dict[str, str]], optional
         Mapeamento do chassi do veículo para o código da nota de entrada.
         Se fornecido e existir a coluna ``Chassi`` no DataFrame, o campo
@@ -223,7 +222,33 @@ def gerar_relatorio_fiscal_excel(
             df[col] = None
     df = df[COLUMNS]
 
+    return df
+
+
+def gerar_relatorio_fiscal_excel(
+    df_notas: pd.DataFrame,
+    caminho_saida: str,
+    codigo_por_chassi: Optional[Dict[str, str]] = None,
+) -> pd.DataFrame:
+    """Gera planilha de apuração fiscal a partir de notas de veículos.
+
+    Parameters
+    ----------
+    df_notas : pd.DataFrame
+        DataFrame com as informações das notas fiscais.
+    caminho_saida : str
+        Caminho do arquivo ``.xlsx`` a ser gerado.
+    codigo_por_chassi : Optional[Dict[str, str]], optional
+        Repassado para :func:`montar_relatorio_fiscal`.
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame resultante com as colunas calculadas e ordenadas.
+    """
+    df = montar_relatorio_fiscal(df_notas, codigo_por_chassi)
+
     # Exportar para Excel
-    df.to_excel(caminho_saida, index=False)
+    escrever_excel(df, caminho_saida)
 
     return df
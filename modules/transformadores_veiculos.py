@@ -14,9 +14,24 @@ def _limpar_chave(valor: str) -> str:
     return re.sub(r"\W", "", str(valor)).upper()
 
 
-def gerar_estoque_fiscal(df_entrada, df_saida):
-    df_entrada = df_entrada.copy()
-    df_saida = df_saida.copy()
+def _sem_canceladas(df, canceladas):
+    """Remove as linhas cuja ``CHAVE XML`` pertence a uma nota cancelada."""
+    if not canceladas or 'CHAVE XML' not in df.columns:
+        return df
+    canceladas_mask = df['CHAVE XML'].astype(str).str[-44:].isin(canceladas)
+    if canceladas_mask.any():
+        log.info(f"Ignoradas {int(canceladas_mask.sum())} linhas de notas canceladas")
+    return df[~canceladas_mask]
+
+
+def gerar_estoque_fiscal(df_entrada, df_saida, canceladas=None):
+    """Cruza entradas e saídas de veículos pelo chassi (ou placa).
+
+    ``canceladas`` é um conjunto de chaves de acesso (44 dígitos) de notas
+    canceladas, que são desconsideradas dos dois lados.
+    """
+    df_entrada = _sem_canceladas(df_entrada, canceladas).copy()
+    df_saida = _sem_canceladas(df_saida, canceladas).copy()
 
     if 'Tipo Produto' in df_entrada.columns:
         df_entrada = df_entrada[df_entrada['Tipo Produto'] == 'Veículo']
@@ -4,7 +4,9 @@ from __future__ import annotations
 
 import io
 import json
+import os
 import tempfile
+from contextlib import contextmanager
 from pathlib import Path
 import zipfile
 import logging
@@ -12,27 +14,48 @@ import logging
 import pandas as pd
 import streamlit as st
 
-from modules.estoque_veiculos import processar_xmls
+from modules.estoque_veiculos import LAYOUT_COLUNAS, processar_xmls
 from modules.configurador_planilha import configurar_planilha
 from utils.validacao_utils import validar_campos_obrigatorios
+from utils.interface_utils import conteudo_sob_demanda
+from utils.arquivos_utils import copiar_em_blocos, extrair_zip_em_blocos
+from utils.quarentena_xml import quarentena_padrao
+from utils.metricas_utils import MedidorEtapas, coletar_metricas, etapa
+from utils.perfil_utils import perfilar
 from modules.transformadores_veiculos import (
     gerar_alertas_auditoria,
     gerar_estoque_fiscal,
     gerar_kpis,
     gerar_resumo_mensal,
 )
-from modules.relatorio_fiscal_excel import gerar_relatorio_fiscal_excel
+from modules.relatorio_fiscal_excel import (
+    gerar_relatorio_fiscal_excel,
+    montar_relatorio_fiscal,
+)
+from modules.apuracao_fiscal import calcular_apuracao
+from modules.pipeline_drive import processar_zip_empresa_drive
+from utils.exportacao_utils import (
+    FORMATOS_EXPORTACAO,
+    excel_bytes,
+    exportar_bytes,
+    workbook_bytes,
+)
 from utils.google_drive_utils import (
     ROOT_FOLDER_ID,
     baixar_xmls_empresa_zip,
     criar_servico_drive,
+    sincronizar_empresa_incremental,
 )
+from utils.drive_utils import DownloadIncompleto
 from googleapiclient.errors import HttpError
 
 
 # Configuração de logging
 log = logging.getLogger(__name__)
 
+# Extração de ZIPs enviados é limitada por disco, não por CPU
+WORKERS_EXTRACAO_UPLOAD = min(8, (os.cpu_count() or 1) * 2)
+
 # ---------------------------------------------------------------------------
 # Estado da aplicação
 # ---------------------------------------------------------------------------
@@ -44,15 +67,22 @@ def _init_session() -> None:
         "df_estoque": pd.DataFrame(),
         "df_alertas": pd.DataFrame(),
         "df_resumo": pd.DataFrame(),
+        "df_apuracao": pd.DataFrame(),
         "kpis": {},
         "xml_paths": [],
         "cnpj_empresa": "",
         "erros_xml": [],
         "download_dir": "",
         "upload_dir": "",
+        "uploads_armazenados": {},
+        "notas_canceladas": set(),
+        "metricas": MedidorEtapas(),
+        "perfil": None,
     }
     for chave, valor in defaults.items():
         st.session_state.setdefault(chave, valor)
+    if "quarentena" not in st.session_state:
+        st.session_state.quarentena = quarentena_padrao()
 
 
 # ---------------------------------------------------------------------------
@@ -80,31 +110,71 @@ def _carregar_empresas() -> dict[str, str]:
 # Processamento de dados
 # ---------------------------------------------------------------------------
 
+def _armazenar_upload(f, upload_dir: Path) -> tuple[dict[str, str], int]:
+    """Grava um upload em blocos e, se for ZIP, extrai seus XMLs em paralelo.
+
+    Cada upload ocupa uma subpasta própria de ``upload_dir``: um membro com o
+    mesmo nome em outro ZIP não sobrescreve os arquivos já registrados na
+    sessão. Retorna ``{sha256: caminho}`` dos XMLs com conteúdo distinto, na
+    ordem de chegada, e quantos membros repetidos foram descartados.
+    """
+    upload_dir = Path(tempfile.mkdtemp(prefix="arquivo_", dir=upload_dir))
+    dest = upload_dir / f.name
+    f.seek(0)
+    resumo = copiar_em_blocos(f, str(dest))
+    if not f.name.lower().endswith(".zip"):
+        return {resumo: str(dest)}, 0
+
+    vistos: dict[str, str] = {}
+    barra = st.progress(0.0, text=f"Extraindo {f.name}")
+    try:
+        _, duplicados = extrair_zip_em_blocos(
+            str(dest),
+            str(upload_dir),
+            max_workers=WORKERS_EXTRACAO_UPLOAD,
+            vistos=vistos,
+            progresso=lambda feitos, total: barra.progress(
+                feitos / total, text=f"Extraindo {f.name}: {feitos}/{total}"
+            ),
+        )
+    except zipfile.BadZipFile as exc:  # pragma: no cover - apenas log
+        st.error(f"Erro ao extrair {f.name}: {exc}")
+        return {}, 0
+    finally:
+        barra.empty()
+    return vistos, duplicados
+
+
 def _upload_manual(files) -> list[str]:
-    """Armazena arquivos enviados manualmente e extrai ZIPs."""
-    upload_dir = Path(st.session_state.get("upload_dir", tempfile.mkdtemp(prefix="upload_")))
+    """Armazena arquivos enviados manualmente e extrai ZIPs.
+
+    Uploads e membros de ZIP são copiados em blocos, sem ficar inteiros em
+    memória. Cada upload é gravado uma única vez por sessão (as reexecuções
+    do Streamlit reaproveitam o resultado) e XMLs com conteúdo idêntico são
+    considerados apenas uma vez.
+    """
+    upload_dir = Path(st.session_state.get("upload_dir") or tempfile.mkdtemp(prefix="upload_"))
     upload_dir.mkdir(parents=True, exist_ok=True)
     st.session_state.upload_dir = str(upload_dir)
+    armazenados = st.session_state.setdefault("uploads_armazenados", {})
 
     paths: list[str] = []
+    vistos: set[str] = set()
+    duplicados = 0
     for f in files:
-        dest = upload_dir / f.name
-        with open(dest, "wb") as out:
-            out.write(f.read())
-        if f.name.lower().endswith(".zip"):
-            try:
-                with zipfile.ZipFile(dest, "r") as zf:
-                    for name in zf.namelist():
-                        if name.lower().endswith(".xml"):
-                            extracted = upload_dir / name
-                            extracted.parent.mkdir(parents=True, exist_ok=True)
-                            with open(extracted, "wb") as out_f:
-                                out_f.write(zf.read(name))
-                            paths.append(str(extracted))
-            except zipfile.BadZipFile as exc:  # pragma: no cover - apenas log
-                st.error(f"Erro ao extrair {f.name}: {exc}")
-        else:
-            paths.append(str(dest))
+        chave = getattr(f, "file_id", None) or f"{f.name}:{f.size}"
+        if chave not in armazenados:
+            armazenados[chave] = _armazenar_upload(f, upload_dir)
+        arquivos, repetidos = armazenados[chave]
+        duplicados += repetidos
+        for resumo, caminho in arquivos.items():
+            if resumo in vistos:
+                duplicados += 1
+                continue
+            vistos.add(resumo)
+            paths.append(caminho)
+    if duplicados:
+        st.info(f"{duplicados} XML(s) com conteúdo repetido ignorado(s)")
     return paths
 
 
@@ -112,23 +182,194 @@ def _upload_manual(files) -> list[str]:
 # Processamento de dados
 # ---------------------------------------------------------------------------
 
+def _finalizar_processamento(df: pd.DataFrame) -> pd.DataFrame:
+    with etapa("configurar_planilha", entrada=df) as medida:
+        df = medida.saida(configurar_planilha(df))
+    with etapa("validar_campos_obrigatorios", entrada=df):
+        validar_campos_obrigatorios(df)
+    return df
+
+
+@contextmanager
+def _perfil_opcional():
+    """Perfila o bloco se ativado em "Diagnóstico" na barra lateral."""
+    cpu = st.session_state.get("perfil_cpu", False)
+    memoria = st.session_state.get("perfil_memoria", False)
+    if not (cpu or memoria):
+        yield
+        return
+    with perfilar(tempfile.mkdtemp(prefix="perfil_"), cpu=cpu, memoria=memoria) as resultado:
+        yield
+    st.session_state.perfil = resultado
+
+
+def _novas_metricas() -> MedidorEtapas:
+    """Substitui as métricas da sessão pelas de um novo processamento."""
+    st.session_state.metricas = MedidorEtapas()
+    return st.session_state.metricas
+
+
 def _processar_arquivos(
-    xml_paths: list[str], cnpj_empresa: str, erros: list[str] | None = None
+    xml_paths: list[str],
+    cnpj_empresa: str,
+    erros: list[str] | None = None,
+    duplicadas: list[str] | None = None,
+    canceladas: set[str] | None = None,
 ) -> pd.DataFrame:
     if not xml_paths:
         return pd.DataFrame()
-    df = processar_xmls(xml_paths, cnpj_empresa, erros=erros)
-    df = configurar_planilha(df)
-    validar_campos_obrigatorios(df)
-    return df
+    df = processar_xmls(
+        xml_paths,
+        cnpj_empresa,
+        erros=erros,
+        duplicadas=duplicadas,
+        canceladas=canceladas,
+        quarentena=st.session_state.quarentena,
+        # O cProfile só acompanha a thread do script
+        executor="serial" if st.session_state.get("perfil_cpu") else "auto",
+    )
+    return _finalizar_processamento(df)
+
+
+def _informar_duplicadas(duplicadas: list[str]) -> None:
+    if duplicadas:
+        st.info(f"{len(duplicadas)} XML(s) ignorado(s) por chave de acesso repetida")
+
+
+def _mostrar_quarentena() -> None:
+    """Lista os XMLs em quarentena e permite reverificá-los."""
+    quarentena = st.session_state.quarentena
+    linhas = quarentena.relatorio()
+    if not linhas:
+        return
+    with st.expander(f"XMLs em quarentena ({len(linhas)})"):
+        st.caption(
+            "Falharam no parse e são ignorados enquanto o conteúdo não mudar."
+        )
+        st.dataframe(pd.DataFrame(linhas))
+        if st.button("Reverificar na próxima execução"):
+            quarentena.liberar()
+            quarentena.salvar()
+            st.success(f"{len(linhas)} XML(s) liberado(s) da quarentena")
+
+
+def _mostrar_desempenho() -> None:
+    """Tempo, linhas e memória de cada etapa do último processamento."""
+    medidor = st.session_state.metricas
+    if not medidor.etapas:
+        return
+    with st.expander("Desempenho"):
+        st.dataframe(pd.DataFrame(medidor.tabela()))
+        if medidor.contadores:
+            st.caption(
+                ", ".join(f"{nome}: {total}" for nome, total in sorted(medidor.contadores.items()))
+            )
+        col_json, col_prom = st.columns(2)
+        col_json.download_button(
+            "Baixar métricas (JSON)",
+            data=medidor.para_json(),
+            file_name="metricas.json",
+            mime="application/json",
+        )
+        col_prom.download_button(
+            "Baixar métricas (Prometheus)",
+            data=medidor.para_prometheus(),
+            file_name="metricas.prom",
+            mime="text/plain",
+        )
+
+
+def _mostrar_perfil() -> None:
+    """Resumos e artefatos do último processamento perfilado."""
+    resultado = st.session_state.perfil
+    if resultado is None:
+        return
+    with st.expander("Perfil do último processamento"):
+        if resultado.cpu:
+            st.text("CPU (cProfile)")
+            st.code(resultado.cpu)
+        if resultado.memoria:
+            st.text("Memória (tracemalloc)")
+            st.code(resultado.memoria)
+        for caminho in resultado.arquivos:
+            if not os.path.exists(caminho):
+                continue
+            with open(caminho, "rb") as f:
+                st.download_button(
+                    f"Baixar {os.path.basename(caminho)}",
+                    data=f.read(),
+                    file_name=os.path.basename(caminho),
+                    key=f"perfil_{os.path.basename(caminho)}",
+                )
 
 
 def _executar_pipeline(xml_paths: list[str], cnpj_empresa: str) -> None:
     st.session_state["erros_xml"] = []
-    df_config = _processar_arquivos(
-        xml_paths, cnpj_empresa, st.session_state["erros_xml"]
+    duplicadas: list[str] = []
+    canceladas: set[str] = set()
+    with coletar_metricas(_novas_metricas()), _perfil_opcional():
+        df_config = _processar_arquivos(
+            xml_paths, cnpj_empresa, st.session_state["erros_xml"], duplicadas, canceladas
+        )
+        _informar_duplicadas(duplicadas)
+        _publicar_resultados(df_config, canceladas)
+
+
+def _executar_pipeline_drive(service, empresa: str, cnpj_empresa: str, destino: str) -> list[str]:
+    """Baixa, extrai e processa o ZIP da empresa com as etapas sobrepostas."""
+    st.session_state["erros_xml"] = []
+    aviso = st.empty()
+    duplicadas: list[str] = []
+    canceladas: set[str] = set()
+    with coletar_metricas(_novas_metricas()), _perfil_opcional():
+        with etapa("pipeline_drive") as medida:
+            xml_paths, df = processar_zip_empresa_drive(
+                service,
+                ROOT_FOLDER_ID,
+                empresa,
+                destino,
+                cnpj_empresa,
+                st.session_state["erros_xml"],
+                duplicadas=duplicadas,
+                canceladas=canceladas,
+                quarentena=st.session_state.quarentena,
+                progresso=lambda n: aviso.caption(f"{n} XMLs processados"),
+            )
+            medida.saida(df)
+        aviso.empty()
+        _informar_duplicadas(duplicadas)
+        _publicar_resultados(_finalizar_processamento(df), canceladas)
+    return xml_paths
+
+
+def _sincronizar_incremental(service, empresa: str, destino: str) -> list[str]:
+    """Baixa apenas os XMLs novos ou alterados segundo o índice da empresa.
+
+    Apenas lê o ``index_arquivos.json``: o painel usa credenciais somente
+    leitura, e a regravação do índice fica com a sincronização noturna.
+    """
+    resultado = sincronizar_empresa_incremental(
+        service,
+        ROOT_FOLDER_ID,
+        empresa,
+        fabrica_servico=criar_servico_drive,
+        destino=destino,
     )
+    st.caption(
+        f"{len(resultado['baixados'])} XMLs baixados, "
+        f"{len(resultado['removidos'])} removidos, "
+        f"{len(resultado['xmls'])} no total"
+    )
+    for erro in resultado["erros"]:
+        st.warning(f"Falha ao baixar {erro}")
+    return resultado["xmls"]
+
+
+def _publicar_resultados(
+    df_config: pd.DataFrame, canceladas: set[str] | None = None
+) -> None:
     st.session_state.df_configurado = df_config
+    st.session_state.notas_canceladas = canceladas or set()
     
     if df_config.empty:
         st.session_state.processado = False
@@ -138,14 +379,22 @@ def _executar_pipeline(xml_paths: list[str], cnpj_empresa: str) -> None:
     df_entrada = df_config[df_config["Tipo Nota"] == "Entrada"].copy()
     df_saida = df_config[df_config["Tipo Nota"] == "Saída"].copy()
 
-    df_estoque = gerar_estoque_fiscal(df_entrada, df_saida)
-    df_alertas = gerar_alertas_auditoria(df_entrada, df_saida)
-    df_resumo = gerar_resumo_mensal(df_estoque)
-    kpis = gerar_kpis(df_estoque)
+    with etapa("gerar_estoque_fiscal", entrada=df_config) as medida:
+        df_estoque = medida.saida(gerar_estoque_fiscal(df_entrada, df_saida, canceladas))
+    with etapa("alertas", entrada=df_config) as medida:
+        df_alertas = medida.saida(gerar_alertas_auditoria(df_entrada, df_saida))
+    with etapa("resumo_mensal", entrada=df_estoque) as medida:
+        df_resumo = medida.saida(gerar_resumo_mensal(df_estoque))
+    with etapa("apuracao", entrada=df_estoque) as medida:
+        df_apuracao, _ = calcular_apuracao(df_estoque)
+        medida.saida(df_apuracao)
+    with etapa("kpis", entrada=df_estoque) as medida:
+        kpis = medida.saida(gerar_kpis(df_estoque))
 
     st.session_state.df_estoque = df_estoque
     st.session_state.df_alertas = df_alertas
     st.session_state.df_resumo = df_resumo
+    st.session_state.df_apuracao = df_apuracao
     st.session_state.kpis = kpis
     st.session_state.processado = True
 
@@ -155,10 +404,54 @@ def _executar_pipeline(xml_paths: list[str], cnpj_empresa: str) -> None:
 # ---------------------------------------------------------------------------
 
 def _exportar_excel(df: pd.DataFrame) -> bytes:
-    buffer = io.BytesIO()
-    with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
-        df.to_excel(writer, index=False)
-    return buffer.getvalue()
+    return excel_bytes(df, layout=LAYOUT_COLUNAS)
+
+
+def _base_relatorio_fiscal(vendidos: pd.DataFrame) -> pd.DataFrame:
+    df_fiscal = vendidos.copy()
+    df_fiscal["Valor Produtos"] = df_fiscal.get("Valor Venda", 0)
+    return df_fiscal
+
+
+def _exportar_relatorio_fiscal(df_fiscal: pd.DataFrame) -> bytes:
+    buffer_fiscal = io.BytesIO()
+    gerar_relatorio_fiscal_excel(df_fiscal, buffer_fiscal)
+    return buffer_fiscal.getvalue()
+
+
+def _exportar_relatorio_completo(
+    vendidos: pd.DataFrame,
+    estoque: pd.DataFrame,
+    df_resumo: pd.DataFrame,
+    df_alertas: pd.DataFrame,
+    df_apuracao: pd.DataFrame | None,
+) -> bytes:
+    """Gera um único workbook com todas as planilhas do relatório."""
+    planilhas = {
+        "Vendas": vendidos,
+        "Relatório Fiscal": montar_relatorio_fiscal(_base_relatorio_fiscal(vendidos)),
+        "Estoque": estoque,
+        "Resumo Mensal": df_resumo,
+        "Alertas": df_alertas,
+        "Apuração": df_apuracao,
+    }
+    return workbook_bytes(planilhas, layout=LAYOUT_COLUNAS)
+
+
+def _botoes_colunares(df: pd.DataFrame, nome_base: str, rotulo: str) -> None:
+    """Oferece ``df`` também em Parquet e CSV compactado."""
+    for formato in ("parquet", "csv.gz"):
+        _, mime = FORMATOS_EXPORTACAO[formato]
+        nome_arquivo = f"{nome_base}.{formato}"
+        st.download_button(
+            f"{rotulo} ({formato})",
+            data=conteudo_sob_demanda(
+                nome_arquivo, lambda fmt=formato: exportar_bytes(df, fmt, layout=LAYOUT_COLUNAS), df
+            ),
+            file_name=nome_arquivo,
+            mime=mime,
+            key=f"download_{nome_base}_{formato}",
+        )
 
 
 def sidebar(empresas: dict[str, str]) -> str | None:
@@ -172,6 +465,11 @@ def sidebar(empresas: dict[str, str]) -> str | None:
         else:
             cnpj = None
 
+        with st.expander("Diagnóstico"):
+            st.checkbox("Perfil de CPU (cProfile)", key="perfil_cpu")
+            st.checkbox("Rastrear memória (tracemalloc)", key="perfil_memoria")
+            st.caption("Vale para o próximo processamento, que fica mais lento.")
+
         origem = st.radio("Origem dos XMLs", ["Upload Manual", "Google Drive"], key="origem")
 
         xml_paths: list[str] = st.session_state.get("xml_paths", [])
@@ -183,14 +481,26 @@ def sidebar(empresas: dict[str, str]) -> str | None:
                 xml_paths = _upload_manual(files)
         else:
             disabled = empresa == "-"
+            incremental = st.checkbox(
+                "Baixar apenas XMLs novos (index_arquivos.json)", key="drive_incremental"
+            )
             if st.button("Buscar XMLs do Drive", disabled=disabled) and empresa and empresa != "-":
                 try:
                     log.info("Iniciando download dos XMLs para %s", empresa)
                     service = criar_servico_drive()
                     download_dir = tempfile.mkdtemp(prefix="download_")
-                    xml_paths = baixar_xmls_empresa_zip(
-                        service, ROOT_FOLDER_ID, empresa, download_dir
-                    )
+                    if incremental:
+                        xml_paths = _sincronizar_incremental(service, empresa, download_dir)
+                        if cnpj and xml_paths:
+                            _executar_pipeline(xml_paths, cnpj)
+                    elif cnpj:
+                        xml_paths = _executar_pipeline_drive(
+                            service, empresa, cnpj, download_dir
+                        )
+                    else:
+                        xml_paths = baixar_xmls_empresa_zip(
+                            service, ROOT_FOLDER_ID, empresa, download_dir
+                        )
                     log.info(
                         "Arquivos XML baixados: %s",
                         [Path(p).name for p in xml_paths],
@@ -202,6 +512,9 @@ def sidebar(empresas: dict[str, str]) -> str | None:
                 except zipfile.BadZipFile as exc:
                     log.error("ZIP inválido para %s: %s", empresa, exc)
                     st.warning(f"Arquivo ZIP inválido: {exc}")
+                except DownloadIncompleto as exc:
+                    log.error("Download inválido para %s: %s", empresa, exc)
+                    st.warning(f"Falha no download do ZIP: {exc}")
                 except HttpError as exc:  # pragma: no cover - depende do ambiente
                     log.error("Falha ao acessar Drive: %s", exc)
                     st.warning(f"Falha ao acessar Drive: {exc}")
@@ -225,6 +538,26 @@ def render_relatorios() -> None:
 
     vendidos = df[df["Situação"] == "Vendido"].copy()
     estoque = df[df["Situação"] == "Em Estoque"].copy()
+    df_resumo = st.session_state.df_resumo
+    df_alertas = st.session_state.df_alertas
+    df_apuracao = st.session_state.get("df_apuracao", pd.DataFrame())
+
+    # Os arquivos são gerados somente no clique e memoizados pelo conteúdo
+    st.download_button(
+        "Exportar Relatório Completo",
+        data=conteudo_sob_demanda(
+            "relatorio_completo.xlsx",
+            lambda: _exportar_relatorio_completo(
+                vendidos, estoque, df_resumo, df_alertas, df_apuracao
+            ),
+            df,
+            df_resumo,
+            df_alertas,
+            df_apuracao,
+        ),
+        file_name="relatorio_completo.xlsx",
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    )
 
     st.subheader("Veículos Vendidos")
     st.dataframe(vendidos[
@@ -240,19 +573,23 @@ def render_relatorios() -> None:
     ])
     st.download_button(
         "Exportar Vendas",
-        data=_exportar_excel(vendidos),
+        data=conteudo_sob_demanda(
+            "vendas.xlsx", lambda: _exportar_excel(vendidos), vendidos
+        ),
         file_name="vendas.xlsx",
         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
     )
+    _botoes_colunares(vendidos, "vendas", "Exportar Vendas")
 
     # Geração do relatório fiscal com cálculos de tributos
-    df_fiscal = vendidos.copy()
-    df_fiscal["Valor Produtos"] = df_fiscal.get("Valor Venda", 0)
-    buffer_fiscal = io.BytesIO()
-    gerar_relatorio_fiscal_excel(df_fiscal, buffer_fiscal)
+    df_fiscal = _base_relatorio_fiscal(vendidos)
     st.download_button(
         "Exportar Relatório Fiscal",
-        data=buffer_fiscal.getvalue(),
+        data=conteudo_sob_demanda(
+            "relatorio_fiscal.xlsx",
+            lambda: _exportar_relatorio_fiscal(df_fiscal),
+            df_fiscal,
+        ),
         file_name="relatorio_fiscal.xlsx",
         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
     )
@@ -270,23 +607,47 @@ def render_relatorios() -> None:
     ])
     st.download_button(
         "Exportar Estoque",
-        data=_exportar_excel(estoque),
+        data=conteudo_sob_demanda(
+            "estoque.xlsx", lambda: _exportar_excel(estoque), estoque
+        ),
         file_name="estoque.xlsx",
         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
     )
+    _botoes_colunares(estoque, "estoque", "Exportar Estoque")
 
     st.subheader("Resumo Financeiro Mensal")
-    st.dataframe(st.session_state.df_resumo)
+    st.dataframe(df_resumo)
     st.download_button(
         "Exportar Resumo",
-        data=_exportar_excel(st.session_state.df_resumo),
+        data=conteudo_sob_demanda(
+            "resumo_mensal.xlsx", lambda: _exportar_excel(df_resumo), df_resumo
+        ),
         file_name="resumo_mensal.xlsx",
         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
     )
-
-    if not st.session_state.df_alertas.empty:
+    _botoes_colunares(df_resumo, "resumo_mensal", "Exportar Resumo")
+
+    if not df_apuracao.empty:
+        st.subheader("Apuração Trimestral")
+        st.dataframe(df_apuracao)
+        st.download_button(
+            "Exportar Apuração",
+            data=conteudo_sob_demanda(
+                "apuracao.xlsx", lambda: _exportar_excel(df_apuracao), df_apuracao
+            ),
+            file_name="apuracao.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        )
+        _botoes_colunares(df_apuracao, "apuracao", "Exportar Apuração")
+
+    df_notas = st.session_state.get("df_configurado", pd.DataFrame())
+    if not df_notas.empty:
+        st.subheader("Notas Extraídas")
+        _botoes_colunares(df_notas, "notas_extraidas", "Exportar Notas")
+
+    if not df_alertas.empty:
         st.subheader("Alertas Fiscais")
-        st.dataframe(st.session_state.df_alertas)
+        st.dataframe(df_alertas)
 
 # ---------------------------------------------------------------------------
 # Ponto de entrada
@@ -299,9 +660,14 @@ def main() -> None:
     if cnpj and st.session_state.xml_paths and st.button("Processar XMLs"):
         _executar_pipeline(st.session_state.xml_paths, cnpj)
     if st.session_state.processado:
-        render_relatorios()
+        # Exportações geradas nos cliques entram nas métricas do processamento
+        with coletar_metricas(st.session_state.metricas):
+            render_relatorios()
     else:
         st.info("Nenhum dado processado ainda.")
+    _mostrar_quarentena()
+    _mostrar_desempenho()
+    _mostrar_perfil()
 
 
 if __name__ == "__main__":  # pragma: no cover - entrada do Streamlit
@@ -0,0 +1,39 @@
+import pytest
+
+XML_NFE = """<?xml version="1.0" encoding="UTF-8"?>
+<NFe xmlns="http://www.portalfiscal.inf.br/nfe">
+  <infNFe Id="NFe{n:044d}" versao="4.00">
+    <ide><nNF>{n}</nNF><dhEmi>2023-01-{dia:02d}T12:00:00-03:00</dhEmi></ide>
+    <emit><CNPJ>12345678000199</CNPJ></emit>
+    <dest><CNPJ>98765432000188</CNPJ></dest>
+    <det nItem="1">
+      <prod><xProd>CARRO XYZ CHASSI 9BWZZZ377VT00{n:04d}</xProd><CFOP>5102</CFOP><vProd>{n}000.00</vProd></prod>
+    </det>
+    <total><ICMSTot><vNF>{n}000.00</vNF></ICMSTot></total>
+  </infNFe>
+</NFe>"""
+
+
+@pytest.fixture
+def nfe_xml():
+    """Gera o XML de uma NFe de veículo com número ``n`` e emissão no ``dia``."""
+
+    def _gerar(n, dia=None):
+        return XML_NFE.format(n=n, dia=n % 28 + 1 if dia is None else dia)
+
+    return _gerar
+
+
+@pytest.fixture
+def lote_nfe(tmp_path, nfe_xml):
+    """Grava ``quantidade`` NFe em ``tmp_path`` e devolve os caminhos."""
+
+    def _gravar(quantidade):
+        caminhos = []
+        for n in range(1, quantidade + 1):
+            caminho = tmp_path / f"nfe{n:03d}.xml"
+            caminho.write_text(nfe_xml(n), encoding="utf-8")
+            caminhos.append(str(caminho))
+        return caminhos
+
+    return _gravar
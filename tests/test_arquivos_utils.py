@@ -0,0 +1,116 @@
+import hashlib
+import io
+import threading
+import time
+import zipfile
+
+import pytest
+
+import utils.arquivos_utils as au
+from utils.arquivos_utils import copiar_em_blocos, extrair_zip_em_blocos, ler_antecipado
+
+
+class _LeituraContada(io.BytesIO):
+    def __init__(self, dados):
+        super().__init__(dados)
+        self.maior_leitura = 0
+
+    def read(self, n=-1):
+        dados = super().read(n)
+        self.maior_leitura = max(self.maior_leitura, len(dados))
+        return dados
+
+
+def _zip(caminho, membros):
+    with zipfile.ZipFile(caminho, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for nome, conteudo in membros:
+            zf.writestr(nome, conteudo)
+    return str(caminho)
+
+
+def test_copia_em_blocos_retorna_sha256(tmp_path):
+    dados = b"x" * 10_000
+    origem = _LeituraContada(dados)
+
+    resumo = copiar_em_blocos(origem, str(tmp_path / "a.xml"), tamanho_bloco=1024)
+
+    assert resumo == hashlib.sha256(dados).hexdigest()
+    assert (tmp_path / "a.xml").read_bytes() == dados
+    assert origem.maior_leitura == 1024
+    assert not (tmp_path / "a.xml.part").exists()
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_extracao_paralela_descarta_conteudo_repetido(tmp_path, max_workers):
+    membros = [(f"notas/{n:03d}.xml", f"<NFe>{n % 7}</NFe>") for n in range(30)]
+    membros += [("leia-me.txt", "ignorado"), ("notas/", "")]
+    zip_path = _zip(tmp_path / "x.zip", membros)
+    progresso = []
+
+    caminhos, duplicados = extrair_zip_em_blocos(
+        zip_path,
+        str(tmp_path / "saida"),
+        max_workers=max_workers,
+        progresso=lambda feitos, total: progresso.append((feitos, total)),
+        tamanho_bloco=4,
+    )
+
+    assert [c.split("saida/")[-1] for c in caminhos] == [f"notas/{n:03d}.xml" for n in range(7)]
+    assert duplicados == 23
+    assert progresso[-1] == (30, 30)
+    assert sorted(p.name for p in (tmp_path / "saida" / "notas").iterdir()) == [
+        f"{n:03d}.xml" for n in range(7)
+    ]
+
+
+def test_extracao_considera_conteudos_ja_vistos(tmp_path):
+    vistos = {}
+    primeiro = _zip(tmp_path / "a.zip", [("a.xml", "<a/>")])
+    segundo = _zip(tmp_path / "b.zip", [("b.xml", "<a/>"), ("c.xml", "<c/>")])
+
+    extrair_zip_em_blocos(primeiro, str(tmp_path / "saida"), vistos=vistos)
+    caminhos, duplicados = extrair_zip_em_blocos(segundo, str(tmp_path / "saida"), vistos=vistos)
+
+    assert [c.split("saida/")[-1] for c in caminhos] == ["c.xml"]
+    assert duplicados == 1
+    assert len(vistos) == 2
+
+
+def test_extracao_bloqueia_path_traversal(tmp_path):
+    zip_path = _zip(tmp_path / "x.zip", [("../fora.xml", "<a/>")])
+
+    with pytest.raises(Exception, match="malicioso"):
+        extrair_zip_em_blocos(zip_path, str(tmp_path / "saida"))
+    assert not (tmp_path / "fora.xml").exists()
+
+
+def test_leitura_antecipada_em_ordem_e_limitada(tmp_path, monkeypatch):
+    caminhos = []
+    for n in range(20):
+        (tmp_path / f"{n}.xml").write_bytes(b"x" * n)
+        caminhos.append(str(tmp_path / f"{n}.xml"))
+    caminhos.insert(5, str(tmp_path / "faltando.xml"))
+    em_leitura = []
+    maximo = []
+    lock = threading.Lock()
+    original = au._ler_arquivo
+
+    def _ler(caminho, limite):
+        with lock:
+            em_leitura.append(caminho)
+            maximo.append(len(em_leitura))
+        time.sleep(0.005)
+        return original(caminho, limite)
+
+    monkeypatch.setattr(au, "_ler_arquivo", _ler)
+    lidos = []
+    for caminho, conteudo in ler_antecipado(caminhos, max_workers=2, janela=3, limite_bytes=15):
+        with lock:
+            em_leitura.remove(caminho)
+        lidos.append((caminho, conteudo))
+
+    assert [c for c, _ in lidos] == caminhos
+    assert lidos[5][1] is None  # não encontrado
+    assert lidos[3][1] == b"xxx"
+    assert lidos[-1][1] is None  # acima do limite
+    assert max(maximo) <= 3 + 1  # a janela mais o arquivo entregue
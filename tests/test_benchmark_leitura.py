@@ -0,0 +1,16 @@
+import modules.benchmark_leitura as bl
+
+
+def test_rodadas_variam_apenas_os_leitores(lote_nfe, monkeypatch):
+    caminhos = lote_nfe(12)
+    chamadas = []
+    monkeypatch.setattr(
+        bl, "processar_xmls", lambda *args, **kwargs: chamadas.append((args, kwargs))
+    )
+
+    tempos = bl.medir(caminhos, [0, 2, 4], repeticoes=2)
+
+    assert {n: len(v) for n, v in tempos.items()} == {0: 2, 2: 2, 4: 2}
+    assert [kwargs.pop("leitores") for _, kwargs in chamadas] == [0, 2, 4] * 2
+    assert all(kwargs["executor"] == "serial" for _, kwargs in chamadas)
+    assert all(chamada == chamadas[0] for chamada in chamadas)
@@ -0,0 +1,75 @@
+import os
+import zipfile
+from pathlib import Path
+
+import utils.cache_drive as cd
+import utils.drive_utils as du
+
+
+def _preparar_drive(monkeypatch, metadados, downloads):
+    monkeypatch.setattr(du, "_buscar_subpasta_id", lambda s, p, n: "id_empresa")
+    monkeypatch.setattr(
+        du,
+        "listar_arquivos",
+        lambda s, pasta_id: [{"name": "xmls.zip", "id": "zip1", **metadados}],
+    )
+
+    def fake_baixar_arquivo(service, file_id, destino, **validacao):
+        downloads.append(file_id)
+        Path(destino).parent.mkdir(parents=True, exist_ok=True)
+        with zipfile.ZipFile(destino, "w") as zf:
+            zf.writestr("sub/nfe1.xml", "<xml />")
+
+    monkeypatch.setattr(du, "baixar_arquivo", fake_baixar_arquivo)
+
+
+def test_zip_inalterado_nao_e_baixado_de_novo(monkeypatch, tmp_path):
+    monkeypatch.setenv("DRIVE_CACHE_DIR", str(tmp_path / "cache"))
+    metadados = {"modifiedTime": "2024-01-01T00:00:00Z", "md5Checksum": "abc"}
+    downloads = []
+    _preparar_drive(monkeypatch, metadados, downloads)
+
+    primeira = du.baixar_xmls_empresa_zip(None, "root", "Empresa", tmp_path / "d1")
+    segunda = du.baixar_xmls_empresa_zip(None, "root", "Empresa", tmp_path / "d2")
+
+    assert downloads == ["zip1"]
+    assert primeira == [str(tmp_path / "d1" / "xmls" / "sub" / "nfe1.xml")]
+    assert segunda == [str(tmp_path / "d2" / "xmls" / "sub" / "nfe1.xml")]
+
+    # Os XMLs entregues sobrevivem ao descarte da entrada do cache
+    assert cd.limpar(str(tmp_path / "cache"), limite_bytes=0) == ["zip1"]
+    assert Path(primeira[0]).read_text() == Path(segunda[0]).read_text() == "<xml />"
+
+    metadados["md5Checksum"] = "def"
+    du.baixar_xmls_empresa_zip(None, "root", "Empresa", tmp_path / "d3")
+    assert downloads == ["zip1", "zip1"]
+
+
+def test_cache_desativado(monkeypatch, tmp_path):
+    monkeypatch.setenv("DRIVE_CACHE_DIR", "")
+    downloads = []
+    _preparar_drive(
+        monkeypatch, {"modifiedTime": "t", "md5Checksum": "abc"}, downloads
+    )
+
+    for destino in ("d1", "d2"):
+        xmls = du.baixar_xmls_empresa_zip(None, "root", "Empresa", tmp_path / destino)
+
+    assert downloads == ["zip1", "zip1"]
+    assert xmls == [str(tmp_path / "d2" / "xmls" / "sub" / "nfe1.xml")]
+
+
+def test_limpar_remove_menos_usados(tmp_path):
+    def preencher(zip_path, pasta):
+        with open(os.path.join(pasta, "nota.xml"), "wb") as f:
+            f.write(b"x" * 100)
+
+    for i, arquivo_id in enumerate(["a", "b", "c"]):
+        arquivo = {"id": arquivo_id, "name": f"{arquivo_id}.zip", "modifiedTime": "t", "md5Checksum": "m"}
+        cd.armazenar(str(tmp_path), arquivo, preencher, limite_bytes=10**6)
+    assert cd.obter_xmls(str(tmp_path), {"id": "a", "name": "a.zip", "modifiedTime": "t", "md5Checksum": "m"})
+
+    removidas = cd.limpar(str(tmp_path), limite_bytes=250)
+
+    assert removidas == ["b"]
+    assert sorted(os.listdir(tmp_path)) == ["a", "c"]
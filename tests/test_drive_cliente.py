@@ -0,0 +1,146 @@
+import json
+import threading
+import time
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from utils import drive_cliente
+from utils.drive_cliente import PoolHttp, _CredenciaisSincronizadas
+
+
+@pytest.fixture(scope="module")
+def chave_servico():
+    chave = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = chave.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+    return {
+        "type": "service_account",
+        "project_id": "teste",
+        "private_key_id": "1",
+        "private_key": pem,
+        "client_email": "robo@teste.iam.gserviceaccount.com",
+        "client_id": "1",
+        "token_uri": "https://oauth2.googleapis.com/token",
+    }
+
+
+@pytest.fixture(autouse=True)
+def _sem_cache():
+    drive_cliente.limpar_cache_servicos()
+    yield
+    drive_cliente.limpar_cache_servicos()
+
+
+def test_servico_reaproveitado_por_chave(monkeypatch, chave_servico):
+    from utils.drive_utils import criar_servico_drive
+    from utils.google_drive_utils import get_drive_service
+
+    monkeypatch.setenv("GCP_SERVICE_ACCOUNT_JSON", json.dumps(chave_servico))
+    servico = criar_servico_drive()
+
+    assert get_drive_service() is servico
+    assert isinstance(servico._http, PoolHttp)
+
+    # Com o serviço em cache, o JSON da chave não é interpretado de novo
+    monkeypatch.setattr(drive_cliente.json, "loads", lambda *a, **k: pytest.fail("json.loads"))
+    assert criar_servico_drive() is servico
+    monkeypatch.undo()
+
+    monkeypatch.setenv(
+        "GCP_SERVICE_ACCOUNT_JSON", json.dumps({**chave_servico, "private_key_id": "2"})
+    )
+    novo = criar_servico_drive()
+    assert novo is not servico
+
+    # Escopos diferentes geram serviços diferentes para a mesma chave
+    escrita = criar_servico_drive(escrita=True)
+    assert escrita is not novo
+    assert escrita._http.credentials.scopes == list(drive_cliente.ESCOPOS_ESCRITA)
+    assert novo._http.credentials.scopes == list(drive_cliente.ESCOPOS_LEITURA)
+
+
+def test_erros_de_configuracao(monkeypatch):
+    monkeypatch.delenv("GCP_SERVICE_ACCOUNT_JSON", raising=False)
+    with pytest.raises(EnvironmentError):
+        drive_cliente.obter_servico()
+    monkeypatch.setenv("GCP_SERVICE_ACCOUNT_JSON", "{invalido")
+    with pytest.raises(ValueError):
+        drive_cliente.obter_servico()
+
+
+class _HttpFalso:
+    def __init__(self):
+        self.requisicoes = 0
+
+    def request(self, uri, method, body=None, headers=None, **kwargs):
+        self.requisicoes += 1
+        time.sleep(0.01)
+        return {"status": "200"}, id(self)
+
+    def close(self):
+        pass
+
+
+def test_pool_reaproveita_e_limita_conexoes():
+    criadas = []
+
+    def _nova():
+        criadas.append(_HttpFalso())
+        return criadas[-1]
+
+    pool = PoolHttp(object(), max_conexoes=3, fabrica_http=_nova)
+    threads = [
+        threading.Thread(target=lambda: [pool.request("u") for _ in range(5)])
+        for _ in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert 1 <= len(criadas) <= 3
+    assert sum(h.requisicoes for h in criadas) == 40
+
+    pool.request("u")
+    assert len(criadas) == pool.criadas <= 3
+
+
+class _CredenciaisFalsas:
+    def __init__(self):
+        self.token = None
+        self.renovacoes = 0
+
+    @property
+    def valid(self):
+        return self.token is not None
+
+    def refresh(self, request):
+        time.sleep(0.05)
+        self.renovacoes += 1
+        self.token = f"tok{self.renovacoes}"
+
+    def apply(self, headers):
+        headers["authorization"] = f"Bearer {self.token}"
+
+
+def test_renovacao_de_token_unica_entre_threads():
+    base = _CredenciaisFalsas()
+    credenciais = _CredenciaisSincronizadas(base)
+    cabecalhos = [{} for _ in range(6)]
+    threads = [
+        threading.Thread(target=credenciais.before_request, args=(None, "GET", "u", h))
+        for h in cabecalhos
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert base.renovacoes == 1
+    assert all(h["authorization"] == "Bearer tok1" for h in cabecalhos)
+    assert credenciais.token == "tok1"
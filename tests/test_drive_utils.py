@@ -1,4 +1,5 @@
 from pathlib import Path
+from types import SimpleNamespace
 import logging
 
 import pytest
@@ -74,3 +75,114 @@ def test_multiplos_zips_com_config(monkeypatch, tmp_path):
 
     xmls = du.baixar_xmls_empresa_zip(None, "root", "Empresa", tmp_path)
     assert xmls == [str(tmp_path / "b" / "nfe.xml")]
+
+
+class _HttpIntervalos:
+    """Servidor falso que atende ``Range`` e falha nas requisições indicadas."""
+
+    def __init__(self, conteudo, falhas=None):
+        self.conteudo = conteudo
+        self.falhas = dict(falhas or {})
+        self.intervalos = []
+
+    def request(self, uri, method="GET", headers=None, **kwargs):
+        from httplib2 import Response
+
+        inicio, fim = map(int, headers["range"][len("bytes="):].split("-"))
+        self.intervalos.append(inicio)
+        falha = self.falhas.pop(len(self.intervalos), None)
+        if falha == "rede":
+            raise ConnectionResetError("conexão perdida")
+        if falha:
+            return Response({"status": falha}), b"erro"
+        parte = self.conteudo[inicio:fim + 1]
+        resp = Response(
+            {
+                "status": 206,
+                "content-range": f"bytes {inicio}-{inicio + len(parte) - 1}/{len(self.conteudo)}",
+            }
+        )
+        return resp, parte
+
+
+class _ServicoMidia:
+    def __init__(self, http):
+        self.http = http
+        self.uri = "https://fake/arquivo"
+        self.headers = {}
+
+    def files(self):
+        return self
+
+    def get_media(self, fileId):
+        return self
+
+
+def test_baixar_arquivo_retoma_apos_falhas(tmp_path):
+    import hashlib
+
+    conteudo = bytes(range(256)) * 40
+    http = _HttpIntervalos(conteudo, falhas={2: "rede", 4: 503})
+    progresso = []
+    esperas = []
+    destino = tmp_path / "a.zip"
+
+    du.baixar_arquivo(
+        _ServicoMidia(http),
+        "id",
+        str(destino),
+        tamanho=str(len(conteudo)),
+        md5=hashlib.md5(conteudo).hexdigest(),
+        tamanho_bloco=4096,
+        progresso=lambda baixados, total: progresso.append(baixados),
+        dormir=esperas.append,
+    )
+
+    assert destino.read_bytes() == conteudo
+    assert http.intervalos == [0, 4096, 4096, 8192, 8192]
+    assert progresso == [4096, 8192, len(conteudo)]
+    assert len(esperas) == 2
+    assert not (tmp_path / "a.zip.part").exists()
+
+
+def test_baixar_arquivo_md5_divergente(tmp_path):
+    http = _HttpIntervalos(b"conteudo")
+    destino = tmp_path / "a.zip"
+
+    with pytest.raises(du.DownloadIncompleto):
+        du.baixar_arquivo(_ServicoMidia(http), "id", str(destino), md5="0" * 32)
+    assert not destino.exists()
+    assert not (tmp_path / "a.zip.part").exists()
+
+
+def test_baixar_arquivo_nao_repete_erro_permanente(tmp_path):
+    http = _HttpIntervalos(b"conteudo", falhas={1: 404})
+
+    with pytest.raises(du.HttpError):
+        du.baixar_arquivo(_ServicoMidia(http), "id", str(tmp_path / "a.zip"))
+    assert http.intervalos == [0]
+    assert not (tmp_path / "a.zip.part").exists()
+
+
+def test_downloads_em_blocos_passam_pelo_limitador(tmp_path):
+    conteudo = bytes(range(256)) * 40
+    http = _HttpIntervalos(conteudo)
+    requisicao = _ServicoMidia(http)
+    requisicao.execute = lambda: conteudo
+    agora = [0.0]
+
+    def dormir(segundos):
+        agora[0] += segundos
+
+    limitador = du.LimitadorTaxa(1, capacidade=1, relogio=lambda: agora[0], dormir=dormir)
+    servico = du.ServicoLimitado(
+        SimpleNamespace(files=lambda: SimpleNamespace(get_media=lambda fileId: requisicao)),
+        limitador=limitador,
+    )
+
+    du.baixar_arquivo(servico, "id", str(tmp_path / "a.zip"), tamanho=len(conteudo), tamanho_bloco=4096)
+    assert http.intervalos == [0, 4096, 8192]
+    assert agora[0] == pytest.approx(2.0)
+
+    du.baixar_intervalo(servico, "id", 0, 99)
+    assert agora[0] == pytest.approx(3.0)
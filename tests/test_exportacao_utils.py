@@ -0,0 +1,110 @@
+import pandas as pd
+from openpyxl import load_workbook
+
+from utils.exportacao_utils import (
+    escrever_excel,
+    escrever_workbook,
+    estimar_larguras,
+    exportar_dados,
+)
+
+
+def _df_exemplo():
+    return pd.DataFrame(
+        {
+            "Chassi": ["9BWZZZ377VT004251", None],
+            "Data Emissão": [pd.Timestamp("2023-01-01"), pd.NaT],
+            "Valor Total": [1500.5, float("nan")],
+            "Tipo Produto": ["Veículo", "Consumo"],
+        }
+    )
+
+
+def test_escrever_excel_dataframe(tmp_path):
+    saida = tmp_path / "saida" / "dados.xlsx"
+    total = escrever_excel(_df_exemplo(), saida, "Dados")
+
+    assert total == 2
+    ws = load_workbook(saida)["Dados"]
+    assert [c.value for c in ws[1]] == [
+        "Chassi", "Data Emissão", "Valor Total", "Tipo Produto"
+    ]
+    assert ws["A2"].value == "9BWZZZ377VT004251"
+    assert ws["B2"].number_format == "dd/mm/yyyy"
+    assert ws["C2"].value == 1500.5
+    assert ws["C2"].number_format == "#,##0.00"
+    assert ws["A3"].value is None and ws["C3"].value is None
+    assert ws.freeze_panes == "A2"
+    assert ws.auto_filter.ref == "A1:D3"
+
+
+def test_escrever_excel_lotes(tmp_path):
+    df = _df_exemplo()
+    lotes = (df.iloc[[i]] for i in range(len(df)) for _ in range(3))
+    saida = tmp_path / "lotes.xlsx"
+
+    total = escrever_excel(lotes, saida)
+
+    assert total == 6
+    lido = pd.read_excel(saida)
+    assert list(lido.columns) == list(df.columns)
+    assert len(lido) == 6
+
+
+def test_estimar_larguras_por_tipo():
+    df = pd.DataFrame(
+        {
+            "Data": pd.to_datetime(["2023-01-01"] * 3),
+            "Valor": [1.0, 2.0, 3.0],
+            "Produto": ["A", "CARRO MODELO XYZ", None],
+            "Fixa": ["x", "y", "z"],
+        }
+    )
+    layout = {"Fixa": {"tipo": "str", "largura": 30}}
+
+    assert estimar_larguras(df, layout) == [12, 14, 18, 30]
+
+
+def test_estimar_larguras_amostra_limitada():
+    df = pd.DataFrame({"Texto": ["curto"] * 5 + ["x" * 200]})
+    assert estimar_larguras(df, {}, amostra=5) == [7]
+
+
+def test_exportar_parquet_preserva_tipos(tmp_path):
+    df = _df_exemplo()
+    df["Misto"] = [1, "A"]
+    saida = tmp_path / "dados.parquet"
+
+    assert exportar_dados(df, saida, "parquet") == 2
+
+    lido = pd.read_parquet(saida)
+    assert pd.api.types.is_datetime64_any_dtype(lido["Data Emissão"])
+    assert pd.api.types.is_float_dtype(lido["Valor Total"])
+    assert lido["Misto"].tolist() == ["1", "A"]
+
+
+def test_exportar_csv_gz(tmp_path):
+    saida = tmp_path / "dados.csv.gz"
+    vazio = _df_exemplo().iloc[:0]
+    exportar_dados([pd.DataFrame(), vazio, _df_exemplo(), vazio, _df_exemplo()], saida, "csv.gz")
+
+    lido = pd.read_csv(saida)
+    assert len(lido) == 4
+    assert list(lido.columns) == list(_df_exemplo().columns)
+
+
+def test_escrever_workbook_varias_planilhas(tmp_path):
+    saida = tmp_path / "completo.xlsx"
+    resumo = pd.DataFrame({"Mês": [pd.Timestamp("2023-01-01")], "Lucro": [10.0]})
+
+    totais = escrever_workbook(
+        {"Vendas": _df_exemplo(), "Resumo": resumo, "Vazia": pd.DataFrame(), "Ignorada": None},
+        saida,
+        tamanho_lote=1,
+    )
+
+    assert totais == {"Vendas": 2, "Resumo": 1, "Vazia": 0}
+    wb = load_workbook(saida)
+    assert wb.sheetnames == ["Vendas", "Resumo", "Vazia"]
+    assert wb["Vendas"]["A2"].value == "9BWZZZ377VT004251"
+    assert wb["Resumo"]["B2"].value == 10.0
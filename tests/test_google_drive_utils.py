@@ -0,0 +1,440 @@
+from pathlib import Path
+
+from httplib2 import Response
+
+import utils.google_drive_utils as gdu
+
+
+class _Midia:
+    def __init__(self, conteudo):
+        self.conteudo = conteudo
+        self.uri = "https://fake/midia"
+        self.headers = {}
+        self.http = self
+        self.intervalos = []
+
+    def request(self, uri, method="GET", headers=None, **kwargs):
+        inicio, fim = map(int, headers["range"][len("bytes="):].split("-"))
+        self.intervalos.append((inicio, fim))
+        parte = self.conteudo[inicio:fim + 1]
+        return Response(
+            {
+                "status": 206,
+                "content-range": f"bytes {inicio}-{inicio + len(parte) - 1}/{len(self.conteudo)}",
+            }
+        ), parte
+
+
+class FakeDrive:
+    def __init__(self, arquivos):
+        self.arquivos = arquivos
+        self.baixados = []
+
+    def files(self):
+        return self
+
+    def get_media(self, fileId):
+        self.baixados.append(fileId)
+        self.ultima = _Midia(self.arquivos[fileId])
+        return self.ultima
+
+
+def test_sincronizacao_incremental(monkeypatch, tmp_path):
+    drive = FakeDrive({"a": b"<a/>", "b": b"<b/>", "c": b"<c/>"})
+    index = {
+        "a": {"nome": "a.xml", "caminho": "2024/a.xml", "modificado": "t1"},
+        "b": {"nome": "b.xml", "caminho": "2024/b.xml", "modificado": "t1"},
+    }
+    monkeypatch.setattr(gdu, "_read_index", lambda service, company_id: (dict(index), "idx"))
+
+    def sincronizar():
+        return gdu.sincronizar_xmls_incremental(
+            drive, "empresa", str(tmp_path), fabrica_servico=lambda: drive, max_workers=2
+        )
+
+    primeira = sincronizar()
+    pasta = tmp_path / "incremental-empresa" / "extraido"
+    assert sorted(primeira["baixados"]) == ["2024/a.xml", "2024/b.xml"]
+    assert primeira["xmls"] == [str(pasta / "2024" / "a.xml"), str(pasta / "2024" / "b.xml")]
+
+    drive.baixados.clear()
+    segunda = sincronizar()
+    assert drive.baixados == []
+    assert segunda["baixados"] == [] and segunda["xmls"] == primeira["xmls"]
+
+    drive.arquivos["b"] = b"<b versao='2'/>"
+    del index["a"]
+    index["b"] = {**index["b"], "modificado": "t2"}
+    index["c"] = {"nome": "c.xml", "caminho": "2025/c.xml", "modificado": "t1"}
+    terceira = sincronizar()
+
+    assert sorted(drive.baixados) == ["b", "c"]
+    assert terceira["removidos"] == ["2024/a.xml"]
+    assert not (pasta / "2024" / "a.xml").exists()
+    assert Path(pasta / "2024" / "b.xml").read_bytes() == b"<b versao='2'/>"
+    assert len(terceira["xmls"]) == 2
+
+
+def test_sincronizacao_incremental_entrega_fora_do_cache(monkeypatch, tmp_path):
+    cache = tmp_path / "cache"
+    drive = FakeDrive({"a": b"<a/>", "b": b"<b/>"})
+    index = {
+        "a": {"nome": "a.xml", "caminho": "2024/a.xml", "modificado": "t1"},
+        "b": {"nome": "b.xml", "caminho": "2024/b.xml", "modificado": "t1"},
+    }
+    monkeypatch.setattr(gdu, "_read_index", lambda service, company_id: (dict(index), "idx"))
+    # Uma entrada antiga força o descarte; a da sincronização em curso fica
+    (cache / "zip-antigo").mkdir(parents=True)
+    gdu.cache_drive.gravar_meta(str(cache / "zip-antigo"), {"bytes": 1, "ultimo_acesso": 0})
+    (cache / "incremental-empresa").mkdir()
+    gdu.cache_drive.gravar_meta(
+        str(cache / "incremental-empresa"), {"bytes": 1, "ultimo_acesso": 0}
+    )
+    descartadas = []
+    get_media = drive.get_media
+
+    def _get_media(fileId):
+        descartadas.extend(gdu.cache_drive.limpar(str(cache), limite_bytes=0))
+        return get_media(fileId)
+
+    drive.get_media = _get_media
+
+    resultado = gdu.sincronizar_xmls_incremental(
+        drive, "empresa", str(cache), destino=str(tmp_path / "destino")
+    )
+
+    assert descartadas == ["zip-antigo"]
+    assert resultado["xmls"] == [
+        str(tmp_path / "destino" / "2024" / "a.xml"),
+        str(tmp_path / "destino" / "2024" / "b.xml"),
+    ]
+    assert gdu.cache_drive.limpar(str(cache), limite_bytes=0) == ["incremental-empresa"]
+    assert [Path(x).read_bytes() for x in resultado["xmls"]] == [b"<a/>", b"<b/>"]
+
+
+def test_sincronizacao_incremental_registra_falhas(monkeypatch, tmp_path):
+    drive = FakeDrive({"a": b"<a/>"})
+    index = {
+        "a": {"nome": "a.xml", "caminho": "a.xml", "modificado": "t1"},
+        "x": {"nome": "x.xml", "caminho": "x.xml", "modificado": "t1"},
+    }
+    monkeypatch.setattr(gdu, "_read_index", lambda service, company_id: (index, "idx"))
+
+    resultado = gdu.sincronizar_xmls_incremental(drive, "empresa", str(tmp_path))
+
+    assert resultado["baixados"] == ["a.xml"]
+    assert len(resultado["erros"]) == 1 and resultado["erros"][0].startswith("x.xml")
+
+    drive.arquivos["x"] = b"<x/>"
+    resultado = gdu.sincronizar_xmls_incremental(drive, "empresa", str(tmp_path))
+    assert resultado["baixados"] == ["x.xml"]
+
+
+class _Listagem:
+    def __init__(self, resposta):
+        self.resposta = resposta
+
+    def execute(self):
+        return self.resposta
+
+
+class FakeArvore:
+    """Árvore de pastas do Drive com paginação de ``tamanho_pagina`` itens."""
+
+    PASTA = "application/vnd.google-apps.folder"
+
+    def __init__(self, tamanho_pagina=2):
+        self.itens = []
+        self.tamanho_pagina = tamanho_pagina
+        self.consultas = []
+
+    def pasta(self, id_, nome, pai):
+        self.itens.append({"id": id_, "name": nome, "mimeType": self.PASTA, "parents": [pai]})
+
+    def arquivo(self, id_, nome, pai):
+        self.itens.append(
+            {"id": id_, "name": nome, "mimeType": "text/xml", "parents": [pai], "modifiedTime": "t"}
+        )
+
+    def files(self):
+        return self
+
+    def list(self, q, fields=None, pageToken=None, pageSize=None):
+        import re
+
+        pais = set(re.findall(r"'([^']+)' in parents", q))
+        self.consultas.append(sorted(pais))
+        filhos = [i for i in self.itens if pais & set(i["parents"])]
+        inicio = int(pageToken or 0)
+        fim = inicio + self.tamanho_pagina
+        resposta = {"files": filhos[inicio:fim]}
+        if fim < len(filhos):
+            resposta["nextPageToken"] = str(fim)
+        return _Listagem(resposta)
+
+
+def test_scan_xmls_em_largura():
+    arvore = FakeArvore()
+    for ano in ("2023", "2024"):
+        arvore.pasta(ano, ano, "raiz")
+        for mes in ("01", "02", "03"):
+            arvore.pasta(f"{ano}{mes}", mes, ano)
+            arvore.arquivo(f"x{ano}{mes}", f"nfe{ano}{mes}.xml", f"{ano}{mes}")
+            arvore.arquivo(f"p{ano}{mes}", "danfe.pdf", f"{ano}{mes}")
+    arvore.arquivo("raiz.xml", "solto.xml", "raiz")
+
+    entradas = gdu._scan_xmls(
+        arvore, "raiz", fabrica_servico=lambda: arvore, max_workers=2, pastas_por_consulta=4
+    )
+
+    assert [e["path"] for e in entradas] == [
+        "2023/01/nfe202301.xml",
+        "2023/02/nfe202302.xml",
+        "2023/03/nfe202303.xml",
+        "2024/01/nfe202401.xml",
+        "2024/02/nfe202402.xml",
+        "2024/03/nfe202403.xml",
+        "solto.xml",
+    ]
+    # Um nível por vez: raiz, anos (uma consulta) e meses (duas consultas de até 4 pastas)
+    assert sorted(map(len, {tuple(c) for c in arvore.consultas})) == [1, 2, 2, 4]
+
+
+def _nfe(tp_nf, preenchimento=0, itens=0):
+    det = "<det><prod><xProd>ITEM</xProd></prod></det>" * itens
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<NFe xmlns="http://www.portalfiscal.inf.br/nfe"><infNFe>'
+        f"<!-- {'x' * preenchimento} -->"
+        f"<ide><nNF>1</nNF><tpNF>{tp_nf}</tpNF></ide>{det}</infNFe></NFe>"
+    ).encode()
+
+
+def test_infer_tipo_nota_le_apenas_o_inicio():
+    drive = FakeDrive({"a": _nfe(1, itens=5000)})
+
+    assert gdu._infer_tipo_nota(drive, "a") == "Saída"
+    assert drive.ultima.intervalos == [(0, 4095)]
+
+
+def test_infer_tipo_nota_continua_quando_necessario():
+    drive = FakeDrive({"a": _nfe(0, preenchimento=100_000), "b": b"<NFe><ide/></NFe>"})
+
+    assert gdu._infer_tipo_nota(drive, "a") == "Entrada"
+    assert drive.ultima.intervalos == [(0, 4095), (4096, 69631), (69632, 135167)]
+    assert gdu._infer_tipo_nota(drive, "b") == "Indefinido"
+
+
+def test_atualizar_index_infere_apenas_alterados(monkeypatch):
+    drive = FakeDrive({"a": _nfe(0), "b": _nfe(1), "c": _nfe(1)})
+    index = {
+        "a": {"nome": "a.xml", "caminho": "a.xml", "modificado": "t1", "tipo": "Entrada"},
+        "b": {"nome": "b.xml", "caminho": "b.xml", "modificado": "t1", "tipo": "Entrada"},
+    }
+    gravados = []
+    monkeypatch.setattr(gdu, "_read_index", lambda service, company_id: (index, "idx"))
+    monkeypatch.setattr(
+        gdu,
+        "_scan_xmls",
+        lambda service, company_id, **opcoes: [
+            {"id": i, "name": f"{i}.xml", "path": f"{i}.xml", "modifiedTime": m}
+            for i, m in (("a", "t1"), ("b", "t2"), ("c", "t1"))
+        ],
+    )
+    monkeypatch.setattr(gdu, "_write_index", lambda *args: gravados.append(args[2]))
+
+    atual = gdu.atualizar_index_empresa(drive, "empresa", fabrica_servico=lambda: drive)
+
+    assert sorted(drive.baixados) == ["b", "c"]
+    assert {k: v["tipo"] for k, v in atual.items()} == {
+        "a": "Entrada",
+        "b": "Saída",
+        "c": "Saída",
+    }
+    assert gravados == [atual]
+
+
+class FakeDriveMudancas:
+    """Drive em memória com feed de mudanças e registro das chamadas à API."""
+
+    PASTA = "application/vnd.google-apps.folder"
+
+    def __init__(self):
+        self.itens = {}
+        self.feed = []
+        self.chamadas = []
+
+    # Alterações no "Drive" -------------------------------------------------
+    def _registrar(self, file_id, removido=False):
+        item = self.itens.get(file_id)
+        arquivo = None
+        if item is not None:
+            arquivo = {k: v for k, v in item.items() if k != "conteudo"}
+        self.feed.append({"fileId": file_id, "removed": removido, "file": arquivo})
+
+    def gravar(self, file_id, nome, pai, conteudo=None, pasta=False):
+        versao = len(self.feed)
+        self.itens[file_id] = {
+            "name": nome,
+            "mimeType": self.PASTA if pasta else "text/xml",
+            "parents": [pai],
+            "modifiedTime": f"v{versao}",
+            "trashed": False,
+            "conteudo": conteudo,
+        }
+        self._registrar(file_id)
+
+    def remover(self, file_id):
+        del self.itens[file_id]
+        self._registrar(file_id, removido=True)
+
+    # API ---------------------------------------------------------------------
+    def files(self):
+        return self
+
+    def changes(self):
+        return _Mudancas(self)
+
+    def list(self, q, fields=None, pageToken=None, pageSize=None):
+        import re
+
+        self.chamadas.append("files.list")
+        pais = set(re.findall(r"'([^']+)' in parents", q))
+        nome = re.search(r"name='([^']+)'", q)
+        filhos = [
+            {"id": i, **{k: v for k, v in item.items() if k != "conteudo"}}
+            for i, item in self.itens.items()
+            if pais & set(item["parents"]) and (not nome or item["name"] == nome.group(1))
+        ]
+        return _Listagem({"files": filhos})
+
+    def get_media(self, fileId):
+        self.chamadas.append("files.get_media")
+        return _Midia(self.itens[fileId]["conteudo"])
+
+    def update(self, fileId, media_body):
+        self.chamadas.append("files.update")
+        item = self.itens[fileId]
+        self.gravar(fileId, item["name"], item["parents"][0], media_body.getbytes(0, media_body.size()))
+        return _Listagem({"id": fileId})
+
+    def create(self, body, media_body):
+        self.chamadas.append("files.create")
+        file_id = f"idx{len(self.itens)}"
+        self.gravar(file_id, body["name"], body["parents"][0], media_body.getbytes(0, media_body.size()))
+        return _Listagem({"id": file_id})
+
+
+class _Mudancas:
+    def __init__(self, drive):
+        self.drive = drive
+
+    def getStartPageToken(self):
+        self.drive.chamadas.append("changes.getStartPageToken")
+        return _Listagem({"startPageToken": str(len(self.drive.feed))})
+
+    def list(self, pageToken, **kwargs):
+        self.drive.chamadas.append("changes.list")
+        inicio = int(pageToken)
+        return _Listagem(
+            {"changes": self.drive.feed[inicio:], "newStartPageToken": str(len(self.drive.feed))}
+        )
+
+
+def test_sincronizacao_por_mudancas(tmp_path):
+    drive = FakeDriveMudancas()
+    drive.gravar("2024", "2024", "raiz", pasta=True)
+    drive.gravar("01", "01", "2024", pasta=True)
+    drive.gravar("a", "a.xml", "01", _nfe(0))
+    drive.gravar("d", "d.xml", "01", _nfe(1))
+
+    def sincronizar():
+        drive.chamadas.clear()
+        return gdu.sincronizar_por_mudancas(
+            drive, "raiz", str(tmp_path), fabrica_servico=lambda: drive
+        )
+
+    primeira = sincronizar()
+    assert sorted(primeira["baixados"]) == ["2024/01/a.xml", "2024/01/d.xml"]
+    assert "changes.getStartPageToken" in drive.chamadas
+
+    # Sem mudanças (além da gravação do próprio índice): uma única chamada
+    for _ in range(2):
+        resultado = sincronizar()
+        assert drive.chamadas == ["changes.list"]
+        assert resultado["baixados"] == [] and len(resultado["xmls"]) == 2
+
+    drive.gravar("a", "a.xml", "01", _nfe(1))
+    drive.remover("d")
+    drive.gravar("02", "02", "2024", pasta=True)
+    drive.gravar("c", "c.xml", "02", _nfe(0))
+    drive.gravar("fora", "x.xml", "outra-empresa", _nfe(0))
+    resultado = sincronizar()
+
+    assert sorted(resultado["baixados"]) == ["2024/01/a.xml", "2024/02/c.xml"]
+    assert resultado["removidos"] == ["2024/01/d.xml"]
+    assert "changes.getStartPageToken" not in drive.chamadas
+    index, _ = gdu._read_index(drive, "raiz")
+    assert {v["caminho"]: v["tipo"] for v in index.values()} == {
+        "2024/01/a.xml": "Saída",
+        "2024/02/c.xml": "Entrada",
+    }
+
+    # Pasta renomeada: os caminhos abaixo dela exigem nova varredura
+    drive.gravar("01", "janeiro", "2024", pasta=True)
+    resultado = sincronizar()
+    assert "changes.getStartPageToken" in drive.chamadas
+    assert sorted(resultado["baixados"]) == ["2024/janeiro/a.xml"]
+    assert resultado["removidos"] == []
+    assert [p.split("extraido/")[-1] for p in resultado["xmls"]] == [
+        "2024/02/c.xml",
+        "2024/janeiro/a.xml",
+    ]
+
+
+def test_sincronizacao_da_empresa_sem_mudancas_faz_uma_chamada(tmp_path):
+    drive = FakeDriveMudancas()
+    drive.gravar("raiz", "Empresa Á", "principal", pasta=True)
+    drive.gravar("a", "a.xml", "raiz", _nfe(0))
+
+    def sincronizar():
+        drive.chamadas.clear()
+        return gdu.sincronizar_empresa_incremental(
+            drive, "principal", "Empresa Á", por_mudancas=True,
+            cache_dir=str(tmp_path), fabrica_servico=lambda: drive,
+        )
+
+    assert sincronizar()["baixados"] == ["a.xml"]
+    for _ in range(2):
+        resultado = sincronizar()
+        assert drive.chamadas == ["changes.list"]
+        assert len(resultado["xmls"]) == 1
+
+
+class FakeDriveSomenteLeitura(FakeDriveMudancas):
+    """Drive que recusa gravações, como um serviço com ``drive.readonly``."""
+
+    def _recusar(self, *args, **kwargs):
+        self.chamadas.append("files.recusado")
+        raise gdu.HttpError(Response({"status": 403}), b"insufficientPermissions")
+
+    update = create = _recusar
+
+
+def test_falha_ao_gravar_indice_nao_interrompe_a_sincronizacao(tmp_path, caplog):
+    drive = FakeDriveSomenteLeitura()
+    drive.gravar("a", "a.xml", "raiz", _nfe(0))
+
+    resultado = gdu.sincronizar_por_mudancas(
+        drive, "raiz", str(tmp_path), fabrica_servico=lambda: drive
+    )
+
+    assert resultado["baixados"] == ["a.xml"] and resultado["erros"] == []
+    assert "files.recusado" in drive.chamadas
+    assert "Não foi possível gravar o índice de raiz" in caplog.text
+
+    drive.gravar("b", "b.xml", "raiz", _nfe(1))
+    resultado = gdu.sincronizar_por_mudancas(
+        drive, "raiz", str(tmp_path), fabrica_servico=lambda: drive
+    )
+    assert resultado["baixados"] == ["b.xml"]
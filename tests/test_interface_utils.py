@@ -0,0 +1,28 @@
+import pandas as pd
+import streamlit as st
+
+from utils import interface_utils
+
+
+def test_sessao_guarda_apenas_a_versao_mais_recente_de_cada_arquivo():
+    st.session_state.pop(interface_utils.CHAVE_ARQUIVOS_SESSAO, None)
+    gerados = []
+
+    def _baixar(nome, n):
+        df = pd.DataFrame({"n": [n]})
+        return interface_utils.conteudo_sob_demanda(
+            nome, lambda: gerados.append((nome, n)) or bytes([n]), df
+        )()
+
+    assert _baixar("a.xlsx", 1) == bytes([1])
+    assert _baixar("a.xlsx", 1) == bytes([1])
+    assert _baixar("b.xlsx", 1) == bytes([1])
+    assert _baixar("a.xlsx", 2) == bytes([2])
+
+    assert gerados == [("a.xlsx", 1), ("b.xlsx", 1), ("a.xlsx", 2)]
+    guardados = st.session_state[interface_utils.CHAVE_ARQUIVOS_SESSAO]
+    assert {nome: conteudo for nome, (_, conteudo) in guardados.items()} == {
+        "a.xlsx": bytes([2]),
+        "b.xlsx": bytes([1]),
+    }
+    st.session_state.pop(interface_utils.CHAVE_ARQUIVOS_SESSAO, None)
@@ -0,0 +1,62 @@
+import json
+import tracemalloc
+
+import modules.estoque_veiculos as ev
+from utils.metricas_utils import MedidorEtapas, coletar_metricas, contar, etapa
+
+
+def test_etapas_sem_medidor_nao_registram():
+    with etapa("solta", entrada=[1, 2]) as medida:
+        assert medida.saida([1]) == [1]
+    contar("nada")
+
+
+def test_etapas_registram_linhas_e_pico_das_internas():
+    tracemalloc.start()
+    try:
+        with coletar_metricas() as medidor:
+            with etapa("externa", entrada=[1, 2, 3]) as externa:
+                with etapa("interna"):
+                    bloco = bytearray(4 * 1024 * 1024)
+                    del bloco
+                externa.saida([1])
+            contar("itens", 3)
+    finally:
+        tracemalloc.stop()
+
+    interna, externa = medidor.etapas
+    assert (externa.nome, externa.linhas_entrada, externa.linhas_saida) == ("externa", 3, 1)
+    assert interna.pico_alocado_bytes >= 4_000_000
+    assert externa.pico_alocado_bytes >= interna.pico_alocado_bytes
+    assert medidor.contadores == {"itens": 3}
+
+
+def test_formatos_json_e_prometheus(tmp_path):
+    medidor = MedidorEtapas()
+    for _ in range(2):
+        with coletar_metricas(medidor), etapa('exportacao "a".xlsx', entrada=[1, 2]):
+            pass
+    medidor.contar("xmls", 5)
+
+    medidor.salvar(str(tmp_path / "m.json"))
+    dados = json.loads((tmp_path / "m.json").read_text(encoding="utf-8"))
+    assert [e["linhas_entrada"] for e in dados["etapas"]] == [2, 2]
+    assert dados["contadores"] == {"xmls": 5}
+
+    medidor.salvar(str(tmp_path / "m.prom"))
+    texto = (tmp_path / "m.prom").read_text(encoding="utf-8")
+    assert "# TYPE nfe_etapa_segundos gauge" in texto
+    assert texto.count('nfe_etapa_segundos{etapa="exportacao \\"a\\".xlsx"}') == 1
+    assert 'nfe_contador_total{nome="xmls"} 5' in texto
+
+
+def test_processar_xmls_mede_as_etapas(lote_nfe):
+    caminhos = lote_nfe(3)
+
+    with coletar_metricas() as medidor:
+        ev.processar_xmls(caminhos, "12345678000199", erros=[], executor="serial")
+
+    etapas = {e.nome: e for e in medidor.etapas}
+    assert list(etapas) == ["triagem", "parse", "classificacao", "configurar_planilha"]
+    assert (etapas["parse"].linhas_entrada, etapas["parse"].linhas_saida) == (3, 3)
+    assert medidor.contadores["itens"] == 3
@@ -1,19 +1,25 @@
 import pandas as pd
 from pages import painel
+from utils import interface_utils
 
 
-def test_render_relatorios_uses_fiscal_generator(monkeypatch):
-    calls = {"count": 0}
+def _clicar(label, data=None, **kwargs):
+    """Simula o clique: o Streamlit só chama ``data`` quando é callable."""
+    if callable(data):
+        data()
 
+
+def _preparar(monkeypatch, calls, download_button):
     def fake_generator(df, buffer, codigo_por_chassi=None):
         calls["count"] += 1
         assert "Valor Produtos" in df.columns
 
+    painel.st.session_state.pop(interface_utils.CHAVE_ARQUIVOS_SESSAO, None)
     monkeypatch.setattr(painel, "gerar_relatorio_fiscal_excel", fake_generator)
     monkeypatch.setattr(painel, "_mostrar_kpis", lambda k: None)
     monkeypatch.setattr(painel.st, "subheader", lambda *a, **k: None)
     monkeypatch.setattr(painel.st, "dataframe", lambda *a, **k: None)
-    monkeypatch.setattr(painel.st, "download_button", lambda *a, **k: None)
+    monkeypatch.setattr(painel.st, "download_button", download_button)
 
     painel.st.session_state.df_estoque = pd.DataFrame({
         "Situação": ["Vendido"],
@@ -29,6 +35,27 @@ def test_render_relatorios_uses_fiscal_generator(monkeypatch):
     painel.st.session_state.df_resumo = pd.DataFrame()
     painel.st.session_state.df_alertas = pd.DataFrame()
 
+
+def test_render_relatorios_uses_fiscal_generator(monkeypatch):
+    calls = {"count": 0}
+    _preparar(monkeypatch, calls, _clicar)
+
     painel.render_relatorios()
 
     assert calls["count"] == 1
+
+
+def test_render_relatorios_gera_arquivos_apenas_no_clique(monkeypatch):
+    calls = {"count": 0}
+    botoes = []
+    _preparar(monkeypatch, calls, lambda label, data=None, **k: botoes.append(data))
+
+    painel.render_relatorios()
+    assert calls["count"] == 0
+    assert botoes and all(callable(b) for b in botoes)
+
+    # Reexecução com os mesmos dados reaproveita o conteúdo memoizado
+    painel.render_relatorios()
+    for data in botoes:
+        data()
+    assert calls["count"] == 1
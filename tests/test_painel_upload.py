@@ -0,0 +1,71 @@
+import io
+import zipfile
+from pathlib import Path
+
+from pages import painel
+
+
+class _Upload(io.BytesIO):
+    def __init__(self, nome, dados, file_id):
+        super().__init__(dados)
+        self.name = nome
+        self.size = len(dados)
+        self.file_id = file_id
+
+
+class _Barra:
+    def progress(self, *args, **kwargs):
+        pass
+
+    def empty(self):
+        pass
+
+
+def _zip(membros):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        for nome, conteudo in membros:
+            zf.writestr(nome, conteudo)
+    return buffer.getvalue()
+
+
+def _relativo(caminho, upload_dir):
+    """Caminho dentro da subpasta do upload."""
+    return "/".join(Path(caminho).relative_to(upload_dir).parts[1:])
+
+
+def test_upload_manual_deduplica_e_nao_regrava(monkeypatch, tmp_path):
+    avisos = []
+    monkeypatch.setattr(painel.st, "progress", lambda *a, **k: _Barra())
+    monkeypatch.setattr(painel.st, "info", avisos.append)
+    painel.st.session_state.upload_dir = str(tmp_path)
+    painel.st.session_state.uploads_armazenados = {}
+
+    arquivos = [
+        _Upload("notas.zip", _zip([("n/1.xml", "<a/>"), ("n/2.xml", "<b/>"), ("n/3.xml", "<a/>")]), "z"),
+        _Upload("avulsa.xml", b"<b/>", "x"),
+        _Upload("nova.xml", b"<c/>", "y"),
+    ]
+    paths = painel._upload_manual(arquivos)
+
+    assert [_relativo(p, tmp_path) for p in paths] == ["n/1.xml", "n/2.xml", "nova.xml"]
+    assert avisos == ["2 XML(s) com conteúdo repetido ignorado(s)"]
+
+    Path(paths[2]).write_bytes(b"alterado")
+    assert painel._upload_manual(arquivos) == paths
+    assert Path(paths[2]).read_bytes() == b"alterado"
+
+
+def test_zips_com_membros_de_mesmo_nome_nao_se_sobrescrevem(monkeypatch, tmp_path):
+    monkeypatch.setattr(painel.st, "progress", lambda *a, **k: _Barra())
+    monkeypatch.setattr(painel.st, "info", lambda *a: None)
+    painel.st.session_state.upload_dir = str(tmp_path)
+    painel.st.session_state.uploads_armazenados = {}
+
+    primeiro = _Upload("janeiro.zip", _zip([("nota.xml", "<janeiro/>")]), "a")
+    segundo = _Upload("fevereiro.zip", _zip([("nota.xml", "<fevereiro/>")]), "b")
+    painel._upload_manual([primeiro])
+    paths = painel._upload_manual([primeiro, segundo])
+
+    assert len(paths) == 2
+    assert [Path(p).read_text() for p in paths] == ["<janeiro/>", "<fevereiro/>"]
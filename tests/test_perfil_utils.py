@@ -0,0 +1,55 @@
+import pstats
+import tracemalloc
+
+import pytest
+
+from utils.perfil_utils import perfilar
+
+
+def _trabalho():
+    return [str(n) * 10 for n in range(20_000)]
+
+
+def test_perfil_grava_artefatos_e_resumos(tmp_path):
+    with perfilar(str(tmp_path), cpu=True, memoria=True, top=5) as resultado:
+        dados = _trabalho()
+
+    assert sorted(p.rsplit("/", 1)[-1] for p in resultado.arquivos) == [
+        "memoria.snapshot", "memoria.txt", "perfil.prof", "perfil.txt",
+    ]
+    assert "_trabalho" in resultado.cpu
+    assert "test_perfil_utils.py" in resultado.memoria
+    assert pstats.Stats(str(tmp_path / "perfil.prof")).total_calls > 0
+    assert tracemalloc.Snapshot.load(str(tmp_path / "memoria.snapshot")).traces
+    assert not tracemalloc.is_tracing()
+    del dados
+
+
+def test_perfil_mantem_tracemalloc_ja_ativo_e_grava_em_erro(tmp_path):
+    tracemalloc.start()
+    try:
+        with pytest.raises(ValueError):
+            with perfilar(str(tmp_path), cpu=False, memoria=True) as resultado:
+                raise ValueError("falhou")
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+    assert resultado.cpu is None
+    assert (tmp_path / "memoria.txt").exists()
+
+
+def test_painel_perfila_quando_ativado():
+    from pages import painel
+
+    painel.st.session_state.perfil = None
+    painel.st.session_state.perfil_cpu = True
+    painel.st.session_state.perfil_memoria = False
+    try:
+        with painel._perfil_opcional():
+            _trabalho()
+    finally:
+        painel.st.session_state.perfil_cpu = False
+
+    assert "_trabalho" in painel.st.session_state.perfil.cpu
+    with painel._perfil_opcional():
+        pass
@@ -0,0 +1,257 @@
+import hashlib
+import io
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+from httplib2 import Response
+
+import modules.estoque_veiculos as ev
+from modules.pipeline_drive import (
+    _criar_executor,
+    processar_zip_drive,
+    processar_zip_empresa_drive,
+)
+from utils.drive_utils import DownloadIncompleto
+
+class _NaoPosicionavel(io.RawIOBase):
+    """Força o ``zipfile`` a gravar descritores de dados (como em ZIPs gerados em fluxo)."""
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def writable(self):
+        return True
+
+    def write(self, dados):
+        return self.buffer.write(dados)
+
+
+def _zip(xmls, metodo=zipfile.ZIP_DEFLATED, em_fluxo=False):
+    destino = _NaoPosicionavel() if em_fluxo else io.BytesIO()
+    with zipfile.ZipFile(destino, "w", compression=metodo) as zf:
+        zf.writestr("leia-me.txt", "ignorado")
+        for nome, conteudo in xmls.items():
+            zf.writestr(nome, conteudo)
+    return (destino.buffer if em_fluxo else destino).getvalue()
+
+
+def _xmls(nfe_xml, quantidade=6):
+    return {f"notas/nfe{n}.xml": nfe_xml(n) for n in range(1, quantidade + 1)}
+
+
+class _ServicoDrive:
+    """Atende ``get_media`` com requisições ``Range`` sobre ``conteudo``."""
+
+    def __init__(self, conteudo):
+        self.conteudo = conteudo
+        self.uri = "https://fake/zip"
+        self.headers = {}
+        self.http = self
+
+    def files(self):
+        return self
+
+    def get_media(self, fileId):
+        return self
+
+    def request(self, uri, method="GET", headers=None, **kwargs):
+        inicio, fim = map(int, headers["range"][len("bytes="):].split("-"))
+        parte = self.conteudo[inicio:fim + 1]
+        return Response(
+            {
+                "status": 206,
+                "content-range": f"bytes {inicio}-{inicio + len(parte) - 1}/{len(self.conteudo)}",
+            }
+        ), parte
+
+
+def _arquivo(conteudo, **extra):
+    return {
+        "id": "zip1",
+        "name": "xmls.zip",
+        "size": str(len(conteudo)),
+        "md5Checksum": hashlib.md5(conteudo).hexdigest(),
+        **extra,
+    }
+
+
+@pytest.mark.parametrize(
+    "metodo,em_fluxo",
+    [
+        (zipfile.ZIP_DEFLATED, False),
+        (zipfile.ZIP_DEFLATED, True),
+        (zipfile.ZIP_STORED, True),  # exige o diretório central
+    ],
+)
+def test_pipeline_equivale_ao_processamento_sequencial(tmp_path, metodo, em_fluxo, nfe_xml):
+    conteudo = _zip(_xmls(nfe_xml), metodo, em_fluxo)
+    progresso = []
+
+    xmls, df = processar_zip_drive(
+        _ServicoDrive(conteudo),
+        _arquivo(conteudo),
+        str(tmp_path / "xmls.zip"),
+        str(tmp_path / "xmls"),
+        "12345678000199",
+        max_workers=2,
+        usar_processos=False,
+        tamanho_bloco=500,
+        progresso=progresso.append,
+    )
+
+    assert [p.split("xmls/")[-1] for p in xmls] == sorted(_xmls(nfe_xml))
+    assert progresso == list(range(1, 7))
+    esperado = ev.processar_xmls(xmls, "12345678000199", erros=[])
+    assert df.equals(esperado)
+
+
+def test_pipeline_com_processos(tmp_path, nfe_xml):
+    conteudo = _zip(_xmls(nfe_xml, 3))
+
+    xmls, df = processar_zip_drive(
+        _ServicoDrive(conteudo),
+        _arquivo(conteudo),
+        str(tmp_path / "xmls.zip"),
+        str(tmp_path / "xmls"),
+        "12345678000199",
+        max_workers=2,
+        usar_processos=True,
+    )
+
+    assert len(xmls) == 3
+    assert len(df) == 3
+
+
+def test_executor_padrao_depende_do_backend(monkeypatch):
+    monkeypatch.setattr(ev, "BACKEND_XML", "lxml")
+    with _criar_executor(2, None) as executor:
+        assert isinstance(executor, ThreadPoolExecutor)
+
+    monkeypatch.setattr(ev, "BACKEND_XML", "etree")
+    with _criar_executor(2, None) as executor:
+        assert isinstance(executor, ProcessPoolExecutor)
+        # Sem fork: as threads do pipeline já estão rodando
+        assert executor._mp_context.get_start_method() in ("forkserver", "spawn")
+
+
+def test_pipeline_md5_divergente(tmp_path, nfe_xml):
+    conteudo = _zip(_xmls(nfe_xml, 2))
+
+    with pytest.raises(DownloadIncompleto):
+        processar_zip_drive(
+            _ServicoDrive(conteudo),
+            _arquivo(conteudo, md5Checksum="0" * 32),
+            str(tmp_path / "xmls.zip"),
+            str(tmp_path / "xmls"),
+            "12345678000199",
+            usar_processos=False,
+            tamanho_bloco=256,
+        )
+
+
+def test_pipeline_empresa_usa_cache(monkeypatch, tmp_path, nfe_xml):
+    import modules.pipeline_drive as pd_mod
+
+    conteudo = _zip(_xmls(nfe_xml, 2))
+    servico = _ServicoDrive(conteudo)
+    monkeypatch.setenv("DRIVE_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(
+        pd_mod,
+        "selecionar_zip_empresa",
+        lambda s, p, n: _arquivo(conteudo, modifiedTime="2024-01-01T00:00:00Z"),
+    )
+
+    xmls, df = processar_zip_empresa_drive(
+        servico, "raiz", "Empresa", str(tmp_path / "d"), "12345678000199", usar_processos=False
+    )
+    servico.conteudo = b""  # um novo download falharia
+    xmls_cache, df_cache = processar_zip_empresa_drive(
+        servico, "raiz", "Empresa", str(tmp_path / "d"), "12345678000199", erros=[]
+    )
+
+    assert xmls == xmls_cache
+    assert all(p.startswith(str(tmp_path / "d")) for p in xmls)
+    assert df.equals(df_cache)
+
+
+def test_pipeline_ignora_chave_repetida(tmp_path, nfe_xml):
+    xmls = _xmls(nfe_xml, 3)
+    xmls["notas/copia.xml"] = xmls["notas/nfe2.xml"]
+    conteudo = _zip(xmls)
+    duplicadas = []
+
+    caminhos, df = processar_zip_drive(
+        _ServicoDrive(conteudo),
+        _arquivo(conteudo),
+        str(tmp_path / "xmls.zip"),
+        str(tmp_path / "xmls"),
+        "12345678000199",
+        usar_processos=False,
+        duplicadas=duplicadas,
+    )
+
+    assert len(caminhos) == 4
+    assert [d.rsplit("/", 1)[-1] for d in duplicadas] == ["copia.xml"]
+    assert len(df) == 3
+    assert df["CHAVE XML"].is_unique
+
+
+def test_pipeline_registra_cancelamentos_e_ignora_outros(tmp_path, nfe_xml):
+    xmls = _xmls(nfe_xml, 2)
+    xmls["eventos/canc.xml"] = (
+        '<procEventoNFe xmlns="http://www.portalfiscal.inf.br/nfe"><evento><infEvento>'
+        f"<chNFe>{2:044d}</chNFe><tpEvento>110111</tpEvento></infEvento></evento>"
+        "<retEvento><infEvento><cStat>135</cStat></infEvento></retEvento></procEventoNFe>"
+    )
+    xmls["outros/cte.xml"] = "<cteProc><CTe/></cteProc>"
+    conteudo = _zip(xmls)
+    canceladas = set()
+
+    caminhos, df = processar_zip_drive(
+        _ServicoDrive(conteudo),
+        _arquivo(conteudo),
+        str(tmp_path / "xmls.zip"),
+        str(tmp_path / "xmls"),
+        "12345678000199",
+        usar_processos=False,
+        canceladas=canceladas,
+    )
+
+    assert len(caminhos) == 4
+    assert canceladas == {f"{2:044d}"}
+    assert len(df) == 2
+
+
+def test_pipeline_usa_quarentena(tmp_path, nfe_xml):
+    from utils.quarentena_xml import Quarentena
+
+    xmls = {**_xmls(nfe_xml, 2), "notas/quebrado.xml": "<NFe><infNFe>"}
+    conteudo = _zip(xmls)
+    quarentena = Quarentena()
+
+    def _executar(pasta):
+        erros = []
+        _, df = processar_zip_drive(
+            _ServicoDrive(conteudo),
+            _arquivo(conteudo),
+            str(tmp_path / f"{pasta}.zip"),
+            str(tmp_path / pasta),
+            "12345678000199",
+            erros,
+            max_workers=2,
+            usar_processos=False,
+            quarentena=quarentena,
+        )
+        return df, erros
+
+    df, erros = _executar("primeira")
+    assert len(df) == 2
+    assert len(quarentena.relatorio()) == 1 and erros[0].startswith("ParseError")
+
+    df, erros = _executar("segunda")
+    assert len(df) == 2
+    assert erros == [
+        f"Em quarentena: {tmp_path / 'segunda' / 'notas' / 'quebrado.xml'} -> "
+        + quarentena.relatorio()[0]["Motivo"]
+    ]
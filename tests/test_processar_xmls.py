@@ -1,6 +1,10 @@
+import logging
 import os
 import sys
+import time
+
 import pandas as pd
+import pytest
 
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.insert(0, ROOT)
@@ -11,7 +15,7 @@ import modules.estoque_veiculos as ev
 def test_processar_xmls_uses_configurador(monkeypatch):
     called = {"called": False}
 
-    def fake_extrair(_, erros=None):
+    def fake_extrair(_, erros=None, quarentena=None, contadores=None):
         return [{
             "Emitente CNPJ/CPF": "111",
             "Destinatário CNPJ/CPF": "222",
@@ -103,3 +107,154 @@ def test_processar_xmls_filters_columns(tmp_path):
     ]
     assert list(df.columns) == expected_cols
 
+
+
+def _nfe_nome(texto, encoding):
+    return (
+        f'<?xml version="1.0" encoding="{encoding}"?>'
+        f'<NFe><infNFe><emit><xNome>{texto}</xNome></emit></infNFe></NFe>'
+    )
+
+
+def test_parse_respeita_codificacao_declarada():
+    tree, err = ev.parse_conteudo_xml(_nfe_nome("Peças", "ISO-8859-1").encode("latin-1"))
+    assert err is None
+    assert tree.findtext(".//xNome") == "Peças"
+
+
+def test_parse_religa_latin1_em_xml_declarado_utf8():
+    tree, err = ev.parse_conteudo_xml(_nfe_nome("Peças", "UTF-8").encode("latin-1"))
+    assert err is None
+    assert tree.findtext(".//xNome") == "Peças"
+
+
+def test_parse_erro_de_sintaxe_nao_tenta_outra_codificacao():
+    tree, err = ev.parse_conteudo_xml(b"<NFe><infNFe></NFe>", "x.xml")
+    assert tree is None
+    assert err.startswith("ParseError: x.xml")
+
+
+def test_safe_parse_xml_com_mmap(tmp_path, monkeypatch):
+    caminho = tmp_path / "grande.xml"
+    caminho.write_bytes(_nfe_nome("Veículo", "UTF-8").encode("utf-8"))
+    monkeypatch.setattr(ev, "LIMITE_MMAP_BYTES", 1)
+
+    tree, err = ev.safe_parse_xml(str(caminho))
+    assert err is None
+    assert tree.findtext(".//xNome") == "Veículo"
+
+    assert ev.safe_parse_xml(str(tmp_path / "nao_existe.xml"))[1].startswith("Não encontrado")
+
+
+def test_executores_equivalentes(tmp_path, lote_nfe):
+    caminhos = lote_nfe(12)
+    esperado = ev.processar_xmls(caminhos, "12345678000199", erros=[], executor="serial")
+
+    for executor in ("thread", "process", "auto"):
+        erros = []
+        df = ev.processar_xmls(
+            caminhos + [str(tmp_path / "faltando.xml")],
+            "12345678000199",
+            erros=erros,
+            executor=executor,
+            max_workers=2,
+        )
+        assert df.equals(esperado), executor
+        assert erros == [f"Não encontrado: {tmp_path / 'faltando.xml'}"], executor
+
+    with pytest.raises(ValueError):
+        ev.processar_xmls(caminhos, "1", executor="gpu")
+
+
+def test_backends_produzem_o_mesmo_resultado(lote_nfe, monkeypatch):
+    caminhos = lote_nfe(3)
+    monkeypatch.setattr(ev, "BACKEND_XML", "etree")
+    com_etree = ev.processar_xmls(caminhos, "12345678000199", erros=[])
+    monkeypatch.setattr(ev, "BACKEND_XML", "lxml")
+    com_lxml = ev.processar_xmls(caminhos, "12345678000199", erros=[])
+    assert com_lxml.equals(com_etree)
+
+
+def test_escolher_executor_pelo_tempo_estimado(monkeypatch):
+    monkeypatch.setattr(ev, "_metodo_inicio_processos", lambda: "fork")
+    mb = 1024 * 1024
+    # Pouco trabalho: não compensa paralelizar
+    assert ev.escolher_executor(1e-7, 0.5, mb, 100, 4, "lxml") == "serial"
+    # Sem CPUs extras
+    assert ev.escolher_executor(1e-6, 0.5, 100 * mb, 10000, 1, "lxml") == "serial"
+    # Parse dominante e lote médio: threads evitam o custo dos processos
+    assert ev.escolher_executor(1e-7, 0.9, 4 * mb, 500, 4, "lxml") == "thread"
+    # Sem lxml as threads não ajudam
+    assert ev.escolher_executor(1e-7, 0.9, 4 * mb, 500, 4, "etree") == "process"
+    # Lote grande: processos aceleram também a extração
+    assert ev.escolher_executor(1e-6, 0.3, 100 * mb, 20000, 4, "lxml") == "process"
+
+
+def test_regex_recebe_texto_limitado(monkeypatch):
+    monkeypatch.setitem(ev.TAMANHO_TEXTO_REGEX, "Cor", 100)
+    assert ev.extrair_info_com_regex("CARRO COR: AZUL", "Cor") == "AZUL"
+    assert ev.extrair_info_com_regex("X" * 200 + " COR: AZUL", "Cor") is None
+
+
+def test_xml_lento_abandonado_sem_parar_os_demais(lote_nfe, monkeypatch):
+    caminhos = lote_nfe(4)
+    lento = caminhos[1]
+    with open(lento, encoding="utf-8") as f:
+        conteudo = f.read().replace("CARRO XYZ", "LENTO")
+    with open(lento, "w", encoding="utf-8") as f:
+        f.write(conteudo)
+    limpar = ev.limpar_texto
+
+    def _limpar_texto(texto):
+        if texto and texto.startswith("LENTO"):
+            time.sleep(0.3)
+        return limpar(texto)
+
+    monkeypatch.setattr(ev, "limpar_texto", _limpar_texto)
+    monkeypatch.setattr(ev, "TEMPO_MAXIMO_ARQUIVO_S", 0.1)
+
+    for executor in ("serial", "thread"):
+        erros = []
+        df = ev.processar_xmls(
+            caminhos, "12345678000199", erros=erros, executor=executor, max_workers=2
+        )
+        assert len(df) == 3, executor
+        assert len(erros) == 1 and erros[0].startswith(f"TempoExcedido: {lento}"), executor
+
+
+def test_extracao_resume_contadores_em_uma_linha(lote_nfe, caplog):
+    caminhos = lote_nfe(3)
+    with caplog.at_level(logging.INFO, logger=ev.log.name):
+        ev.processar_xmls(caminhos, "12345678000199", erros=[], executor="serial", leitores=0)
+
+    mensagens = [r.getMessage() for r in caplog.records if r.name == ev.log.name]
+    resumos = [m for m in mensagens if m.startswith("Extração:")]
+    assert resumos == ["Extração: 3 XMLs; 3 itens; 0 de alto valor; campos ausentes: Placa=3"]
+    assert not any("ausente no item" in m or "Processando XML" in m for m in mensagens)
+
+    contadores = ev.Counter()
+    ev.extrair_dados_xml(caminhos[0], [], contadores=contadores)
+    assert contadores["itens"] == 1 and contadores["ausente:Placa"] == 1
+
+
+def test_relatorios_excluem_notas_canceladas(tmp_path):
+    chave_venda = "1" * 44
+    df = pd.DataFrame(
+        {
+            "Tipo Nota": ["Entrada", "Saída"],
+            "Chassi": ["ABCDEFGH123456789"] * 2,
+            "Placa": ["AAA1234"] * 2,
+            "Valor Item": [100.0, 120.0],
+            "ICMS Valor": [10.0, 12.0],
+            "Data Emissão": [pd.Timestamp("2023-01-01"), pd.Timestamp("2023-01-10")],
+            "Tipo Produto": ["Veículo"] * 2,
+            "CHAVE XML": ["NFe" + "2" * 44, "NFe" + chave_venda],
+        }
+    )
+
+    gerados = ev.exportar_relatorios(
+        df, str(tmp_path / "saida.csv.gz"), "csv.gz", canceladas={chave_venda}
+    )
+
+    estoque = pd.read_csv(next(c for c in gerados if "_estoque" in c))
+    assert estoque["Situação"].tolist() == ["Em Estoque"]
@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+import modules.estoque_veiculos as ev
+from utils.quarentena_xml import Quarentena, resumo_conteudo
+
+QUEBRADO = b"<NFe><infNFe>"
+
+
+def _arquivos(tmp_path, nfe_xml):
+    caminhos = []
+    for nome, conteudo in [
+        ("ok.xml", nfe_xml(1, dia=1).encode()),
+        ("quebrado.xml", QUEBRADO),
+    ]:
+        (tmp_path / nome).write_bytes(conteudo)
+        caminhos.append(str(tmp_path / nome))
+    return caminhos
+
+
+def test_quarentena_persistida_e_liberada(tmp_path):
+    arquivo = str(tmp_path / "q" / "quarentena.json")
+    quarentena = Quarentena(arquivo)
+    resumo = resumo_conteudo(QUEBRADO)
+    quarentena.registrar(resumo, "a.xml", "ParseError: a.xml -> x")
+    quarentena.salvar()
+
+    recarregada = Quarentena(arquivo)
+    assert recarregada.motivo(resumo) == "ParseError: a.xml -> x"
+    assert [linha["Arquivo"] for linha in recarregada.relatorio()] == ["a.xml"]
+
+    assert recarregada.liberar() == 1
+    recarregada.salvar()
+    assert json.loads(open(arquivo).read()) == {}
+
+
+@pytest.mark.parametrize("executor", ["serial", "thread", "process"])
+def test_processar_xmls_pula_conteudo_em_quarentena(tmp_path, monkeypatch, executor, nfe_xml):
+    caminhos = _arquivos(tmp_path, nfe_xml)
+    quarentena = Quarentena()
+
+    erros = []
+    ev.processar_xmls(
+        caminhos, "12345678000199", erros=erros, executor=executor, max_workers=2,
+        quarentena=quarentena,
+    )
+    assert erros[0].startswith("ParseError")
+    assert quarentena.motivo(resumo_conteudo(QUEBRADO)) == erros[0]
+
+    # A mesma cópia em outro caminho não passa de novo pelo parse
+    copia = tmp_path / "copia.xml"
+    copia.write_bytes(QUEBRADO)
+    analisados = []
+    parse = ev.parse_conteudo_xml
+    monkeypatch.setattr(
+        ev, "parse_conteudo_xml", lambda d, o="": analisados.append(o) or parse(d, o)
+    )
+    erros = []
+    df = ev.processar_xmls(
+        [caminhos[0], str(copia)], "12345678000199", erros=erros, executor="serial",
+        quarentena=quarentena,
+    )
+    assert len(df) == 1
+    assert analisados == [caminhos[0]]
+    assert erros == [f"Em quarentena: {copia} -> {quarentena.motivo(resumo_conteudo(QUEBRADO))}"]
+
+
+def test_conteudo_corrigido_volta_a_ser_processado(tmp_path, nfe_xml):
+    caminhos = _arquivos(tmp_path, nfe_xml)
+    quarentena = Quarentena()
+    ev.processar_xmls(caminhos, "12345678000199", erros=[], quarentena=quarentena)
+
+    (tmp_path / "quebrado.xml").write_bytes(nfe_xml(2, dia=2).encode())
+    erros = []
+    df = ev.processar_xmls(caminhos, "12345678000199", erros=erros, quarentena=quarentena)
+
+    assert erros == []
+    assert len(df) == 2
@@ -0,0 +1,178 @@
+import io
+import threading
+import time
+import zipfile
+
+import pytest
+from googleapiclient.errors import HttpError
+from httplib2 import Response
+
+import utils.drive_utils as du
+from utils.sincronizacao_drive import sincronizar_empresas
+
+
+def _zip_bytes(nomes):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        for nome in nomes:
+            zf.writestr(nome, "<xml />")
+    return buffer.getvalue()
+
+
+def _erro_http(status, motivo=""):
+    conteudo = (
+        '{"error": {"errors": [{"reason": "%s"}], "message": "erro"}}' % motivo
+    ).encode()
+    return HttpError(Response({"status": status}), conteudo)
+
+
+class _Requisicao:
+    def __init__(self, servico, executar):
+        self._servico = servico
+        self._executar = executar
+
+    def execute(self):
+        return self._servico._chamar(self._executar)
+
+
+class _HttpMidia:
+    def __init__(self, conteudo):
+        self._conteudo = conteudo
+
+    def request(self, uri, method="GET", headers=None, **kwargs):
+        resposta = Response({"status": 200, "content-length": str(len(self._conteudo))})
+        return resposta, self._conteudo
+
+
+class _RequisicaoMidia:
+    def __init__(self, conteudo):
+        self.uri = "https://fake/download"
+        self.headers = {}
+        self.http = _HttpMidia(conteudo)
+
+
+class FakeDrive:
+    """Serviço do Drive em memória: ``raiz/<empresa>/<empresa>.zip``."""
+
+    def __init__(self, empresas, latencia=0.0, falhas=None):
+        self.empresas = empresas
+        self.latencia = latencia
+        self.falhas = list(falhas or [])
+        self.chamadas = 0
+        self.ativas = 0
+        self.max_ativas = 0
+        self._lock = threading.Lock()
+
+    def _chamar(self, executar):
+        with self._lock:
+            self.chamadas += 1
+            self.ativas += 1
+            self.max_ativas = max(self.max_ativas, self.ativas)
+            falha = self.falhas.pop(0) if self.falhas else None
+        try:
+            time.sleep(self.latencia)
+            if falha is not None:
+                raise falha
+            return executar()
+        finally:
+            with self._lock:
+                self.ativas -= 1
+
+    def files(self):
+        return self
+
+    def list(self, q, fields=None, pageToken=None, **kwargs):
+        pai = q.split("'")[1]
+
+        def _executar():
+            if pai == "raiz":
+                arquivos = [{"id": nome, "name": nome} for nome in self.empresas]
+            else:
+                arquivos = [{"id": f"zip:{pai}", "name": f"{pai}.zip"}]
+            return {"files": arquivos}
+
+        return _Requisicao(self, _executar)
+
+    def get_media(self, fileId):
+        empresa = fileId.split(":", 1)[1]
+        return _RequisicaoMidia(_zip_bytes(self.empresas[empresa]))
+
+
+def test_sincroniza_empresas_em_paralelo(tmp_path):
+    fake = FakeDrive(
+        {f"Empresa {i}": [f"nfe{i}.xml"] for i in range(4)}, latencia=0.05
+    )
+
+    resultados = sincronizar_empresas(
+        str(tmp_path),
+        list(fake.empresas),
+        pasta_principal_id="raiz",
+        fabrica_servico=lambda: fake,
+        max_workers=4,
+        chamadas_por_segundo=1000,
+    )
+
+    assert all(r["erro"] is None for r in resultados.values())
+    assert [len(r["xmls"]) for r in resultados.values()] == [1, 1, 1, 1]
+    assert (tmp_path / "Empresa_2" / "Empresa 2" / "nfe2.xml").exists()
+    assert fake.max_ativas > 1
+
+
+def test_falha_de_uma_empresa_nao_interrompe_as_demais(tmp_path):
+    fake = FakeDrive({"A": ["a.xml"]})
+
+    resultados = sincronizar_empresas(
+        str(tmp_path),
+        ["A", "Inexistente"],
+        pasta_principal_id="raiz",
+        fabrica_servico=lambda: fake,
+        chamadas_por_segundo=1000,
+    )
+
+    assert resultados["A"]["erro"] is None
+    assert resultados["Inexistente"]["erro"].startswith("FileNotFoundError")
+
+
+def test_repete_com_backoff_em_429_e_limite_de_taxa(tmp_path):
+    fake = FakeDrive(
+        {"A": ["a.xml"]},
+        falhas=[_erro_http(429), _erro_http(403, "userRateLimitExceeded")],
+    )
+    esperas = []
+
+    resultados = sincronizar_empresas(
+        str(tmp_path),
+        ["A"],
+        pasta_principal_id="raiz",
+        fabrica_servico=lambda: fake,
+        chamadas_por_segundo=1000,
+        dormir=esperas.append,
+    )
+
+    assert resultados["A"]["erro"] is None
+    assert len(esperas) == 2
+    assert 0.5 <= esperas[0] <= 1.0 and 1.0 <= esperas[1] <= 2.0
+
+
+def test_nao_repete_erro_permanente():
+    esperas = []
+
+    def chamada():
+        raise _erro_http(403, "insufficientPermissions")
+
+    with pytest.raises(HttpError):
+        du.executar_com_retentativa(chamada, dormir=esperas.append)
+    assert esperas == []
+
+
+def test_limitador_taxa_respeita_intervalo():
+    agora = [0.0]
+
+    def dormir(segundos):
+        agora[0] += segundos
+
+    limitador = du.LimitadorTaxa(2, capacidade=1, relogio=lambda: agora[0], dormir=dormir)
+    for _ in range(5):
+        limitador.adquirir()
+
+    assert agora[0] == pytest.approx(2.0)
@@ -32,6 +32,33 @@ def test_gerar_estoque_fiscal_uses_valor_item():
     assert df.loc[0, "Valor Venda"] == 120.0
 
 
+
+def test_gerar_estoque_fiscal_ignora_notas_canceladas():
+    chave_venda = "1" * 44
+    df_entrada = pd.DataFrame(
+        {
+            "Chassi": ["ABC123"],
+            "Placa": ["AAA1234"],
+            "Valor Item": [100.0],
+            "Data Emissão": [pd.Timestamp("2023-01-01")],
+            "Tipo Produto": ["Veículo"],
+            "CHAVE XML": ["NFe" + "2" * 44],
+        }
+    )
+    df_saida = pd.DataFrame(
+        {
+            "Chassi": ["ABC123"],
+            "Placa": ["AAA1234"],
+            "Valor Item": [120.0],
+            "Data Emissão": [pd.Timestamp("2023-01-10")],
+            "Tipo Produto": ["Veículo"],
+            "CHAVE XML": ["NFe" + chave_venda],
+        }
+    )
+
+    df = gerar_estoque_fiscal(df_entrada, df_saida, canceladas={chave_venda})
+    assert df["Situação"].tolist() == ["Em Estoque"]
+
 def test_gerar_resumo_mensal_without_empresa_cnpj():
     df = pd.DataFrame(
         {
@@ -0,0 +1,124 @@
+import json
+
+import modules.estoque_veiculos as ev
+from utils.triagem_xml import IndiceChaves, chave_cancelada, triar_conteudo, triar_xmls
+
+CHAVE = "3523" + "0" * 40
+NFE = f"""<?xml version="1.0" encoding="UTF-8"?>
+<NFe xmlns="http://www.portalfiscal.inf.br/nfe">
+  <infNFe versao="4.00" Id="NFe{{chave}}">
+    <ide><nNF>1</nNF><dhEmi>2023-01-02T12:00:00-03:00</dhEmi></ide>
+    <emit><CNPJ>12345678000199</CNPJ></emit>
+    <dest><CNPJ>98765432000188</CNPJ></dest>
+    <det nItem="1"><prod><xProd>CARRO CHASSI 9BWZZZ377VT004251</xProd><CFOP>5102</CFOP><vProd>1000.00</vProd></prod></det>
+    <total><ICMSTot><vNF>1000.00</vNF></ICMSTot></total>
+  </infNFe>
+</NFe>"""
+
+
+def _nfe(chave=CHAVE):
+    return NFE.format(chave=chave)
+
+
+def _proc(chave=CHAVE):
+    corpo = _nfe(chave).split("?>", 1)[1]
+    return (
+        '<?xml version="1.0"?><nfeProc versao="4.00" xmlns="http://www.portalfiscal.inf.br/nfe">'
+        f"{corpo}<protNFe/></nfeProc>"
+    )
+
+
+def _evento(tipo="110111", status="135", chave=CHAVE):
+    return (
+        '<?xml version="1.0"?><procEventoNFe xmlns="http://www.portalfiscal.inf.br/nfe">'
+        f"<evento><infEvento><chNFe>{chave}</chNFe><tpEvento>{tipo}</tpEvento></infEvento></evento>"
+        f"<retEvento><infEvento><cStat>{status}</cStat><chNFe>{chave}</chNFe></infEvento></retEvento>"
+        "</procEventoNFe>"
+    )
+
+
+def test_triagem_pelos_primeiros_bytes():
+    assert triar_conteudo(_nfe().encode()) == ("nfe", CHAVE, False)
+    assert triar_conteudo(_proc().encode()) == ("nfe", CHAVE, True)
+    assert triar_conteudo(_evento().encode()) == ("evento", None, False)
+    assert triar_conteudo(b"<!-- x --><CTe><infCte/></CTe>") == ("outro", None, False)
+
+
+def test_deduplicacao_prefere_nfe_proc(tmp_path):
+    outra = "3523" + "1" * 40
+    arquivos = {
+        "a_nfe.xml": _nfe(),
+        "b_outra.xml": _nfe(outra),
+        "c_proc.xml": _proc(),
+        "d_copia.xml": _nfe(),
+        "e_sem_chave.xml": "<NFe><infNFe/></NFe>",
+    }
+    for nome, conteudo in arquivos.items():
+        (tmp_path / nome).write_text(conteudo, encoding="utf-8")
+    caminhos = [str(tmp_path / nome) for nome in arquivos]
+    duplicadas = []
+
+    mantidos = triar_xmls(caminhos, duplicadas=duplicadas)
+
+    assert [c.rsplit("/", 1)[-1] for c in mantidos] == ["c_proc.xml", "b_outra.xml", "e_sem_chave.xml"]
+    assert sorted(c.rsplit("/", 1)[-1] for c in duplicadas) == ["a_nfe.xml", "d_copia.xml"]
+
+
+def test_indice_persistido_evita_reler_arquivos(tmp_path, monkeypatch):
+    xml = tmp_path / "a.xml"
+    xml.write_text(_nfe(), encoding="utf-8")
+    arquivo = str(tmp_path / "indice" / "chaves.json")
+
+    triar_xmls([str(xml)], IndiceChaves(arquivo))
+    assert json.loads(open(arquivo).read())[str(xml)][2:] == ["nfe", CHAVE, False]
+
+    import utils.triagem_xml as triagem
+
+    monkeypatch.setattr(triagem, "triar_arquivo", lambda c: (_ for _ in ()).throw(AssertionError))
+    assert IndiceChaves(arquivo).triar(str(xml)) == ("nfe", CHAVE, False)
+
+
+def test_processar_xmls_ignora_duplicadas(tmp_path):
+    caminhos = []
+    for nome, conteudo in [("a.xml", _nfe()), ("b.xml", _proc())]:
+        (tmp_path / nome).write_text(conteudo, encoding="utf-8")
+        caminhos.append(str(tmp_path / nome))
+    duplicadas = []
+
+    df = ev.processar_xmls(caminhos, "12345678000199", erros=[], duplicadas=duplicadas)
+
+    assert duplicadas == [caminhos[0]]
+    assert df["CHAVE XML"].tolist() == [f"NFe{CHAVE}"]
+
+
+def test_somente_cancelamento_homologado():
+    assert chave_cancelada(_evento().encode()) == CHAVE
+    assert chave_cancelada(_evento(tipo="110110").encode()) is None  # CC-e
+    assert chave_cancelada(_evento(status="573").encode()) is None
+    assert chave_cancelada(b"<procEventoNFe><evento>") is None
+
+
+def test_pedido_de_cancelamento_sem_retorno_nao_cancela():
+    pedido = (
+        '<envEvento versao="1.00" xmlns="http://www.portalfiscal.inf.br/nfe"><idLote>1</idLote>'
+        f"<evento><infEvento><chNFe>{CHAVE}</chNFe><tpEvento>110111</tpEvento></infEvento></evento>"
+        "</envEvento>"
+    )
+    assert chave_cancelada(pedido.encode()) is None
+
+
+def test_triagem_encaminha_por_raiz(tmp_path):
+    arquivos = {
+        "nota.xml": _nfe(),
+        "cancelamento.xml": _evento(),
+        "cce.xml": _evento(tipo="110110"),
+        "cte.xml": "<cteProc><CTe/></cteProc>",
+    }
+    for nome, conteudo in arquivos.items():
+        (tmp_path / nome).write_text(conteudo, encoding="utf-8")
+    canceladas = set()
+
+    mantidos = triar_xmls([str(tmp_path / n) for n in arquivos], canceladas=canceladas)
+
+    assert mantidos == [str(tmp_path / "nota.xml")]
+    assert canceladas == {CHAVE}
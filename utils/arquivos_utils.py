@@ -0,0 +1,329 @@
+"""Leitura e extração de arquivos ZIP em blocos, sem carregá-los inteiros."""
+
+from __future__ import annotations
+
+import hashlib
+import itertools
+import os
+import queue
+import struct
+import threading
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+ASSINATURA_LOCAL = b"PK\x03\x04"
+ASSINATURAS_FIM = (b"PK\x01\x02", b"PK\x05\x06", b"PK\x06\x06")
+ASSINATURA_DESCRITOR = b"PK\x07\x08"
+_CABECALHO_LOCAL = struct.Struct("<4sHHHHHIIIHH")
+_BLOCO_LEITURA = 64 * 1024
+TAMANHO_BLOCO_COPIA = 1024 * 1024
+
+
+class ZipNaoSequencial(ValueError):
+    """O ZIP usa um recurso que exige o diretório central para ser lido."""
+
+
+class FluxoBlocos:
+    """Arquivo somente leitura alimentado por blocos vindos de outra thread.
+
+    ``alimentar`` bloqueia quando há ``max_blocos`` pendentes, o que aplica
+    contrapressão a quem produz os dados (por exemplo, o download). Um erro
+    passado a ``encerrar`` é relançado para quem estiver lendo.
+    """
+
+    def __init__(self, max_blocos: int = 8):
+        self._fila: "queue.Queue" = queue.Queue(maxsize=max_blocos)
+        self._buffer = bytearray()
+        self._fim = False
+        self._erro: Optional[BaseException] = None
+        self.cancelado = threading.Event()
+
+    def alimentar(self, bloco: bytes) -> None:
+        while True:
+            if self.cancelado.is_set():
+                raise InterruptedError("Leitura do fluxo cancelada")
+            try:
+                self._fila.put(bytes(bloco), timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def encerrar(self, erro: Optional[BaseException] = None) -> None:
+        self._erro = erro
+        while not self.cancelado.is_set():
+            try:
+                self._fila.put(None, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def cancelar(self) -> None:
+        self.cancelado.set()
+
+    def _receber(self) -> bool:
+        if self._fim:
+            return False
+        bloco = self._fila.get()
+        if bloco is None:
+            self._fim = True
+            if self._erro is not None:
+                raise self._erro
+            return False
+        self._buffer += bloco
+        return True
+
+    def read(self, n: int = -1) -> bytes:
+        """Lê até ``n`` bytes; menos que isso apenas no fim do fluxo."""
+        while (n < 0 or len(self._buffer) < n) and self._receber():
+            pass
+        if n < 0:
+            n = len(self._buffer)
+        dados = bytes(self._buffer[:n])
+        del self._buffer[:n]
+        return dados
+
+    def devolver(self, dados: bytes) -> None:
+        """Recoloca ``dados`` no início do fluxo para a próxima leitura."""
+        self._buffer[:0] = dados
+
+    def descartar_restante(self) -> None:
+        """Consome o fluxo até o fim, liberando quem o alimenta."""
+        self._buffer.clear()
+        while self._receber():
+            self._buffer.clear()
+
+
+def _ler_exato(fluxo, n: int) -> bytes:
+    dados = fluxo.read(n)
+    if len(dados) != n:
+        raise ZipNaoSequencial("ZIP truncado")
+    return dados
+
+
+def _tamanhos_zip64(extra: bytes, comprimido: int, descomprimido: int) -> Tuple[int, int, bool]:
+    pos = 0
+    while pos + 4 <= len(extra):
+        tag, tamanho = struct.unpack_from("<HH", extra, pos)
+        if tag == 0x0001:
+            campos = extra[pos + 4:pos + 4 + tamanho]
+            valores = [struct.unpack_from("<Q", campos, i)[0] for i in range(0, len(campos) - 7, 8)]
+            if descomprimido == 0xFFFFFFFF and valores:
+                descomprimido = valores.pop(0)
+            if comprimido == 0xFFFFFFFF and valores:
+                comprimido = valores.pop(0)
+            return comprimido, descomprimido, True
+        pos += 4 + tamanho
+    return comprimido, descomprimido, False
+
+
+def _ler_deflate_ate_o_fim(fluxo) -> bytes:
+    descompressor = zlib.decompressobj(-15)
+    partes = []
+    while not descompressor.eof:
+        bloco = fluxo.read(_BLOCO_LEITURA)
+        if not bloco:
+            raise ZipNaoSequencial("ZIP truncado")
+        partes.append(descompressor.decompress(bloco))
+    fluxo.devolver(descompressor.unused_data)
+    return b"".join(partes)
+
+
+def iterar_zip_em_fluxo(fluxo) -> Iterator[Tuple[str, bytes]]:
+    """Percorre os membros de um ZIP lendo apenas os cabeçalhos locais.
+
+    ``fluxo`` precisa de ``read(n)`` e ``devolver(dados)`` (ver
+    :class:`FluxoBlocos`). Cada arquivo é entregue como ``(nome, conteúdo)``
+    assim que seus bytes chegam; diretórios são ignorados. Recursos que só
+    podem ser resolvidos com o diretório central (criptografia, métodos
+    diferentes de *stored*/*deflate* ou *stored* com descritor de dados)
+    levantam :class:`ZipNaoSequencial`.
+    """
+    while True:
+        assinatura = fluxo.read(4)
+        if not assinatura or assinatura in ASSINATURAS_FIM:
+            return
+        if assinatura != ASSINATURA_LOCAL:
+            raise ZipNaoSequencial("Cabeçalho local inválido")
+        (
+            _, _, flags, metodo, _, _, crc, comprimido, descomprimido, tam_nome, tam_extra,
+        ) = _CABECALHO_LOCAL.unpack(assinatura + _ler_exato(fluxo, _CABECALHO_LOCAL.size - 4))
+        nome_bytes = _ler_exato(fluxo, tam_nome)
+        extra = _ler_exato(fluxo, tam_extra)
+        nome = nome_bytes.decode("utf-8" if flags & 0x800 else "cp437")
+        if flags & 0x1:
+            raise ZipNaoSequencial(f"Membro criptografado: {nome}")
+        if metodo not in (0, 8):
+            raise ZipNaoSequencial(f"Método de compressão {metodo} não suportado: {nome}")
+        comprimido, descomprimido, zip64 = _tamanhos_zip64(extra, comprimido, descomprimido)
+
+        if flags & 0x8:
+            if metodo != 8:
+                raise ZipNaoSequencial(f"Membro sem tamanho no cabeçalho: {nome}")
+            dados = _ler_deflate_ate_o_fim(fluxo)
+            inicio = _ler_exato(fluxo, 4)
+            if inicio == ASSINATURA_DESCRITOR:
+                inicio = _ler_exato(fluxo, 4)
+            crc = struct.unpack("<I", inicio)[0]
+            _ler_exato(fluxo, 16 if zip64 else 8)
+        else:
+            bruto = _ler_exato(fluxo, comprimido)
+            dados = zlib.decompress(bruto, -15) if metodo == 8 else bruto
+
+        if zlib.crc32(dados) != crc:
+            raise ZipNaoSequencial(f"CRC divergente em {nome}")
+        if not nome.endswith("/"):
+            yield nome, dados
+
+
+def caminho_seguro(destino: str, nome: str) -> str:
+    """Retorna o caminho de ``nome`` dentro de ``destino``, bloqueando path traversal."""
+    destino_abs = os.path.abspath(destino)
+    caminho = os.path.abspath(os.path.join(destino, nome))
+    if os.path.commonpath([destino_abs, caminho]) != destino_abs:
+        raise Exception(f"Arquivo malicioso: {nome}")
+    return caminho
+
+
+def copiar_em_blocos(
+    origem: BinaryIO, destino: str, tamanho_bloco: int = TAMANHO_BLOCO_COPIA
+) -> str:
+    """Copia o arquivo aberto ``origem`` para ``destino`` e retorna o SHA-256.
+
+    Apenas um bloco fica em memória por vez; a cópia vai para ``destino +
+    ".part"`` e só substitui ``destino`` quando termina.
+    """
+    parcial = destino + ".part"
+    resumo = hashlib.sha256()
+    try:
+        with open(parcial, "wb") as saida:
+            while True:
+                bloco = origem.read(tamanho_bloco)
+                if not bloco:
+                    break
+                resumo.update(bloco)
+                saida.write(bloco)
+        os.replace(parcial, destino)
+    except BaseException:
+        if os.path.exists(parcial):
+            os.remove(parcial)
+        raise
+    return resumo.hexdigest()
+
+
+def registrar_conteudo(vistos: Dict[str, str], resumo: str, caminho: str) -> bool:
+    """Registra ``caminho`` sob ``resumo``; ``False`` se o conteúdo já foi visto.
+
+    Quando o conteúdo é repetido, ``caminho`` é removido do disco (a menos
+    que seja o próprio arquivo já registrado).
+    """
+    original = vistos.setdefault(resumo, caminho)
+    if os.path.abspath(original) == os.path.abspath(caminho):
+        return True
+    os.remove(caminho)
+    return False
+
+
+def extrair_zip_em_blocos(
+    zip_path: str,
+    destino: str,
+    *,
+    extensoes: Sequence[str] = (".xml",),
+    max_workers: int = 4,
+    vistos: Optional[Dict[str, str]] = None,
+    progresso: Optional[Callable[[int, int], None]] = None,
+    tamanho_bloco: int = TAMANHO_BLOCO_COPIA,
+) -> Tuple[List[str], int]:
+    """Extrai de ``zip_path`` os membros com as ``extensoes`` informadas.
+
+    Cada membro é copiado em blocos (nunca inteiro em memória) por um pool
+    de ``max_workers`` threads, cada uma com seu próprio ``ZipFile``.
+    Membros com conteúdo idêntico a outro já extraído — antes neste ZIP ou
+    em ``vistos`` (SHA-256 → caminho), que é atualizado — são descartados.
+    Retorna os caminhos mantidos, na ordem do ZIP, e o número de
+    duplicados. ``progresso(feitos, total)`` é chamado a cada membro, na
+    thread chamadora.
+    """
+    vistos = {} if vistos is None else vistos
+    with zipfile.ZipFile(zip_path) as zf:
+        # Nomes repetidos no ZIP: vale o último, como numa extração comum
+        por_nome = {
+            info.filename: info
+            for info in zf.infolist()
+            if not info.is_dir() and info.filename.lower().endswith(tuple(extensoes))
+        }
+    membros = list(por_nome.values())
+    caminhos = [caminho_seguro(destino, info.filename) for info in membros]
+    lock = threading.Lock()
+    local = threading.local()
+    abertos: List[zipfile.ZipFile] = []
+
+    def _extrair(indice: int) -> str:
+        zf_thread = getattr(local, "zf", None)
+        if zf_thread is None:
+            zf_thread = local.zf = zipfile.ZipFile(zip_path)
+            with lock:
+                abertos.append(zf_thread)
+        caminho = caminhos[indice]
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        with zf_thread.open(membros[indice]) as origem:
+            return copiar_em_blocos(origem, caminho, tamanho_bloco)
+
+    mantidos: List[str] = []
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            # Os resumos chegam na ordem do ZIP: o primeiro de cada conteúdo é mantido
+            resumos = executor.map(_extrair, range(len(membros)))
+            for feitos, (caminho, resumo) in enumerate(zip(caminhos, resumos), 1):
+                if registrar_conteudo(vistos, resumo, caminho):
+                    mantidos.append(caminho)
+                if progresso is not None:
+                    progresso(feitos, len(membros))
+    finally:
+        for zf_thread in abertos:
+            zf_thread.close()
+    return mantidos, len(membros) - len(mantidos)
+
+
+def _ler_arquivo(caminho: str, limite_bytes: Optional[int]) -> Optional[bytes]:
+    try:
+        with open(caminho, "rb") as f:
+            if limite_bytes is not None and os.fstat(f.fileno()).st_size >= limite_bytes:
+                return None
+            return f.read()
+    except OSError:
+        return None
+
+
+def ler_antecipado(
+    caminhos: Iterable[str],
+    max_workers: int = 4,
+    janela: Optional[int] = None,
+    limite_bytes: Optional[int] = None,
+) -> Iterator[Tuple[str, Optional[bytes]]]:
+    """Entrega ``(caminho, conteúdo)`` na ordem de ``caminhos``, lendo adiante.
+
+    Um pool de ``max_workers`` threads lê os próximos arquivos enquanto o
+    consumidor processa o atual; além dele, no máximo ``janela`` arquivos
+    (padrão: ``4 * max_workers``) ficam lidos ou em leitura. O
+    conteúdo é ``None`` quando o arquivo não pôde ser lido ou tem
+    ``limite_bytes`` ou mais, cabendo ao consumidor tratá-lo por conta
+    própria.
+    """
+    janela = max(1, janela or max_workers * 4)
+    restantes = iter(caminhos)
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="leitura")
+    pendentes: deque = deque()
+    try:
+        for caminho in itertools.islice(restantes, janela):
+            pendentes.append((caminho, executor.submit(_ler_arquivo, caminho, limite_bytes)))
+        while pendentes:
+            caminho, futuro = pendentes.popleft()
+            proximo = next(restantes, None)
+            if proximo is not None:
+                pendentes.append((proximo, executor.submit(_ler_arquivo, proximo, limite_bytes)))
+            yield caminho, futuro.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
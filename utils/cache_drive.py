@@ -0,0 +1,245 @@
+"""Cache local dos ZIPs baixados do Google Drive.
+
+Cada arquivo fica em ``<cache>/<file_id>/`` com o ZIP original, os XMLs
+já extraídos e um ``meta.json`` contendo ``modifiedTime`` e ``md5Checksum``
+informados pelo Drive. Uma entrada só é reaproveitada quando ambos coincidem
+com a listagem atual; o espaço total é limitado descartando as entradas
+acessadas há mais tempo.
+
+O cache fica ativo por padrão (ver :func:`diretorio_cache`). Com
+``destino``, :func:`obter_xmls` e :func:`armazenar` entregam os XMLs em
+``destino`` por hardlink (ou cópia, em outro sistema de arquivos): os
+caminhos devolvidos continuam válidos mesmo que a entrada seja descartada
+depois por outra empresa ou outra sessão. Entradas gravadas aos poucos,
+como as da sincronização incremental, ficam protegidas do descarte com
+:func:`reservar` enquanto são atualizadas.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+log = logging.getLogger(__name__)
+
+ARQUIVO_META = "meta.json"
+PASTA_EXTRAIDOS = "extraido"
+DIRETORIO_PADRAO = os.path.join(tempfile.gettempdir(), "drive_cache_xmls")
+LIMITE_PADRAO_MB = 2048
+
+_lock = threading.Lock()
+# Entradas em uso (caminho absoluto -> contagem), ignoradas por limpar()
+_em_uso: Dict[str, int] = {}
+
+
+def diretorio_cache() -> Optional[str]:
+    """Retorna o diretório do cache ou ``None`` se estiver desativado.
+
+    ``DRIVE_CACHE_DIR`` define o local; definida como vazia, desativa o cache.
+    """
+    valor = os.getenv("DRIVE_CACHE_DIR")
+    if valor is None:
+        return DIRETORIO_PADRAO
+    return valor or None
+
+
+def limite_cache_bytes() -> int:
+    """Tamanho máximo do cache, configurável por ``DRIVE_CACHE_MAX_MB``."""
+    try:
+        return int(float(os.getenv("DRIVE_CACHE_MAX_MB", LIMITE_PADRAO_MB)) * 1024**2)
+    except ValueError:
+        return LIMITE_PADRAO_MB * 1024**2
+
+
+def cacheavel(arquivo: Dict) -> bool:
+    """Indica se o Drive informou os metadados necessários para validar o cache."""
+    return bool(arquivo.get("id") and arquivo.get("modifiedTime") and arquivo.get("md5Checksum"))
+
+
+def ler_meta(entrada: str) -> Optional[Dict]:
+    """Lê o ``meta.json`` da entrada, ou ``None`` se não existir."""
+    try:
+        with open(os.path.join(entrada, ARQUIVO_META), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def gravar_meta(entrada: str, meta: Dict) -> None:
+    """Grava o ``meta.json`` da entrada de forma atômica."""
+    temporario = os.path.join(entrada, f".{ARQUIVO_META}.{uuid.uuid4().hex}")
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(temporario, os.path.join(entrada, ARQUIVO_META))
+
+
+def listar_xmls(pasta: str) -> List[str]:
+    """Lista, em ordem, os ``*.xml`` contidos em ``pasta`` e subpastas."""
+    return sorted(
+        os.path.join(root, f)
+        for root, _, files in os.walk(pasta)
+        for f in files
+        if f.lower().endswith(".xml")
+    )
+
+
+def _tamanho_pasta(pasta: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, f))
+        for root, _, files in os.walk(pasta)
+        for f in files
+    )
+
+
+def _entregar(entrada: str, xmls: List[str], destino: Optional[str]) -> List[str]:
+    """Caminhos dos ``xmls`` da entrada, vinculados em ``destino`` se informado.
+
+    Deve ser chamada com ``_lock``, para que :func:`limpar` não remova a
+    entrada durante a cópia.
+    """
+    pasta = os.path.join(entrada, PASTA_EXTRAIDOS)
+    if destino is None:
+        return [os.path.join(pasta, x) for x in xmls]
+    caminhos = []
+    for xml in xmls:
+        alvo = os.path.join(destino, xml)
+        os.makedirs(os.path.dirname(alvo), exist_ok=True)
+        if os.path.exists(alvo):
+            os.remove(alvo)
+        try:
+            os.link(os.path.join(pasta, xml), alvo)
+        except OSError:
+            shutil.copy2(os.path.join(pasta, xml), alvo)
+        caminhos.append(alvo)
+    return caminhos
+
+
+def entregar(entrada: str, xmls: List[str], destino: Optional[str]) -> List[str]:
+    """Entrega os ``xmls`` (relativos à pasta extraída) de ``entrada`` em ``destino``."""
+    with _lock:
+        return _entregar(entrada, xmls, destino)
+
+
+@contextmanager
+def reservar(entrada: str) -> Iterator[None]:
+    """Impede que :func:`limpar` descarte ``entrada`` enquanto o bloco executa."""
+    chave = os.path.abspath(entrada)
+    with _lock:
+        _em_uso[chave] = _em_uso.get(chave, 0) + 1
+    try:
+        yield
+    finally:
+        with _lock:
+            _em_uso[chave] -= 1
+            if not _em_uso[chave]:
+                del _em_uso[chave]
+
+
+def obter_xmls(
+    cache_dir: str, arquivo: Dict, destino: Optional[str] = None
+) -> Optional[List[str]]:
+    """Retorna os XMLs extraídos de ``arquivo`` se a entrada ainda for válida.
+
+    Com ``destino``, os XMLs são entregues nessa pasta, na mesma estrutura.
+    """
+    if not cacheavel(arquivo):
+        return None
+    entrada = os.path.join(cache_dir, arquivo["id"])
+    with _lock:
+        meta = ler_meta(entrada)
+        if (
+            not meta
+            or meta.get("modifiedTime") != arquivo["modifiedTime"]
+            or meta.get("md5Checksum") != arquivo["md5Checksum"]
+        ):
+            return None
+        xmls = meta.get("xmls")
+        if xmls is None:
+            return None
+        if not all(os.path.exists(os.path.join(entrada, PASTA_EXTRAIDOS, x)) for x in xmls):
+            return None
+        meta["ultimo_acesso"] = time.time()
+        gravar_meta(entrada, meta)
+        caminhos = _entregar(entrada, xmls, destino)
+    log.info("ZIP '%s' inalterado no Drive; usando cache local", arquivo.get("name"))
+    return caminhos
+
+
+def armazenar(
+    cache_dir: str,
+    arquivo: Dict,
+    preencher: Callable[[str, str], None],
+    limite_bytes: Optional[int] = None,
+    destino: Optional[str] = None,
+) -> List[str]:
+    """Cria a entrada de ``arquivo`` e retorna os XMLs extraídos.
+
+    ``preencher(zip_path, pasta_extraidos)`` deve baixar o ZIP e extraí-lo.
+    A entrada é montada numa pasta temporária e só então movida para o
+    lugar definitivo, de modo que uma falha não deixa cache corrompido.
+    Com ``destino``, os XMLs são entregues nessa pasta, na mesma estrutura.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    entrada = os.path.join(cache_dir, arquivo["id"])
+    temporario = os.path.join(cache_dir, f".{arquivo['id']}.{uuid.uuid4().hex}")
+    pasta_extraidos = os.path.join(temporario, PASTA_EXTRAIDOS)
+    os.makedirs(pasta_extraidos)
+    try:
+        preencher(os.path.join(temporario, arquivo["name"]), pasta_extraidos)
+        xmls = listar_xmls(pasta_extraidos)
+        gravar_meta(
+            temporario,
+            {
+                "name": arquivo["name"],
+                "modifiedTime": arquivo.get("modifiedTime"),
+                "md5Checksum": arquivo.get("md5Checksum"),
+                "xmls": [os.path.relpath(x, pasta_extraidos) for x in xmls],
+                "bytes": _tamanho_pasta(temporario),
+                "ultimo_acesso": time.time(),
+            },
+        )
+        with _lock:
+            shutil.rmtree(entrada, ignore_errors=True)
+            os.replace(temporario, entrada)
+            caminhos = _entregar(entrada, ler_meta(entrada)["xmls"], destino)
+    except BaseException:
+        shutil.rmtree(temporario, ignore_errors=True)
+        raise
+    limpar(cache_dir, limite_cache_bytes() if limite_bytes is None else limite_bytes, manter=arquivo["id"])
+    return caminhos
+
+
+def limpar(cache_dir: str, limite_bytes: int, manter: Optional[str] = None) -> List[str]:
+    """Remove as entradas menos usadas até o cache caber em ``limite_bytes``.
+
+    A entrada ``manter`` (a recém-gravada) e as reservadas com
+    :func:`reservar` nunca são removidas. Retorna os IDs descartados.
+    """
+    with _lock:
+        entradas = []
+        for nome in os.listdir(cache_dir):
+            caminho = os.path.join(cache_dir, nome)
+            meta = ler_meta(caminho) if not nome.startswith(".") else None
+            if meta is not None:
+                entradas.append((meta.get("ultimo_acesso", 0), nome, meta.get("bytes", 0)))
+        total = sum(e[2] for e in entradas)
+        removidas = []
+        for _, nome, tamanho in sorted(entradas):
+            if total <= limite_bytes:
+                break
+            if nome == manter or os.path.abspath(os.path.join(cache_dir, nome)) in _em_uso:
+                continue
+            shutil.rmtree(os.path.join(cache_dir, nome), ignore_errors=True)
+            total -= tamanho
+            removidas.append(nome)
+    if removidas:
+        log.info("Cache do Drive: %d entrada(s) descartada(s) por limite de espaço", len(removidas))
+    return removidas
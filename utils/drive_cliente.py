@@ -0,0 +1,172 @@
+"""Cliente do Google Drive compartilhado pelo processo.
+
+``obter_servico`` devolve sempre o mesmo serviço para a mesma chave de
+serviço e escopos: o JSON de ``GCP_SERVICE_ACCOUNT_JSON`` é lido uma única
+vez, o documento de descoberta vem da cópia estática do
+``googleapiclient`` (sem ida à rede) e as requisições usam um pool de
+conexões autenticadas. Assim, cliques repetidos no painel e sincronizações
+concorrentes reaproveitam conexões TLS já abertas e o mesmo token de acesso.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import queue
+import threading
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+import httplib2
+from google.oauth2.service_account import Credentials
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build
+
+ESCOPOS_LEITURA = ("https://www.googleapis.com/auth/drive.readonly",)
+# Para regravar o index_arquivos.json, que nem sempre foi criado pela chave
+ESCOPOS_ESCRITA = ("https://www.googleapis.com/auth/drive",)
+MAX_CONEXOES = 16
+TIMEOUT_SEGUNDOS = 60
+
+_servicos: Dict[Tuple[str, Tuple[str, ...]], object] = {}
+_lock = threading.Lock()
+
+
+class _CredenciaisSincronizadas:
+    """Credenciais compartilhadas entre threads com renovação serializada.
+
+    Apenas uma thread renova o token expirado; as demais esperam e usam o
+    token novo, em vez de cada conexão pedir o seu.
+    """
+
+    def __init__(self, credenciais):
+        self._credenciais = credenciais
+        self._lock = threading.Lock()
+
+    def refresh(self, request) -> None:
+        with self._lock:
+            self._credenciais.refresh(request)
+
+    def before_request(self, request, method, url, headers) -> None:
+        if not self._credenciais.valid:
+            with self._lock:
+                if not self._credenciais.valid:
+                    self._credenciais.refresh(request)
+        self._credenciais.apply(headers)
+
+    def __getattr__(self, nome):
+        return getattr(self._credenciais, nome)
+
+
+class PoolHttp:
+    """Pool de conexões ``AuthorizedHttp`` com a interface de ``httplib2.Http``.
+
+    Cada ``request`` empresta uma conexão livre (a usada mais recentemente,
+    que tende a estar com o TLS aberto) e a devolve ao final; com
+    ``max_conexoes`` em uso, a próxima requisição aguarda uma ser liberada.
+    """
+
+    def __init__(
+        self,
+        credentials,
+        max_conexoes: int = MAX_CONEXOES,
+        fabrica_http: Optional[Callable[[], object]] = None,
+    ):
+        self.credentials = credentials
+        self._fabrica_http = fabrica_http or (
+            lambda: AuthorizedHttp(
+                credentials, http=httplib2.Http(timeout=TIMEOUT_SEGUNDOS)
+            )
+        )
+        self._livres: "queue.LifoQueue" = queue.LifoQueue()
+        self._vagas = threading.BoundedSemaphore(max_conexoes)
+        self.criadas = 0
+        self._lock = threading.Lock()
+
+    def _emprestar(self):
+        self._vagas.acquire()
+        try:
+            return self._livres.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                self.criadas += 1
+            try:
+                return self._fabrica_http()
+            except BaseException:
+                self._vagas.release()
+                raise
+
+    def _devolver(self, http) -> None:
+        self._livres.put(http)
+        self._vagas.release()
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        http = self._emprestar()
+        try:
+            return http.request(uri, method, body=body, headers=headers, **kwargs)
+        finally:
+            self._devolver(http)
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._livres.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def _ler_chave_servico() -> str:
+    raw_json = os.getenv("GCP_SERVICE_ACCOUNT_JSON")
+    if not raw_json:
+        raise EnvironmentError("Variável GCP_SERVICE_ACCOUNT_JSON não definida")
+    return raw_json
+
+
+def _interpretar_chave_servico(raw_json: str) -> dict:
+    try:
+        return json.loads(raw_json)
+    except json.JSONDecodeError as exc:
+        raise ValueError("Conteúdo inválido em GCP_SERVICE_ACCOUNT_JSON") from exc
+
+
+def obter_servico(
+    escopos: Sequence[str] = ESCOPOS_LEITURA, max_conexoes: int = MAX_CONEXOES
+):
+    """Retorna o serviço do Drive v3 em cache para a chave de serviço atual.
+
+    A chave é lida de ``GCP_SERVICE_ACCOUNT_JSON``; mudar a variável (ou os
+    ``escopos``) produz um novo serviço. O JSON só é interpretado quando
+    ainda não há serviço para ele. O objeto retornado pode ser usado por
+    várias threads ao mesmo tempo.
+    """
+    raw_json = _ler_chave_servico()
+    chave = (hashlib.sha256(raw_json.encode("utf-8")).hexdigest(), tuple(escopos))
+    with _lock:
+        servico = _servicos.get(chave)
+        if servico is None:
+            credenciais = _CredenciaisSincronizadas(
+                Credentials.from_service_account_info(
+                    _interpretar_chave_servico(raw_json), scopes=list(escopos)
+                )
+            )
+            servico = build(
+                "drive",
+                "v3",
+                http=PoolHttp(credenciais, max_conexoes),
+                static_discovery=True,
+                cache_discovery=False,
+            )
+            _servicos[chave] = servico
+    return servico
+
+
+def limpar_cache_servicos() -> None:
+    """Descarta os serviços em cache e fecha suas conexões."""
+    with _lock:
+        servicos = list(_servicos.values())
+        _servicos.clear()
+    for servico in servicos:
+        try:
+            servico.close()
+        except Exception:
+            pass
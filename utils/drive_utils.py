@@ -2,44 +2,212 @@
 
 from __future__ import annotations
 
+import hashlib
 import os
 import logging
+import random
+import threading
+import time
 import zipfile
 import unicodedata
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Callable, List, Optional, Tuple
 
-import json
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
+import httplib2
 from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaIoBaseDownload
+
+from . import cache_drive, drive_cliente
 
 
 log = logging.getLogger(__name__)
 
+# Respostas da API que indicam sobrecarga temporária e podem ser repetidas
+STATUS_RETENTATIVA = {429, 500, 502, 503, 504}
+MOTIVOS_LIMITE_403 = {"rateLimitExceeded", "userRateLimitExceeded"}
 
-def criar_servico_drive():
-    """Cria um serviço de acesso ao Google Drive usando ``GCP_SERVICE_ACCOUNT_JSON``.
+# Tamanho padrão de cada requisição de download (``DRIVE_TAMANHO_BLOCO_MB``)
+TAMANHO_BLOCO_MB = 32
 
-    A variável de ambiente deve conter o JSON completo da chave de serviço.
+
+class LimitadorTaxa:
+    """Token bucket que limita as chamadas à API do Drive.
+
+    ``taxa`` é a quantidade de chamadas liberadas por segundo e
+    ``capacidade`` o tamanho máximo da rajada. A mesma instância pode ser
+    compartilhada entre threads.
     """
 
-    scopes = ["https://www.googleapis.com/auth/drive.readonly"]
-    raw_json = os.getenv("GCP_SERVICE_ACCOUNT_JSON")
-    if not raw_json:
-        raise EnvironmentError(
-            "Variável GCP_SERVICE_ACCOUNT_JSON não definida"
-        )
+    def __init__(
+        self,
+        taxa: float,
+        capacidade: Optional[float] = None,
+        relogio: Callable[[], float] = time.monotonic,
+        dormir: Callable[[float], None] = time.sleep,
+    ):
+        if taxa <= 0:
+            raise ValueError("A taxa do limitador deve ser positiva")
+        self.taxa = float(taxa)
+        self.capacidade = float(capacidade or max(1.0, taxa))
+        self._tokens = self.capacidade
+        self._relogio = relogio
+        self._dormir = dormir
+        self._ultimo = relogio()
+        self._lock = threading.Lock()
+
+    def adquirir(self) -> None:
+        """Bloqueia até haver um token disponível e o consome."""
+        while True:
+            with self._lock:
+                agora = self._relogio()
+                self._tokens = min(
+                    self.capacidade, self._tokens + (agora - self._ultimo) * self.taxa
+                )
+                self._ultimo = agora
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                espera = (1 - self._tokens) / self.taxa
+            self._dormir(espera)
+
+
+def _deve_repetir(exc: HttpError) -> bool:
+    """Indica se o erro é transitório (limite de taxa ou falha do servidor)."""
+    status = getattr(exc, "status_code", None) or getattr(exc.resp, "status", None)
     try:
-        info = json.loads(raw_json)
-    except json.JSONDecodeError as exc:
-        raise ValueError(
-            "Conteúdo inválido em GCP_SERVICE_ACCOUNT_JSON"
-        ) from exc
+        status = int(status)
+    except (TypeError, ValueError):
+        return False
+    if status in STATUS_RETENTATIVA:
+        return True
+    if status == 403:
+        detalhes = exc.error_details if isinstance(exc.error_details, list) else []
+        return any(d.get("reason") in MOTIVOS_LIMITE_403 for d in detalhes)
+    return False
+
+
+def _espera_backoff(
+    tentativa: int, espera_base: float = 1.0, espera_maxima: float = 32.0
+) -> float:
+    """Espera exponencial com jitter para a ``tentativa`` (iniciando em 0)."""
+    espera = min(espera_maxima, espera_base * 2 ** tentativa)
+    return espera * (0.5 + random.random() / 2)
+
+
+def executar_com_retentativa(
+    chamada: Callable[[], Any],
+    *,
+    limitador: Optional[LimitadorTaxa] = None,
+    tentativas: int = 5,
+    espera_base: float = 1.0,
+    espera_maxima: float = 32.0,
+    dormir: Callable[[float], None] = time.sleep,
+) -> Any:
+    """Executa ``chamada`` com limite de taxa e backoff exponencial.
+
+    Respostas 429, 5xx e 403 por limite de uso são repetidas até
+    ``tentativas`` vezes, com espera exponencial e jitter entre elas.
+    Demais erros são propagados imediatamente.
+    """
+    for tentativa in range(tentativas):
+        if limitador is not None:
+            limitador.adquirir()
+        try:
+            return chamada()
+        except HttpError as exc:
+            if tentativa == tentativas - 1 or not _deve_repetir(exc):
+                raise
+            espera = _espera_backoff(tentativa, espera_base, espera_maxima)
+            log.warning(
+                "Erro transitório do Drive (%s), nova tentativa em %.1fs",
+                getattr(exc.resp, "status", "?"),
+                espera,
+            )
+            dormir(espera)
+
+
+class _HttpLimitado:
+    """Cliente HTTP que consome um token do limitador a cada requisição."""
+
+    def __init__(self, http, limitador: LimitadorTaxa):
+        self._http = http
+        self._limitador = limitador
+
+    def request(self, *args, **kwargs):
+        self._limitador.adquirir()
+        return self._http.request(*args, **kwargs)
+
+    def __getattr__(self, nome):
+        return getattr(self._http, nome)
+
+
+class _RequisicaoLimitada:
+    """Envolve uma requisição da API aplicando o controle em ``execute``.
+
+    Os downloads em blocos (:func:`baixar_arquivo`, :func:`baixar_intervalo`)
+    chamam ``request.http.request`` diretamente; por isso ``http`` também
+    passa pelo limitador. As retentativas desses downloads são feitas por
+    eles mesmos, retomando do último byte recebido.
+    """
+
+    def __init__(self, requisicao, controle: "ServicoLimitado"):
+        self._requisicao = requisicao
+        self._controle = controle
+
+    def execute(self, *args, **kwargs):
+        return executar_com_retentativa(
+            lambda: self._requisicao.execute(*args, **kwargs),
+            **self._controle.opcoes,
+        )
+
+    @property
+    def http(self):
+        limitador = self._controle.opcoes.get("limitador")
+        if limitador is None:
+            return self._requisicao.http
+        return _HttpLimitado(self._requisicao.http, limitador)
+
+    def __getattr__(self, nome):
+        return getattr(self._requisicao, nome)
+
+
+class ServicoLimitado:
+    """Proxy de um serviço do Drive com limite de taxa e retentativas.
+
+    Os recursos (``files()``, ``changes()``...) e as requisições criadas a
+    partir dele mantêm a mesma interface do serviço original, de modo que as
+    funções deste módulo podem recebê-lo sem alterações.
+    """
+
+    def __init__(self, servico, **opcoes):
+        self._servico = servico
+        self.opcoes = opcoes
+
+    def __getattr__(self, nome):
+        atributo = getattr(self._servico, nome)
+        if not callable(atributo):
+            return atributo
 
-    creds = Credentials.from_service_account_info(info, scopes=scopes)
-    return build("drive", "v3", credentials=creds)
+        def _chamada(*args, **kwargs):
+            resultado = atributo(*args, **kwargs)
+            if hasattr(resultado, "execute"):
+                return _RequisicaoLimitada(resultado, self)
+            return ServicoLimitado(resultado, **self.opcoes)
+
+        return _chamada
+
+
+def criar_servico_drive(escrita: bool = False):
+    """Retorna o serviço do Google Drive para ``GCP_SERVICE_ACCOUNT_JSON``.
+
+    A variável de ambiente deve conter o JSON completo da chave de serviço.
+    O serviço é compartilhado pelo processo (ver :mod:`utils.drive_cliente`)
+    e pode ser usado por várias threads. Por padrão o escopo é somente
+    leitura; ``escrita`` pede o escopo ``drive``, usado para regravar o
+    ``index_arquivos.json``.
+    """
+
+    escopos = drive_cliente.ESCOPOS_ESCRITA if escrita else drive_cliente.ESCOPOS_LEITURA
+    return drive_cliente.obter_servico(escopos)
 
 
 def _buscar_subpasta_id(service, parent_id: str, nome: str) -> Optional[str]:
@@ -78,7 +246,7 @@ def listar_arquivos(service, pasta_id: str) -> List[dict]:
             service.files()
             .list(
                 q=query,
-                fields="nextPageToken, files(id,name,modifiedTime)",
+                fields="nextPageToken, files(id,name,modifiedTime,size,md5Checksum)",
                 pageToken=page_token,
             )
             .execute()
@@ -90,19 +258,163 @@ def listar_arquivos(service, pasta_id: str) -> List[dict]:
     return arquivos
 
 
-def baixar_arquivo(service, file_id: str, destino: str) -> None:
-    """Baixa um único arquivo do Google Drive."""
+class DownloadIncompleto(IOError):
+    """O arquivo baixado não confere com o tamanho ou o MD5 informado pelo Drive."""
+
+
+def _tamanho_bloco_padrao() -> int:
+    try:
+        return int(float(os.getenv("DRIVE_TAMANHO_BLOCO_MB", TAMANHO_BLOCO_MB)) * 1024**2)
+    except ValueError:
+        return TAMANHO_BLOCO_MB * 1024**2
+
+
+def _total_da_resposta(resp) -> Optional[int]:
+    if "content-range" in resp:
+        total = resp["content-range"].rsplit("/", 1)[1]
+        return int(total) if total != "*" else None
+    if "content-length" in resp:
+        return int(resp["content-length"])
+    return None
+
+
+def baixar_arquivo(
+    service,
+    file_id: str,
+    destino: str,
+    *,
+    tamanho: Optional[int | str] = None,
+    md5: Optional[str] = None,
+    tamanho_bloco: Optional[int] = None,
+    tentativas: int = 5,
+    progresso: Optional[Callable[[int, Optional[int]], None]] = None,
+    ao_receber: Optional[Callable[[bytes], None]] = None,
+    dormir: Callable[[float], None] = time.sleep,
+) -> None:
+    """Baixa um único arquivo do Google Drive em blocos de ``tamanho_bloco`` bytes.
+
+    Falhas transitórias (rede, 429, 5xx) são repetidas com backoff
+    exponencial retomando do último byte gravado, sem recomeçar o download.
+    O conteúdo é gravado em ``destino + ".part"`` e só é renomeado após
+    conferir ``tamanho`` e ``md5`` (os valores ``size`` e ``md5Checksum`` do
+    Drive), levantando :class:`DownloadIncompleto` se não conferirem.
+    ``progresso(baixados, total)`` é chamado a cada bloco recebido e
+    ``ao_receber(bloco)`` recebe os bytes de cada bloco, na ordem, para quem
+    precisa consumir o arquivo enquanto ele ainda está sendo baixado.
+    """
 
     request = service.files().get_media(fileId=file_id)
-    os.makedirs(os.path.dirname(destino), exist_ok=True)
-    with open(destino, "wb") as f:
-        downloader = MediaIoBaseDownload(f, request)
-        done = False
-        while not done:
-            try:
-                status, done = downloader.next_chunk()
-            except HttpError:
-                break
+    bloco = tamanho_bloco or _tamanho_bloco_padrao()
+    uri = request.uri
+    cabecalhos = {
+        k: v
+        for k, v in getattr(request, "headers", {}).items()
+        if k.lower() not in ("accept", "accept-encoding", "user-agent")
+    }
+    total = int(tamanho) if tamanho is not None else None
+    os.makedirs(os.path.dirname(destino) or ".", exist_ok=True)
+    parcial = destino + ".part"
+    baixados = 0
+    falhas = 0
+    hash_md5 = hashlib.md5()
+    try:
+        with open(parcial, "wb") as f:
+            while total is None or baixados < total:
+                cabecalhos["range"] = f"bytes={baixados}-{baixados + bloco - 1}"
+                try:
+                    resp, conteudo = request.http.request(uri, "GET", headers=cabecalhos)
+                    if resp.status == 416 and baixados == 0:
+                        total = _total_da_resposta(resp) or 0
+                        break
+                    if resp.status not in (200, 206):
+                        raise HttpError(resp, conteudo, uri=uri)
+                except (HttpError, OSError, httplib2.HttpLib2Error) as exc:
+                    falhas += 1
+                    if isinstance(exc, HttpError) and not _deve_repetir(exc):
+                        raise
+                    if falhas >= tentativas:
+                        raise
+                    espera = _espera_backoff(falhas - 1)
+                    log.warning(
+                        "Falha no download de %s em %d bytes (%s); retomando em %.1fs",
+                        file_id,
+                        baixados,
+                        exc,
+                        espera,
+                    )
+                    dormir(espera)
+                    continue
+
+                falhas = 0
+                if "content-location" in resp and resp["content-location"] != uri:
+                    uri = resp["content-location"]
+                if resp.status == 200 and baixados:
+                    # O servidor ignorou o Range e devolveu o arquivo inteiro
+                    if ao_receber is not None:
+                        raise DownloadIncompleto(
+                            f"Servidor ignorou o Range ao retomar {file_id}"
+                        )
+                    f.seek(0)
+                    f.truncate()
+                    baixados = 0
+                    hash_md5 = hashlib.md5()
+                f.write(conteudo)
+                hash_md5.update(conteudo)
+                if ao_receber is not None:
+                    ao_receber(conteudo)
+                baixados += len(conteudo)
+                total = _total_da_resposta(resp) if total is None else total
+                if progresso is not None:
+                    progresso(baixados, total)
+                if resp.status == 200 or not conteudo or total is None:
+                    break
+    except BaseException:
+        os.remove(parcial)
+        raise
+
+    if total is not None and baixados != total:
+        os.remove(parcial)
+        raise DownloadIncompleto(
+            f"Download de {file_id} incompleto: {baixados} de {total} bytes"
+        )
+    if md5 and hash_md5.hexdigest() != md5:
+        os.remove(parcial)
+        raise DownloadIncompleto(f"MD5 divergente no download de {file_id}")
+    os.replace(parcial, destino)
+
+
+def baixar_intervalo(
+    service, file_id: str, inicio: int, fim: int, request=None
+) -> Tuple[bytes, Optional[int]]:
+    """Baixa os bytes ``inicio..fim`` (inclusive) de um arquivo do Drive.
+
+    Retorna ``(conteudo, total)``, onde ``total`` é o tamanho do arquivo
+    informado pelo servidor. Se o servidor ignorar o ``Range`` o conteúdo
+    completo é retornado. ``request`` permite reaproveitar a requisição de
+    mídia entre chamadas.
+    """
+    request = request or service.files().get_media(fileId=file_id)
+    cabecalhos = {
+        k: v
+        for k, v in getattr(request, "headers", {}).items()
+        if k.lower() not in ("accept", "accept-encoding", "user-agent")
+    }
+    cabecalhos["range"] = f"bytes={inicio}-{fim}"
+    resp, conteudo = request.http.request(request.uri, "GET", headers=cabecalhos)
+    if resp.status == 416:
+        return b"", _total_da_resposta(resp)
+    if resp.status not in (200, 206):
+        raise HttpError(resp, conteudo, uri=request.uri)
+    return conteudo, _total_da_resposta(resp)
+
+
+def parametros_validacao(arquivo: dict) -> dict:
+    """Argumentos de validação de :func:`baixar_arquivo` disponíveis em ``arquivo``."""
+    return {
+        chave: arquivo[campo]
+        for chave, campo in (("tamanho", "size"), ("md5", "md5Checksum"))
+        if arquivo.get(campo)
+    }
 
 
 def safe_extract_all(zf: zipfile.ZipFile, dest: str) -> None:
@@ -115,13 +427,14 @@ def safe_extract_all(zf: zipfile.ZipFile, dest: str) -> None:
         zf.extract(member, dest)
 
 
-def baixar_xmls_empresa_zip(
-    service,
-    pasta_principal_id: str,
-    nome_empresa: str,
-    destino: str,
-) -> List[str]:
-    """Baixa o arquivo ``*.zip`` da pasta da empresa e retorna os XMLs extraídos."""
+def selecionar_zip_empresa(
+    service, pasta_principal_id: str, nome_empresa: str
+) -> Optional[dict]:
+    """Localiza o ZIP da empresa no Drive e retorna seus metadados.
+
+    Retorna ``None`` se a pasta não tiver ZIPs. Havendo mais de um, usa o
+    nome definido em ``NOME_ARQUIVO_ZIP``.
+    """
 
     log.info(
         "Buscando pasta da empresa '%s' em '%s'", nome_empresa, pasta_principal_id
@@ -138,7 +451,7 @@ def baixar_xmls_empresa_zip(
     arquivos_zip = [a for a in arquivos if a["name"].lower().endswith(".zip")]
     if not arquivos_zip:
         log.warning("Nenhum arquivo ZIP encontrado para '%s'", nome_empresa)
-        return []
+        return None
 
     zip_config = os.getenv("NOME_ARQUIVO_ZIP")
     if len(arquivos_zip) > 1:
@@ -165,31 +478,56 @@ def baixar_xmls_empresa_zip(
             )
     else:
         alvo = arquivos_zip[0]
+    return alvo
+
+
+def baixar_xmls_empresa_zip(
+    service,
+    pasta_principal_id: str,
+    nome_empresa: str,
+    destino: str,
+    usar_cache: bool = True,
+) -> List[str]:
+    """Baixa o arquivo ``*.zip`` da pasta da empresa e retorna os XMLs extraídos.
+
+    Os XMLs ficam em ``destino/<nome do ZIP sem extensão>``. Quando o Drive
+    informa ``modifiedTime`` e ``md5Checksum`` e o cache local está ativo (o
+    padrão; ver :mod:`utils.cache_drive`), um ZIP inalterado não é baixado
+    de novo: os XMLs já extraídos no cache são vinculados em ``destino``.
+    """
+
+    alvo = selecionar_zip_empresa(service, pasta_principal_id, nome_empresa)
+    if alvo is None:
+        return []
 
     log.info("Arquivo ZIP escolhido: %s (id=%s)", alvo["name"], alvo["id"])
-    os.makedirs(destino, exist_ok=True)
-    zip_path = os.path.join(destino, alvo["name"])
-    baixar_arquivo(service, alvo["id"], zip_path)
-    log.info("Download concluído: %s", zip_path)
+
+    def _baixar_e_extrair(zip_path: str, zip_dest: str) -> None:
+        baixar_arquivo(service, alvo["id"], zip_path, **parametros_validacao(alvo))
+        log.info("Download concluído: %s", zip_path)
+        try:
+            with zipfile.ZipFile(zip_path) as zf:
+                log.info("Conteúdo do ZIP: %s", zf.namelist())
+                safe_extract_all(zf, zip_dest)
+        except zipfile.BadZipFile as exc:
+            log.exception(
+                "Falha ao processar ZIP para a empresa '%s'", nome_empresa
+            )
+            raise
+
     zip_dest = os.path.join(destino, Path(alvo["name"]).stem)
-    try:
-        with zipfile.ZipFile(zip_path) as zf:
-            log.info("Conteúdo do ZIP: %s", zf.namelist())
-            safe_extract_all(zf, zip_dest)
-    except zipfile.BadZipFile as exc:
-        log.exception(
-            "Falha ao processar ZIP para a empresa '%s'", nome_empresa
-        )
-        raise
+    pasta_cache = cache_drive.diretorio_cache() if usar_cache else None
+    if pasta_cache and cache_drive.cacheavel(alvo):
+        xmls = cache_drive.obter_xmls(pasta_cache, alvo, zip_dest)
+        if xmls is None:
+            xmls = cache_drive.armazenar(
+                pasta_cache, alvo, _baixar_e_extrair, destino=zip_dest
+            )
+    else:
+        os.makedirs(destino, exist_ok=True)
+        _baixar_e_extrair(os.path.join(destino, alvo["name"]), zip_dest)
+        xmls = cache_drive.listar_xmls(zip_dest)
 
-    xmls = sorted(
-        [
-            os.path.join(root, f)
-            for root, _, files in os.walk(zip_dest)
-            for f in files
-            if f.lower().endswith(".xml")
-        ]
-    )
     if not xmls:
         log.error("Nenhum XML encontrado em %s", destino)
         raise FileNotFoundError(f"Nenhum XML encontrado em {destino}")
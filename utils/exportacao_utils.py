@@ -0,0 +1,448 @@
+"""Exportação de DataFrames para Excel com uso de memória constante."""
+
+from __future__ import annotations
+
+import gzip
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import pandas as pd
+
+log = logging.getLogger(__name__)
+
+MIME_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+MIME_PARQUET = "application/vnd.apache.parquet"
+MIME_CSV_GZ = "application/gzip"
+
+# Quantidade de linhas convertidas por vez ao escrever um DataFrame inteiro
+TAMANHO_LOTE_PADRAO = 5000
+
+# Estimativa de largura das colunas
+AMOSTRA_LARGURA = 1000
+LARGURA_MAXIMA = 60
+LARGURAS_FIXAS = {"date": 12, "int": 10, "float": 14, "bool": 8}
+
+FORMATO_CABECALHO = {
+    "bold": True,
+    "text_wrap": True,
+    "valign": "top",
+    "fg_color": "#D7E4BC",
+    "border": 1,
+}
+FORMATO_NUMERO = {"num_format": "#,##0.00", "valign": "top"}
+FORMATO_DATA = {"num_format": "dd/mm/yyyy", "valign": "top"}
+FORMATO_VEICULO = {"bg_color": "#E0F7FA", "valign": "top"}
+
+Dados = Union[pd.DataFrame, Iterable[pd.DataFrame]]
+
+
+def _iterar_lotes(dados: Dados, tamanho_lote: int) -> Iterator[pd.DataFrame]:
+    """Normaliza ``dados`` em uma sequência de DataFrames."""
+    if isinstance(dados, pd.DataFrame):
+        for inicio in range(0, max(len(dados), 1), tamanho_lote):
+            yield dados.iloc[inicio:inicio + tamanho_lote]
+        return
+    for lote in dados:
+        if lote is None:
+            continue
+        yield lote if isinstance(lote, pd.DataFrame) else pd.DataFrame(lote)
+
+
+def _tipo_coluna(serie: pd.Series) -> str:
+    """Classifica a coluna para escolher o método de escrita da célula."""
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return "data"
+    if pd.api.types.is_bool_dtype(serie):
+        return "geral"
+    if pd.api.types.is_float_dtype(serie):
+        return "numero"
+    if pd.api.types.is_integer_dtype(serie):
+        return "inteiro"
+    return "geral"
+
+
+def _valores_coluna(serie: pd.Series, tipo: str) -> List[Any]:
+    """Converte a coluna em valores Python, trocando ausentes por ``None``."""
+    if tipo == "data":
+        if getattr(serie.dt, "tz", None) is not None:
+            serie = serie.dt.tz_localize(None)
+        return [None if pd.isna(v) else v.to_pydatetime() for v in serie]
+    valores = serie.astype(object)
+    return valores.where(serie.notna(), None).tolist()
+
+
+def estimar_larguras(
+    df: pd.DataFrame,
+    layout: Optional[Dict[str, Dict[str, Any]]] = None,
+    amostra: int = AMOSTRA_LARGURA,
+) -> List[int]:
+    """Estima a largura de cada coluna sem converter o DataFrame inteiro.
+
+    Datas e números recebem larguras fixas conforme o ``dtype`` (ou o
+    ``tipo`` declarado em ``layout``, no formato de ``layout_colunas.json``).
+    Para textos é medida apenas uma amostra limitada de linhas com
+    ``str.len()`` vetorizado. Uma chave ``largura`` no layout tem
+    precedência sobre a estimativa.
+    """
+    layout = layout or {}
+    larguras = []
+    for coluna in df.columns:
+        props = layout.get(str(coluna), {})
+        largura_cabecalho = len(str(coluna)) + 2
+        if "largura" in props:
+            larguras.append(int(props["largura"]))
+            continue
+
+        serie = df[coluna]
+        tipo = props.get("tipo")
+        if pd.api.types.is_datetime64_any_dtype(serie) or tipo == "date":
+            largura = LARGURAS_FIXAS["date"]
+        elif pd.api.types.is_bool_dtype(serie):
+            largura = LARGURAS_FIXAS["bool"]
+        elif pd.api.types.is_integer_dtype(serie) or tipo == "int":
+            largura = LARGURAS_FIXAS["int"]
+        elif pd.api.types.is_numeric_dtype(serie) or tipo == "float":
+            largura = LARGURAS_FIXAS["float"]
+        else:
+            valores = serie.iloc[:amostra].dropna()
+            maior = valores.astype(str).str.len().max() if len(valores) else 0
+            largura = min(int(maior) + 2, LARGURA_MAXIMA)
+        larguras.append(max(largura, min(largura_cabecalho, LARGURA_MAXIMA)))
+    return larguras
+
+
+def _preparar_lote(lote: pd.DataFrame) -> Tuple[List[str], List[List[Any]]]:
+    """Converte o lote em listas de valores por coluna.
+
+    Não acessa o workbook, podendo rodar em outra thread enquanto o lote
+    anterior é escrito.
+    """
+    tipos = [_tipo_coluna(lote[coluna]) for coluna in lote.columns]
+    valores = [
+        _valores_coluna(lote[coluna], tipo)
+        for coluna, tipo in zip(lote.columns, tipos)
+    ]
+    return tipos, valores
+
+
+class _EscritorPlanilha:
+    """Escreve lotes de linhas em uma planilha do ``xlsxwriter``.
+
+    Os formatos são recebidos prontos para que várias planilhas do mesmo
+    workbook compartilhem as mesmas instâncias.
+    """
+
+    def __init__(
+        self,
+        workbook,
+        nome: str,
+        formatos: Dict[str, Any],
+        layout: Optional[Dict[str, Dict[str, Any]]] = None,
+    ):
+        self.workbook = workbook
+        self.nome = nome
+        self.worksheet = workbook.add_worksheet(nome[:31])
+        self.formatos = formatos
+        self.layout = layout
+        self.colunas: List[str] = []
+        self.linha = 1
+
+    def _escrever_cabecalho(self, lote: pd.DataFrame) -> None:
+        self.colunas = [str(c) for c in lote.columns]
+        for col_num, valor in enumerate(self.colunas):
+            self.worksheet.write_string(0, col_num, valor, self.formatos["cabecalho"])
+        for i, largura in enumerate(estimar_larguras(lote, self.layout)):
+            self.worksheet.set_column(i, i, largura)
+
+    def escrever_lote(self, lote: pd.DataFrame, preparado=None) -> None:
+        """Escreve ``lote``; ``preparado`` evita repetir a conversão dos valores."""
+        if not self.colunas:
+            self._escrever_cabecalho(lote)
+        if lote.empty:
+            return
+        tipos, colunas_valores = preparado or _preparar_lote(lote)
+        ws = self.worksheet
+        fmt_numero = self.formatos["numero"]
+        fmt_data = self.formatos["data"]
+
+        escritores: List[Callable[[int, int, Any], Any]] = []
+        for tipo in tipos:
+            if tipo == "data":
+                escritores.append(lambda r, c, v: ws.write_datetime(r, c, v, fmt_data))
+            elif tipo == "numero":
+                escritores.append(lambda r, c, v: ws.write_number(r, c, v, fmt_numero))
+            elif tipo == "inteiro":
+                escritores.append(ws.write_number)
+            else:
+                escritores.append(self._escrever_geral)
+
+        linha = self.linha
+        for valores in zip(*colunas_valores):
+            for col_num, valor in enumerate(valores):
+                if valor is None:
+                    continue
+                escritores[col_num](linha, col_num, valor)
+            linha += 1
+        self.linha = linha
+
+    def _escrever_geral(self, linha: int, coluna: int, valor: Any) -> None:
+        if isinstance(valor, (datetime, date)):
+            self.worksheet.write_datetime(linha, coluna, valor, self.formatos["data"])
+        elif isinstance(valor, float) and valor != valor:
+            return
+        else:
+            self.worksheet.write(linha, coluna, valor)
+
+    def finalizar(self, destacar_veiculos: bool = True) -> int:
+        """Aplica filtros, painéis congelados e destaque de veículos."""
+        ws = self.worksheet
+        total = self.linha - 1
+        ultima_coluna = max(len(self.colunas) - 1, 0)
+        if destacar_veiculos and "Tipo Produto" in self.colunas and total:
+            from xlsxwriter.utility import xl_col_to_name
+
+            col_letter = xl_col_to_name(self.colunas.index("Tipo Produto"))
+            ws.conditional_format(
+                1,
+                0,
+                total,
+                ultima_coluna,
+                {
+                    "type": "formula",
+                    "criteria": f'=${col_letter}2="Veículo"',
+                    "format": self.formatos["veiculo"],
+                },
+            )
+        if self.colunas:
+            ws.autofilter(0, 0, total, ultima_coluna)
+        ws.freeze_panes(1, 0)
+        return total
+
+
+def _preparar_destino(destino) -> None:
+    """Cria o diretório de ``destino`` quando for um caminho em disco."""
+    if isinstance(destino, (str, os.PathLike)):
+        diretorio_saida = os.path.dirname(os.fspath(destino))
+        if diretorio_saida:
+            os.makedirs(diretorio_saida, exist_ok=True)
+
+
+def _criar_workbook(destino, strings_to_numbers: bool = False):
+    """Cria o workbook em modo ``constant_memory`` com os formatos padrão."""
+    import xlsxwriter
+
+    _preparar_destino(destino)
+    workbook = xlsxwriter.Workbook(
+        destino,
+        {
+            "constant_memory": True,
+            "strings_to_numbers": strings_to_numbers,
+            "remove_timezone": True,
+        },
+    )
+    formatos = {
+        "cabecalho": workbook.add_format(FORMATO_CABECALHO),
+        "numero": workbook.add_format(FORMATO_NUMERO),
+        "data": workbook.add_format(FORMATO_DATA),
+        "veiculo": workbook.add_format(FORMATO_VEICULO),
+    }
+    return workbook, formatos
+
+
+def _sequencia_lotes(
+    planilhas: Dict[str, Optional[Dados]], tamanho_lote: int
+) -> Iterator[Tuple[str, pd.DataFrame]]:
+    """Percorre as planilhas produzindo pares ``(nome, lote)`` em ordem."""
+    for nome, dados in planilhas.items():
+        if dados is None:
+            continue
+        vazio = True
+        for lote in _iterar_lotes(dados, tamanho_lote):
+            vazio = False
+            yield nome, lote
+        if vazio:
+            yield nome, pd.DataFrame()
+
+
+def escrever_workbook(
+    planilhas: Dict[str, Optional[Dados]],
+    destino,
+    *,
+    tamanho_lote: int = TAMANHO_LOTE_PADRAO,
+    strings_to_numbers: bool = False,
+    destacar_veiculos: bool = True,
+    layout: Optional[Dict[str, Dict[str, Any]]] = None,
+) -> Dict[str, int]:
+    """Grava várias planilhas em um único workbook, em uma só passada.
+
+    Os formatos são criados uma única vez e compartilhados entre as
+    planilhas. Uma thread auxiliar converte o próximo lote em valores Python
+    enquanto o lote atual é escrito, sobrepondo as duas etapas. Planilhas
+    com valor ``None`` são ignoradas. ``layout`` (o conteúdo de
+    ``layout_colunas.json``) orienta as larguras das colunas. Retorna as
+    linhas escritas por planilha.
+    """
+    workbook, formatos = _criar_workbook(destino, strings_to_numbers)
+    totais: Dict[str, int] = {}
+    try:
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="exportacao") as executor:
+            sequencia = _sequencia_lotes(planilhas, tamanho_lote)
+            atual = next(sequencia, None)
+            futuro = executor.submit(_preparar_lote, atual[1]) if atual else None
+            escritor: Optional[_EscritorPlanilha] = None
+            while atual is not None:
+                proximo = next(sequencia, None)
+                proximo_futuro = (
+                    executor.submit(_preparar_lote, proximo[1]) if proximo else None
+                )
+                nome, lote = atual
+                if escritor is None or escritor.nome != nome:
+                    if escritor is not None:
+                        totais[escritor.nome] = escritor.finalizar(destacar_veiculos)
+                    escritor = _EscritorPlanilha(workbook, nome, formatos, layout)
+                escritor.escrever_lote(lote, futuro.result())
+                atual, futuro = proximo, proximo_futuro
+            if escritor is not None:
+                totais[escritor.nome] = escritor.finalizar(destacar_veiculos)
+    finally:
+        workbook.close()
+    log.debug("Workbook exportado: %s", totais)
+    return totais
+
+
+def escrever_excel(
+    dados: Dados,
+    destino,
+    nome_planilha: str = "Sheet1",
+    *,
+    tamanho_lote: int = TAMANHO_LOTE_PADRAO,
+    strings_to_numbers: bool = False,
+    destacar_veiculos: bool = True,
+    layout: Optional[Dict[str, Dict[str, Any]]] = None,
+) -> int:
+    """Grava ``dados`` em ``destino`` (caminho ou buffer) em lotes.
+
+    ``dados`` pode ser um ``DataFrame`` ou um iterável de DataFrames com as
+    mesmas colunas, como os lotes produzidos pelo pipeline de extração. As
+    linhas são descarregadas em disco à medida que são escritas
+    (``constant_memory``), de modo que o consumo de memória não cresce com o
+    tamanho da planilha. Retorna a quantidade de linhas escritas.
+    """
+    totais = escrever_workbook(
+        {nome_planilha: dados},
+        destino,
+        tamanho_lote=tamanho_lote,
+        strings_to_numbers=strings_to_numbers,
+        destacar_veiculos=destacar_veiculos,
+        layout=layout,
+    )
+    return totais.get(nome_planilha, 0)
+
+
+def excel_bytes(dados: Dados, nome_planilha: str = "Sheet1", **kwargs) -> bytes:
+    """Retorna o conteúdo ``.xlsx`` de ``dados`` para uso em downloads."""
+    buffer = io.BytesIO()
+    escrever_excel(dados, buffer, nome_planilha, **kwargs)
+    return buffer.getvalue()
+
+
+def workbook_bytes(planilhas: Dict[str, Optional[Dados]], **kwargs) -> bytes:
+    """Retorna o conteúdo ``.xlsx`` de um workbook com várias planilhas."""
+    buffer = io.BytesIO()
+    escrever_workbook(planilhas, buffer, **kwargs)
+    return buffer.getvalue()
+
+
+def _concatenar(dados: Dados) -> pd.DataFrame:
+    """Reúne ``dados`` em um único DataFrame para os formatos colunares."""
+    if isinstance(dados, pd.DataFrame):
+        return dados
+    lotes = list(_iterar_lotes(dados, TAMANHO_LOTE_PADRAO))
+    return pd.concat(lotes, ignore_index=True) if lotes else pd.DataFrame()
+
+
+def _preparar_parquet(df: pd.DataFrame) -> pd.DataFrame:
+    """Ajusta apenas o que o Arrow não consegue serializar.
+
+    Colunas ``object`` com tipos misturados (por exemplo números e textos)
+    são convertidas para texto; as demais mantêm o ``dtype`` original, de
+    forma que a leitura posterior dispensa nova coerção.
+    """
+    mistas = [
+        coluna
+        for coluna in df.columns
+        if df[coluna].dtype == object
+        and pd.api.types.infer_dtype(df[coluna], skipna=True).startswith("mixed")
+    ]
+    nomes_texto = any(not isinstance(c, str) for c in df.columns)
+    if not mistas and not nomes_texto:
+        return df
+    df = df.copy()
+    for coluna in mistas:
+        serie = df[coluna]
+        df[coluna] = serie.astype(str).where(serie.notna(), None)
+    if nomes_texto:
+        df.columns = [str(c) for c in df.columns]
+    return df
+
+
+def escrever_parquet(dados: Dados, destino, **_) -> int:
+    """Grava ``dados`` em Parquet preservando os tipos das colunas."""
+    df = _preparar_parquet(_concatenar(dados))
+    _preparar_destino(destino)
+    df.to_parquet(destino, index=False)
+    return len(df)
+
+
+def escrever_csv_gz(dados: Dados, destino, **_) -> int:
+    """Grava ``dados`` como CSV compactado com gzip."""
+    _preparar_destino(destino)
+    total = 0
+    cabecalho_escrito = False
+    if isinstance(destino, (str, os.PathLike)):
+        saida = open(destino, "wb")
+    else:
+        saida = destino
+    try:
+        with gzip.GzipFile(fileobj=saida, mode="wb") as gz:
+            for lote in _iterar_lotes(dados, TAMANHO_LOTE_PADRAO):
+                if lote.columns.empty:
+                    continue
+                texto = lote.to_csv(index=False, header=not cabecalho_escrito)
+                gz.write(texto.encode("utf-8"))
+                cabecalho_escrito = True
+                total += len(lote)
+    finally:
+        if saida is not destino:
+            saida.close()
+    return total
+
+
+# Formatos suportados: extensão -> (função de escrita, tipo MIME)
+FORMATOS_EXPORTACAO: Dict[str, Any] = {
+    "xlsx": (escrever_excel, MIME_XLSX),
+    "parquet": (escrever_parquet, MIME_PARQUET),
+    "csv.gz": (escrever_csv_gz, MIME_CSV_GZ),
+}
+
+
+def exportar_dados(dados: Dados, destino, formato: str = "xlsx", **kwargs) -> int:
+    """Grava ``dados`` em ``destino`` no ``formato`` informado."""
+    if formato not in FORMATOS_EXPORTACAO:
+        raise ValueError(
+            f"Formato de exportação não suportado: {formato}. "
+            f"Use um de {', '.join(FORMATOS_EXPORTACAO)}"
+        )
+    escritor, _ = FORMATOS_EXPORTACAO[formato]
+    return escritor(dados, destino, **kwargs)
+
+
+def exportar_bytes(dados: Dados, formato: str = "xlsx", **kwargs) -> bytes:
+    """Retorna o conteúdo de ``dados`` no ``formato`` informado."""
+    buffer = io.BytesIO()
+    exportar_dados(dados, buffer, formato, **kwargs)
+    return buffer.getvalue()
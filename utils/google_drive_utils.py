@@ -1,15 +1,40 @@
 import os
 import io
 import logging
-from typing import Dict, List, Tuple
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import json
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
+import xml.etree.ElementTree as ET
+from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
 
+from . import cache_drive, drive_cliente
+from .arquivos_utils import caminho_seguro
+from .drive_utils import baixar_arquivo, baixar_intervalo
+
 SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
 ROOT_FOLDER_ID = '1ADaMbXNPEX8ZIT7c1U_pWMsRygJFROZq'
 
+# Varredura das pastas: apenas os campos usados e várias pastas por consulta
+CAMPOS_SCAN = "nextPageToken, files(id, name, mimeType, modifiedTime, parents)"
+PASTAS_POR_CONSULTA = 20
+
+# Leitura parcial do XML para obter o tpNF (Entrada/Saída)
+BYTES_INICIAIS_TIPO = 4 * 1024
+BYTES_BLOCO_TIPO = 64 * 1024
+TIPOS_NOTA = {"0": "Entrada", "1": "Saída"}
+
+CAMPOS_MUDANCAS = (
+    "nextPageToken, newStartPageToken, "
+    "changes(fileId, removed, file(name, mimeType, modifiedTime, parents, trashed))"
+)
+
+# Cache local dos IDs das pastas das empresas (ver _pasta_empresa)
+ARQUIVO_PASTAS_EMPRESAS = "pastas_empresas.json"
+_lock_pastas_empresas = threading.Lock()
+
 log = logging.getLogger(__name__)
 
 
@@ -17,24 +42,10 @@ def get_drive_service() -> "googleapiclient.discovery.Resource":
     """Retorna o serviço do Google Drive utilizando ``GCP_SERVICE_ACCOUNT_JSON``.
 
     A variável de ambiente deve conter o JSON da chave de serviço. Erros de
-    ausência ou formatação incorreta são relatados explicitamente.
+    ausência ou formatação incorreta são relatados explicitamente. O serviço
+    e suas conexões são reaproveitados entre chamadas.
     """
-    raw_json = os.getenv("GCP_SERVICE_ACCOUNT_JSON")
-    if not raw_json:
-        raise EnvironmentError(
-            "Variável GCP_SERVICE_ACCOUNT_JSON não definida"
-        )
-    try:
-        service_account_info = json.loads(raw_json)
-    except json.JSONDecodeError as exc:
-        raise ValueError(
-            "Conteúdo inválido em GCP_SERVICE_ACCOUNT_JSON"
-        ) from exc
-
-    creds = service_account.Credentials.from_service_account_info(
-        service_account_info, scopes=SCOPES
-    )
-    return build("drive", "v3", credentials=creds)
+    return drive_cliente.obter_servico(SCOPES)
 
 
 def _find_subfolder(service, parent_id: str, name: str) -> str | None:
@@ -51,41 +62,22 @@ def _find_subfolder(service, parent_id: str, name: str) -> str | None:
     return None
 
 
-def _list_files(service, folder_id: str) -> List[dict]:
-    """Lista todos os arquivos dentro da pasta informada."""
-    query = f"'{folder_id}' in parents and trashed=false"
-    files: List[dict] = []
-    page_token = None
-    while True:
-        results = (
-            service.files()
-            .list(
-                q=query,
-                fields="nextPageToken, files(id, name, mimeType, modifiedTime)",
-                pageToken=page_token,
-                pageSize=1000,
-            )
-            .execute()
-        )
-        files.extend(results.get("files", []))
-        page_token = results.get("nextPageToken")
-        if not page_token:
-            break
-    return files
-
-
-
-def _read_index(service, company_id: str) -> Tuple[Dict[str, Dict], str | None]:
-    """Lê o arquivo ``index_arquivos.json`` da empresa."""
+def _buscar_index_id(service, company_id: str) -> str | None:
+    """Retorna o ID do ``index_arquivos.json`` da empresa, se existir."""
     query = (
         f"'{company_id}' in parents and "
         "name='index_arquivos.json' and trashed=false"
     )
     res = service.files().list(q=query, fields="files(id)").execute()
     files = res.get("files")
-    if not files:
+    return files[0]["id"] if files else None
+
+
+def _read_index(service, company_id: str) -> Tuple[Dict[str, Dict], str | None]:
+    """Lê o arquivo ``index_arquivos.json`` da empresa."""
+    idx_id = _buscar_index_id(service, company_id)
+    if not idx_id:
         return {}, None
-    idx_id = files[0]["id"]
     request = service.files().get_media(fileId=idx_id)
     buf = io.BytesIO()
     downloader = MediaIoBaseDownload(buf, request)
@@ -98,68 +90,130 @@ def _read_index(service, company_id: str) -> Tuple[Dict[str, Dict], str | None]:
 
 def _write_index(
     service, company_id: str, index: Dict[str, Dict], file_id: str | None
-) -> str:
-    """Grava ``index_arquivos.json`` na pasta da empresa."""
+) -> str | None:
+    """Grava ``index_arquivos.json`` na pasta da empresa.
+
+    Uma falha na gravação (por exemplo, 403 com um serviço somente leitura)
+    é registrada como aviso e não interrompe a sincronização: o índice
+    atualizado continua valendo para a cópia local e é gravado de novo na
+    próxima atualização.
+    """
     media = MediaIoBaseUpload(
         io.BytesIO(json.dumps(index, ensure_ascii=False, indent=2).encode("utf-8")),
         mimetype="application/json",
         resumable=False,
     )
-    if file_id:
-        service.files().update(fileId=file_id, media_body=media).execute()
+    try:
+        if file_id:
+            service.files().update(fileId=file_id, media_body=media).execute()
+            return file_id
+        meta = {"name": "index_arquivos.json", "parents": [company_id]}
+        result = service.files().create(body=meta, media_body=media).execute()
+        return result["id"]
+    except HttpError as exc:
+        log.warning("Não foi possível gravar o índice de %s: %s", company_id, exc)
         return file_id
-    meta = {"name": "index_arquivos.json", "parents": [company_id]}
-    result = service.files().create(body=meta, media_body=media).execute()
-    return result["id"]
 
 
-def _infer_tipo_nota(service, file_id: str) -> str:
-    """Obtém o campo ``tpNF`` do XML para definir Entrada ou Saída."""
+def _infer_tipo_nota(
+    service, file_id: str, bytes_iniciais: int = BYTES_INICIAIS_TIPO
+) -> str:
+    """Obtém o campo ``tpNF`` do XML para definir Entrada ou Saída.
+
+    Baixa apenas os primeiros ``bytes_iniciais`` do arquivo (o ``tpNF`` fica
+    no grupo ``ide``, logo no início da NFe) e os entrega a um parser
+    incremental que para assim que encontra o campo. Se ele não aparecer, os
+    blocos seguintes são baixados até o fim do arquivo.
+    """
     try:
         request = service.files().get_media(fileId=file_id)
-        buf = io.BytesIO()
-        downloader = MediaIoBaseDownload(buf, request)
-        done = False
-        while not done:
-            _, done = downloader.next_chunk()
-        buf.seek(0)
-        import xml.etree.ElementTree as ET
-
-        tree = ET.parse(buf)
-        tp_elem = tree.find(
-            ".//{http://www.portalfiscal.inf.br/nfe}tpNF"
-        )
-        if tp_elem is not None:
-            if tp_elem.text == "0":
-                return "Entrada"
-            if tp_elem.text == "1":
-                return "Saída"
+        parser = ET.XMLPullParser(events=("end",))
+        inicio, tamanho = 0, bytes_iniciais
+        while True:
+            conteudo, total = baixar_intervalo(
+                service, file_id, inicio, inicio + tamanho - 1, request=request
+            )
+            parser.feed(conteudo)
+            for _, elem in parser.read_events():
+                if elem.tag.rsplit("}", 1)[-1] == "tpNF":
+                    return TIPOS_NOTA.get((elem.text or "").strip(), "Indefinido")
+            inicio += len(conteudo)
+            if not conteudo or total is None or inicio >= total:
+                break
+            tamanho = max(tamanho, BYTES_BLOCO_TIPO)
     except Exception:
         log.exception("Erro ao inferir tipo de nota")
     return "Indefinido"
 
 
-def atualizar_index_empresa(service, company_id: str) -> Dict[str, Dict]:
-    """Atualiza ou cria o ``index_arquivos.json`` para a empresa."""
+def _inferir_tipos_notas(
+    service,
+    file_ids: List[str],
+    fabrica_servico: Optional[Callable[[], Any]] = None,
+    max_workers: int = 8,
+) -> Dict[str, str]:
+    """Executa :func:`_infer_tipo_nota` para vários arquivos em paralelo.
+
+    O endpoint de lote do Drive não aceita downloads de mídia, então as
+    requisições saem por um pool de threads. O serviço do Drive pode ser
+    compartilhado entre elas (ver :mod:`utils.drive_cliente`); se informada,
+    ``fabrica_servico`` cria um serviço por thread.
+    """
+    local = threading.local()
+
+    def _inferir(file_id: str) -> str:
+        if fabrica_servico is None:
+            return _infer_tipo_nota(service, file_id)
+        if not hasattr(local, "servico"):
+            local.servico = fabrica_servico()
+        return _infer_tipo_nota(local.servico, file_id)
+
+    if len(file_ids) < 2:
+        return {file_id: _inferir(file_id) for file_id in file_ids}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(file_ids))) as executor:
+        return dict(zip(file_ids, executor.map(_inferir, file_ids)))
+
+
+def atualizar_index_empresa(
+    service,
+    company_id: str,
+    fabrica_servico: Optional[Callable[[], Any]] = None,
+    pastas: Optional[Dict[str, str]] = None,
+) -> Dict[str, Dict]:
+    """Atualiza ou cria o ``index_arquivos.json`` para a empresa.
+
+    ``fabrica_servico`` cria um serviço por thread na listagem das pastas e
+    ``pastas`` recebe o caminho de cada subpasta encontrada (ver :func:`_scan_xmls`).
+    """
     index, idx_id = _read_index(service, company_id)
-    arquivos = _scan_xmls(service, company_id)
+    arquivos = _scan_xmls(
+        service, company_id, fabrica_servico=fabrica_servico, pastas=pastas
+    )
+
+    alterados = [
+        arq["id"]
+        for arq in arquivos
+        if index.get(arq["id"], {}).get("modificado") != arq.get("modifiedTime")
+    ]
+    tipos = _inferir_tipos_notas(service, alterados, fabrica_servico)
 
     atual: Dict[str, Dict] = {}
     for arq in arquivos:
         file_id = arq["id"]
-        info = index.get(file_id, {})
-        if info.get("modificado") != arq.get("modifiedTime"):
-            tipo = info.get("tipo")
-            if not tipo or info.get("modificado") != arq.get("modifiedTime"):
-                tipo = _infer_tipo_nota(service, file_id)
+        if file_id in tipos:
             atual[file_id] = {
                 "nome": arq["name"],
                 "caminho": arq["path"],
                 "modificado": arq.get("modifiedTime"),
-                "tipo": tipo,
+                "tipo": tipos[file_id],
             }
         else:
-            atual[file_id] = info
+            # Tipo preservado; nome e caminho mudam quando pastas são renomeadas
+            atual[file_id] = {
+                **index[file_id],
+                "nome": arq["name"],
+                "caminho": arq["path"],
+            }
 
     changed = index != atual
     if changed:
@@ -167,38 +221,425 @@ def atualizar_index_empresa(service, company_id: str) -> Dict[str, Dict]:
     return atual
 
 
-def _scan_xmls(service, folder_id: str, prefix: str = "") -> List[Dict[str, str]]:
-    """Retorna metadados de todos os XMLs abaixo de ``folder_id``."""
+def _listar_filhos(service, pastas: List[str]) -> List[dict]:
+    """Lista o conteúdo de várias pastas com uma única consulta paginada."""
+    filtro = " or ".join(f"'{pasta}' in parents" for pasta in pastas)
+    query = f"({filtro}) and trashed=false"
+    files: List[dict] = []
+    page_token = None
+    while True:
+        results = (
+            service.files()
+            .list(
+                q=query,
+                fields=CAMPOS_SCAN,
+                pageToken=page_token,
+                pageSize=1000,
+            )
+            .execute()
+        )
+        files.extend(results.get("files", []))
+        page_token = results.get("nextPageToken")
+        if not page_token:
+            break
+    return files
+
+
+def _scan_xmls(
+    service,
+    folder_id: str,
+    prefix: str = "",
+    *,
+    fabrica_servico: Optional[Callable[[], Any]] = None,
+    max_workers: int = 8,
+    pastas_por_consulta: int = PASTAS_POR_CONSULTA,
+    pastas: Optional[Dict[str, str]] = None,
+) -> List[Dict[str, str]]:
+    """Retorna metadados de todos os XMLs abaixo de ``folder_id``.
+
+    A árvore é percorrida em largura: cada nível é listado com consultas
+    ``'a' in parents or 'b' in parents`` agrupando até
+    ``pastas_por_consulta`` pastas, executadas em paralelo (com um serviço
+    por thread, se ``fabrica_servico`` for informada). O número de
+    idas ao Drive passa a acompanhar a profundidade da árvore, não a
+    quantidade de pastas. Se informado, ``pastas`` é preenchido com
+    ``{id: caminho}`` de cada pasta visitada, inclusive ``folder_id``.
+    """
     entries: List[Dict[str, str]] = []
-    files = _list_files(service, folder_id)
-    for f in files:
-        if f["mimeType"] == "application/vnd.google-apps.folder":
-            new_prefix = os.path.join(prefix, f["name"])
-            entries.extend(_scan_xmls(service, f["id"], new_prefix))
-            continue
-        if f["name"].lower().endswith(".xml"):
-            entries.append(
-                {
-                    "id": f["id"],
-                    "name": f["name"],
-                    "path": os.path.join(prefix, f["name"]),
-                    "modifiedTime": f.get("modifiedTime"),
-                }
+    fronteira: Dict[str, str] = {folder_id: prefix}
+    visitadas = {folder_id}
+    local = threading.local()
+
+    def _servico():
+        if fabrica_servico is None:
+            return service
+        if not hasattr(local, "servico"):
+            local.servico = fabrica_servico()
+        return local.servico
+
+    workers = max(1, max_workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while fronteira:
+            ids = list(fronteira)
+            grupos = [
+                ids[i:i + pastas_por_consulta]
+                for i in range(0, len(ids), pastas_por_consulta)
+            ]
+            resultados = executor.map(
+                lambda grupo: _listar_filhos(_servico(), grupo), grupos
             )
+            proxima: Dict[str, str] = {}
+            for grupo, filhos in zip(grupos, resultados):
+                do_grupo = set(grupo)
+                for f in filhos:
+                    pai = next(
+                        (p for p in f.get("parents", []) if p in do_grupo), grupo[0]
+                    )
+                    caminho = os.path.join(fronteira[pai], f["name"])
+                    if f["mimeType"] == "application/vnd.google-apps.folder":
+                        if f["id"] not in visitadas:
+                            visitadas.add(f["id"])
+                            proxima[f["id"]] = caminho
+                    elif f["name"].lower().endswith(".xml"):
+                        entries.append(
+                            {
+                                "id": f["id"],
+                                "name": f["name"],
+                                "path": caminho,
+                                "modifiedTime": f.get("modifiedTime"),
+                            }
+                        )
+            if pastas is not None:
+                pastas.update(fronteira)
+            fronteira = proxima
+    entries.sort(key=lambda e: e["path"])
     return entries
+
+def _entrada_incremental(cache_dir: str, company_id: str) -> str:
+    return os.path.join(cache_dir, f"incremental-{company_id}")
+
+
+def sincronizar_xmls_incremental(
+    service,
+    company_id: str,
+    cache_dir: Optional[str] = None,
+    *,
+    fabrica_servico: Optional[Callable[[], Any]] = None,
+    max_workers: int = 8,
+    atualizar_index: bool = False,
+    index: Optional[Dict[str, Dict]] = None,
+    destino: Optional[str] = None,
+) -> Dict[str, List[str]]:
+    """Baixa apenas os XMLs novos ou alterados segundo o ``index_arquivos.json``.
+
+    O índice da empresa é comparado com o manifesto local, guardado como
+    entrada ``incremental-<company_id>`` do cache do Drive (ver
+    :mod:`utils.cache_drive`). Arquivos cujo ``modificado`` mudou, ou que
+    não existem localmente, são baixados em paralelo (com um serviço por
+    thread, se ``fabrica_servico`` for informada) e os que saíram do índice
+    são apagados. Com ``atualizar_index`` o índice é regenerado antes; um
+    ``index`` já carregado dispensa a leitura no Drive.
+
+    A entrada fica reservada (ver :func:`utils.cache_drive.reservar`)
+    durante a sincronização. Com ``destino``, os XMLs são entregues nessa
+    pasta como em :func:`utils.cache_drive.obter_xmls`, e os caminhos
+    continuam válidos se a entrada for descartada depois; sem ele, ``xmls``
+    aponta para dentro do cache.
+
+    Retorna ``{"xmls": [...], "baixados": [...], "removidos": [...],
+    "erros": [...]}``; ``xmls`` lista todos os XMLs locais sincronizados.
+    """
+    cache_dir = cache_dir or cache_drive.diretorio_cache()
+    if not cache_dir:
+        raise ValueError("Sincronização incremental requer o cache do Drive ativo")
+    if atualizar_index:
+        index = atualizar_index_empresa(service, company_id, fabrica_servico)
+    elif index is None:
+        index, _ = _read_index(service, company_id)
+
+    entrada = _entrada_incremental(cache_dir, company_id)
+    with cache_drive.reservar(entrada):
+        pasta = os.path.join(entrada, cache_drive.PASTA_EXTRAIDOS)
+        os.makedirs(pasta, exist_ok=True)
+        meta = cache_drive.ler_meta(entrada) or {}
+        manifesto: Dict[str, Dict] = meta.get("arquivos", {})
+
+        removidos = []
+        for file_id in set(manifesto) - set(index):
+            antigo = manifesto.pop(file_id)
+            try:
+                os.remove(os.path.join(pasta, antigo["caminho"]))
+            except OSError:
+                pass
+            removidos.append(antigo["caminho"])
+
+        pendentes = []
+        for file_id, info in index.items():
+            caminho = info.get("caminho") or info.get("nome") or f"{file_id}.xml"
+            local = manifesto.get(file_id)
+            if (
+                local
+                and local.get("modificado") == info.get("modificado")
+                and local.get("caminho") == caminho
+                and os.path.exists(os.path.join(pasta, caminho))
+            ):
+                continue
+            pendentes.append((file_id, caminho, info.get("modificado")))
+
+        local_thread = threading.local()
+
+        def _servico():
+            if fabrica_servico is None:
+                return service
+            if not hasattr(local_thread, "servico"):
+                local_thread.servico = fabrica_servico()
+            return local_thread.servico
+
+        def _baixar(item):
+            file_id, caminho, _ = item
+            baixar_arquivo(_servico(), file_id, caminho_seguro(pasta, caminho))
+            return os.path.getsize(os.path.join(pasta, caminho))
+
+        baixados, erros = [], []
+        workers = max(1, min(max_workers, len(pendentes)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futuros = [(item, executor.submit(_baixar, item)) for item in pendentes]
+            for (file_id, caminho, modificado), futuro in futuros:
+                try:
+                    tamanho = futuro.result()
+                except Exception as exc:
+                    log.error("Falha ao baixar %s: %s", caminho, exc)
+                    erros.append(f"{caminho}: {exc}")
+                    manifesto.pop(file_id, None)
+                    continue
+                anterior = manifesto.get(file_id)
+                if anterior and anterior["caminho"] != caminho:
+                    try:
+                        os.remove(os.path.join(pasta, anterior["caminho"]))
+                    except OSError:
+                        pass
+                manifesto[file_id] = {
+                    "caminho": caminho,
+                    "modificado": modificado,
+                    "bytes": tamanho,
+                }
+                baixados.append(caminho)
+
+        xmls = sorted(
+            info["caminho"] for info in manifesto.values()
+            if info["caminho"].lower().endswith(".xml")
+        )
+        cache_drive.gravar_meta(
+            entrada,
+            {
+                **meta,
+                "name": f"incremental-{company_id}",
+                "arquivos": manifesto,
+                "xmls": xmls,
+                "bytes": sum(info.get("bytes", 0) for info in manifesto.values()),
+                "ultimo_acesso": time.time(),
+            },
+        )
+        log.info(
+            "Sincronização incremental: %d baixados, %d removidos, %d inalterados",
+            len(baixados),
+            len(removidos),
+            len(manifesto) - len(baixados),
+        )
+        if destino:
+            # Um destino reaproveitado não deve manter XMLs que saíram do índice
+            for caminho in removidos:
+                try:
+                    os.remove(os.path.join(destino, caminho))
+                except OSError:
+                    pass
+        caminhos = cache_drive.entregar(entrada, xmls, destino)
+    return {
+        "xmls": caminhos,
+        "baixados": baixados,
+        "removidos": removidos,
+        "erros": erros,
+    }
+
+
+def _listar_mudancas(service, token: str) -> Tuple[List[dict], str]:
+    """Lê o feed de mudanças a partir de ``token`` e retorna o próximo token."""
+    mudancas: List[dict] = []
+    while True:
+        res = (
+            service.changes()
+            .list(
+                pageToken=token,
+                spaces="drive",
+                includeRemoved=True,
+                pageSize=1000,
+                fields=CAMPOS_MUDANCAS,
+            )
+            .execute()
+        )
+        mudancas.extend(res.get("changes", []))
+        if "newStartPageToken" in res:
+            return mudancas, res["newStartPageToken"]
+        token = res["nextPageToken"]
+
+
+def _aplicar_mudancas(
+    mudancas: List[dict], index: Dict[str, Dict], pastas: Dict[str, str]
+) -> Tuple[Dict[str, Dict], List[str], List[str], bool]:
+    """Aplica as mudanças ao índice e ao mapa de pastas da empresa.
+
+    Retorna ``(novo_index, ids_a_inferir, pastas_novas, rescan)``. Pastas
+    novas podem ter chegado com conteúdo (movidas para a árvore) e precisam
+    ser varridas. ``rescan`` indica uma pasta da empresa renomeada, movida
+    ou removida, caso em que os caminhos abaixo dela só podem ser refeitos
+    com uma nova varredura.
+    """
+    index = dict(index)
+    inferir: List[str] = []
+    novas: List[str] = []
+    for mudanca in mudancas:
+        file_id = mudanca.get("fileId")
+        arquivo = mudanca.get("file") or {}
+        removido = mudanca.get("removed") or arquivo.get("trashed")
+        pai = next((p for p in arquivo.get("parents", []) if p in pastas), None)
+
+        if arquivo.get("mimeType") == "application/vnd.google-apps.folder" or (
+            removido and file_id in pastas
+        ):
+            if file_id in pastas:
+                if removido or pai is None:
+                    return index, [], [], True
+                if pastas[file_id] != os.path.join(pastas[pai], arquivo["name"]):
+                    return index, [], [], True
+            elif pai is not None and not removido:
+                pastas[file_id] = os.path.join(pastas[pai], arquivo["name"])
+                novas.append(file_id)
+            continue
+
+        if removido or pai is None or not arquivo.get("name", "").lower().endswith(".xml"):
+            index.pop(file_id, None)
+            continue
+
+        anterior = index.get(file_id, {})
+        index[file_id] = {
+            "nome": arquivo["name"],
+            "caminho": os.path.join(pastas[pai], arquivo["name"]),
+            "modificado": arquivo.get("modifiedTime"),
+            "tipo": anterior.get("tipo"),
+        }
+        if anterior.get("modificado") != arquivo.get("modifiedTime") or not anterior.get("tipo"):
+            inferir.append(file_id)
+    return index, inferir, novas, False
+
+
+def atualizar_index_por_mudancas(
+    service,
+    company_id: str,
+    cache_dir: Optional[str] = None,
+    fabrica_servico: Optional[Callable[[], Any]] = None,
+) -> Dict[str, Dict]:
+    """Atualiza o ``index_arquivos.json`` usando o feed de mudanças do Drive.
+
+    O token do feed, o mapa de pastas e a cópia do índice ficam no manifesto
+    local da sincronização incremental. Na primeira execução (ou se o
+    manifesto foi descartado do cache) a árvore é varrida por completo;
+    depois, apenas os arquivos adicionados, alterados ou removidos desde a
+    última execução são processados. Sem mudanças, o custo é uma única
+    chamada à API (``changes.list``); para localizar ``company_id`` pelo
+    nome sem outra chamada, ver :func:`sincronizar_empresa_incremental`.
+    """
+    cache_dir = cache_dir or cache_drive.diretorio_cache()
+    if not cache_dir:
+        raise ValueError("Sincronização por mudanças requer o cache do Drive ativo")
+    entrada = _entrada_incremental(cache_dir, company_id)
+    meta = cache_drive.ler_meta(entrada) or {}
+    estado = meta.get("mudancas")
+
+    index = None
+    if estado:
+        mudancas, token = _listar_mudancas(service, estado["token"])
+        pastas = dict(estado["pastas"])
+        index, inferir, novas, rescan = _aplicar_mudancas(
+            mudancas, estado["index"], pastas
+        )
+        if rescan:
+            log.info("Pasta da empresa alterada; refazendo a varredura completa")
+            index = None
+        else:
+            for pasta_id in novas:
+                for arq in _scan_xmls(
+                    service,
+                    pasta_id,
+                    pastas[pasta_id],
+                    fabrica_servico=fabrica_servico,
+                    pastas=pastas,
+                ):
+                    if arq["id"] not in index:
+                        index[arq["id"]] = {
+                            "nome": arq["name"],
+                            "caminho": arq["path"],
+                            "modificado": arq.get("modifiedTime"),
+                            "tipo": None,
+                        }
+                        inferir.append(arq["id"])
+            if index != estado["index"] or inferir:
+                tipos = _inferir_tipos_notas(service, inferir, fabrica_servico)
+                for file_id, tipo in tipos.items():
+                    index[file_id]["tipo"] = tipo
+                _write_index(
+                    service, company_id, index, _buscar_index_id(service, company_id)
+                )
+                log.info("Índice atualizado por %d mudança(s) do Drive", len(mudancas))
+            elif token == estado["token"]:
+                return index
+
+    if index is None:
+        token = (
+            service.changes().getStartPageToken().execute()["startPageToken"]
+        )
+        pastas = {}
+        index = atualizar_index_empresa(service, company_id, fabrica_servico, pastas)
+
+    os.makedirs(entrada, exist_ok=True)
+    meta = cache_drive.ler_meta(entrada) or {}
+    meta["mudancas"] = {"token": token, "pastas": pastas, "index": index}
+    cache_drive.gravar_meta(entrada, meta)
+    return index
+
+
+def sincronizar_por_mudancas(
+    service,
+    company_id: str,
+    cache_dir: Optional[str] = None,
+    **opcoes,
+) -> Dict[str, List[str]]:
+    """Atualiza o índice pelo feed de mudanças e sincroniza a cópia local.
+
+    Combina :func:`atualizar_index_por_mudancas` e
+    :func:`sincronizar_xmls_incremental`; ``opcoes`` são repassadas a esta.
+    """
+    index = atualizar_index_por_mudancas(
+        service, company_id, cache_dir, opcoes.get("fabrica_servico")
+    )
+    return sincronizar_xmls_incremental(
+        service, company_id, cache_dir, index=index, **opcoes
+    )
+
+
 # --------------------------------------------------------------
 # Funções de alto nível exportadas para uso no aplicativo
 # --------------------------------------------------------------
 from .drive_utils import (
+    _buscar_subpasta_id,
     criar_servico_drive as _criar_servico_drive,
     baixar_xmls_empresa_zip as _baixar_xmls_empresa_zip,
 )
 
 
-def criar_servico_drive():
+def criar_servico_drive(escrita: bool = False):
     """Wrapper para ``drive_utils.criar_servico_drive``."""
 
-    return _criar_servico_drive()
+    return _criar_servico_drive(escrita)
 
 
 def baixar_xmls_empresa_zip(
@@ -210,3 +651,71 @@ def baixar_xmls_empresa_zip(
     """Wrapper para ``drive_utils.baixar_xmls_empresa_zip``."""
 
     return _baixar_xmls_empresa_zip(service, pasta_principal_id, nome_empresa, dest_dir)
+
+
+def _ler_pastas_empresas(arquivo: str) -> Dict[str, str]:
+    try:
+        with open(arquivo, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _pasta_empresa(
+    service, pasta_principal_id: str, nome_empresa: str, cache_dir: Optional[str]
+) -> str:
+    """ID da pasta da empresa, guardado no cache após a primeira busca.
+
+    Com o ID em ``<cache>/pastas_empresas.json``, uma sincronização por
+    mudanças sem alterações no Drive não precisa listar a pasta principal.
+    """
+    arquivo = os.path.join(cache_dir, ARQUIVO_PASTAS_EMPRESAS) if cache_dir else None
+    chave = f"{pasta_principal_id}/{nome_empresa}"
+    if arquivo:
+        with _lock_pastas_empresas:
+            empresa_id = _ler_pastas_empresas(arquivo).get(chave)
+        if empresa_id:
+            return empresa_id
+
+    empresa_id = _buscar_subpasta_id(service, pasta_principal_id, nome_empresa)
+    if not empresa_id:
+        raise FileNotFoundError(
+            f"Pasta da empresa '{nome_empresa}' não encontrada no Drive"
+        )
+    if arquivo:
+        with _lock_pastas_empresas:
+            conhecidas = _ler_pastas_empresas(arquivo)
+            conhecidas[chave] = empresa_id
+            os.makedirs(cache_dir, exist_ok=True)
+            temporario = f"{arquivo}.tmp"
+            with open(temporario, "w", encoding="utf-8") as f:
+                json.dump(conhecidas, f, ensure_ascii=False)
+            os.replace(temporario, arquivo)
+    return empresa_id
+
+
+def sincronizar_empresa_incremental(
+    service,
+    pasta_principal_id: str,
+    nome_empresa: str,
+    por_mudancas: bool = False,
+    **opcoes,
+) -> Dict[str, List[str]]:
+    """Localiza a pasta da empresa e sincroniza seus XMLs individualmente.
+
+    Usa :func:`sincronizar_por_mudancas` quando ``por_mudancas`` é verdadeiro
+    e :func:`sincronizar_xmls_incremental` caso contrário. No primeiro modo
+    o ID da pasta vem do cache depois da primeira execução, e uma execução
+    sem mudanças custa uma única chamada à API.
+    """
+
+    if por_mudancas:
+        cache_dir = opcoes.get("cache_dir") or cache_drive.diretorio_cache()
+        empresa_id = _pasta_empresa(service, pasta_principal_id, nome_empresa, cache_dir)
+        return sincronizar_por_mudancas(service, empresa_id, **opcoes)
+    empresa_id = _buscar_subpasta_id(service, pasta_principal_id, nome_empresa)
+    if not empresa_id:
+        raise FileNotFoundError(
+            f"Pasta da empresa '{nome_empresa}' não encontrada no Drive"
+        )
+    return sincronizar_xmls_incremental(service, empresa_id, **opcoes)
@@ -1,8 +1,10 @@
 
 import streamlit as st
 import pandas as pd
+import hashlib
 import io
 import json
+from typing import Callable
 
 # Usar importações relativas para funcionar quando ``utils`` é um pacote
 from .filtros_utils import obter_anos_meses_unicos, aplicar_filtro_periodo
@@ -11,6 +13,8 @@ from .formatador_utils import (
     formatar_percentual,
     formatar_data_curta,
 )
+from .exportacao_utils import estimar_larguras
+from .metricas_utils import coletar_metricas, etapa, medidor_atual
 
 # Carregar configurações de formatação se existirem
 try:
@@ -25,6 +29,56 @@ except FileNotFoundError:
         "texto": [],
     }
 
+def impressao_digital(df: pd.DataFrame) -> str:
+    """Retorna um hash do conteúdo de ``df`` (valores, colunas e tipos)."""
+    h = hashlib.sha1()
+    h.update(repr([(str(c), str(t)) for c, t in df.dtypes.items()]).encode("utf-8"))
+    if len(df):
+        h.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return h.hexdigest()
+
+
+# Arquivos gerados para download, guardados na sessão: {nome: (chave, bytes)}
+CHAVE_ARQUIVOS_SESSAO = "arquivos_gerados"
+
+
+def _conteudo_em_cache(nome: str, chave: str, gerar: Callable[[], bytes]) -> bytes:
+    arquivos = st.session_state.setdefault(CHAVE_ARQUIVOS_SESSAO, {})
+    guardado = arquivos.get(nome)
+    if guardado is None or guardado[0] != chave:
+        # A versão anterior do arquivo é descartada antes de gerar a nova
+        arquivos.pop(nome, None)
+        guardado = arquivos[nome] = (chave, gerar())
+    return guardado[1]
+
+
+def conteudo_sob_demanda(
+    nome: str, gerar: Callable[[], bytes], *frames: pd.DataFrame
+) -> Callable[[], bytes]:
+    """Prepara o ``data`` de um ``st.download_button`` gerado apenas no clique.
+
+    O Streamlit só executa o callable quando o usuário clica no botão. O
+    resultado é memoizado por ``nome`` e pela impressão digital dos
+    ``frames`` de origem, de modo que reexecuções da página não geram
+    arquivos e cliques repetidos sobre os mesmos dados reaproveitam o
+    conteúdo já produzido. O conteúdo fica na sessão, apenas na versão
+    mais recente de cada ``nome``, e é liberado com ela. A geração é
+    medida como a etapa ``exportacao <nome>`` no medidor ativo quando o
+    botão foi criado.
+    """
+    medidor = medidor_atual()
+
+    def _gerar_medido() -> bytes:
+        with coletar_metricas(medidor), etapa(f"exportacao {nome}", entrada=frames[0] if frames else None):
+            return gerar()
+
+    def _carregar() -> bytes:
+        chave = ":".join([nome] + [impressao_digital(df) for df in frames])
+        return _conteudo_em_cache(nome, chave, _gerar_medido if medidor is not None else gerar)
+
+    return _carregar
+
+
 def formatar_df_exibicao(df):
     df = df.copy()
     for col in df.columns:
@@ -53,37 +107,40 @@ def criar_aba_padrao(titulo, df, coluna_data=None):
     df_formatado = formatar_df_exibicao(df)
     st.dataframe(df_formatado, use_container_width=True)
 
-    # Exportação Excel individual
-    buffer = io.BytesIO()
-    with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
-        df_temp = df.copy()
-        for col in df_temp.columns:
-            if any(key in col for key in formato.get("moeda", [])):
-                df_temp[col] = pd.to_numeric(df_temp[col], errors='coerce')
-            elif any(key in col for key in formato.get("percentual", [])):
-                df_temp[col] = pd.to_numeric(df_temp[col], errors='coerce')
-            elif col in formato.get("inteiro", []):
-                df_temp[col] = pd.to_numeric(df_temp[col], errors='coerce').fillna(0).astype(int)
-            elif any(p in col for p in ["Data", "Mês", "Trimestre"]):
-                df_temp[col] = pd.to_datetime(df_temp[col], errors='coerce').dt.strftime("%d/%m/%Y")
-
-        df_temp.to_excel(writer, sheet_name=titulo[:31], index=False)
-        worksheet = writer.sheets[titulo[:31]]
-        for i, col in enumerate(df_temp.columns):
-            if any(key in col for key in formato.get("moeda", [])):
-                worksheet.set_column(i, i, 14, writer.book.add_format({"num_format": "R$ #,##0.00"}))
-            elif any(key in col for key in formato.get("percentual", [])):
-                worksheet.set_column(i, i, 12, writer.book.add_format({"num_format": "0.00%"}))
-            elif any(key in col for key in formato.get("texto", [])):
-                worksheet.set_column(i, i, 20, writer.book.add_format({"num_format": "@"}))
-            elif col in formato.get("inteiro", []):
-                worksheet.set_column(i, i, 10, writer.book.add_format({"num_format": "0"}))
-            else:
-                worksheet.set_column(i, i, 18)
+    # Exportação Excel individual, gerada apenas quando solicitada
+    def _gerar_excel() -> bytes:
+        buffer = io.BytesIO()
+        with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
+            df_temp = df.copy()
+            for col in df_temp.columns:
+                if any(key in col for key in formato.get("moeda", [])):
+                    df_temp[col] = pd.to_numeric(df_temp[col], errors='coerce')
+                elif any(key in col for key in formato.get("percentual", [])):
+                    df_temp[col] = pd.to_numeric(df_temp[col], errors='coerce')
+                elif col in formato.get("inteiro", []):
+                    df_temp[col] = pd.to_numeric(df_temp[col], errors='coerce').fillna(0).astype(int)
+                elif any(p in col for p in ["Data", "Mês", "Trimestre"]):
+                    df_temp[col] = pd.to_datetime(df_temp[col], errors='coerce').dt.strftime("%d/%m/%Y")
+
+            df_temp.to_excel(writer, sheet_name=titulo[:31], index=False)
+            worksheet = writer.sheets[titulo[:31]]
+            larguras = estimar_larguras(df_temp)
+            for i, col in enumerate(df_temp.columns):
+                if any(key in col for key in formato.get("moeda", [])):
+                    worksheet.set_column(i, i, 14, writer.book.add_format({"num_format": "R$ #,##0.00"}))
+                elif any(key in col for key in formato.get("percentual", [])):
+                    worksheet.set_column(i, i, 12, writer.book.add_format({"num_format": "0.00%"}))
+                elif any(key in col for key in formato.get("texto", [])):
+                    worksheet.set_column(i, i, 20, writer.book.add_format({"num_format": "@"}))
+                elif col in formato.get("inteiro", []):
+                    worksheet.set_column(i, i, 10, writer.book.add_format({"num_format": "0"}))
+                else:
+                    worksheet.set_column(i, i, larguras[i])
+        return buffer.getvalue()
 
     st.download_button(
         label=f"📥 Baixar {titulo}.xlsx",
-        data=buffer.getvalue(),
+        data=conteudo_sob_demanda(f"{titulo}.xlsx", _gerar_excel, df),
         file_name=f"{titulo}.xlsx",
         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
     )
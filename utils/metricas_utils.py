@@ -0,0 +1,234 @@
+"""Medição das etapas do processamento: tempo, linhas e memória.
+
+Os módulos marcam trechos com :func:`etapa`; sem um medidor ativo (ver
+:func:`coletar_metricas`) a marcação não registra nada e custa apenas
+uma consulta a uma ``ContextVar``. Com ``tracemalloc`` ativo, cada etapa
+registra também o pico de memória alocada por ela.
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - Windows
+    resource = None
+
+PREFIXO_PROMETHEUS = "nfe"
+
+
+def _linhas(obj: Any) -> Optional[int]:
+    if obj is None:
+        return None
+    try:
+        return len(obj)
+    except TypeError:
+        return None
+
+
+def _rss_maximo_bytes() -> Optional[int]:
+    """Maior RSS do processo até agora (``ru_maxrss`` vem em KB no Linux)."""
+    if resource is None:
+        return None
+    maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maximo if sys.platform == "darwin" else maximo * 1024
+
+
+class Etapa:
+    """Medidas de uma execução de :func:`etapa`."""
+
+    def __init__(self, nome: str, linhas_entrada: Optional[int] = None):
+        self.nome = nome
+        self.linhas_entrada = linhas_entrada
+        self.linhas_saida: Optional[int] = None
+        self.segundos = 0.0
+        self.pico_alocado_bytes: Optional[int] = None
+        self.rss_maximo_bytes: Optional[int] = None
+        self._pico_absoluto = 0
+
+    def saida(self, resultado: Any) -> Any:
+        """Registra as linhas de ``resultado`` e o devolve."""
+        self.linhas_saida = _linhas(resultado)
+        return resultado
+
+    def como_dict(self) -> Dict[str, Any]:
+        return {
+            "etapa": self.nome,
+            "segundos": round(self.segundos, 6),
+            "linhas_entrada": self.linhas_entrada,
+            "linhas_saida": self.linhas_saida,
+            "pico_alocado_bytes": self.pico_alocado_bytes,
+            "rss_maximo_bytes": self.rss_maximo_bytes,
+        }
+
+
+class MedidorEtapas:
+    """Acumula as etapas e contadores de uma execução."""
+
+    def __init__(self):
+        self.etapas: List[Etapa] = []
+        self.contadores: Counter = Counter()
+
+    @contextmanager
+    def etapa(self, nome: str, entrada: Any = None) -> Iterator[Etapa]:
+        registro = Etapa(nome, _linhas(entrada))
+        mae = _etapa_atual.get()
+        token = _etapa_atual.set(registro)
+        medir_memoria = tracemalloc.is_tracing()
+        if medir_memoria:
+            inicial = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        inicio = time.perf_counter()
+        try:
+            yield registro
+        finally:
+            registro.segundos = time.perf_counter() - inicio
+            _etapa_atual.reset(token)
+            if medir_memoria and tracemalloc.is_tracing():
+                # reset_peak nas etapas internas apaga o pico desta; elas o repassam
+                pico = max(tracemalloc.get_traced_memory()[1], registro._pico_absoluto)
+                registro.pico_alocado_bytes = max(0, pico - inicial)
+                if mae is not None:
+                    mae._pico_absoluto = max(mae._pico_absoluto, pico)
+            registro.rss_maximo_bytes = _rss_maximo_bytes()
+            self.etapas.append(registro)
+
+    def contar(self, nome: str, quantidade: int = 1) -> None:
+        self.contadores[nome] += quantidade
+
+    def tabela(self) -> List[Dict[str, Any]]:
+        """Linhas para exibição, na ordem em que as etapas terminaram."""
+        mb = 1024 * 1024
+        return [
+            {
+                "Etapa": e.nome,
+                "Tempo (s)": round(e.segundos, 3),
+                "Linhas entrada": e.linhas_entrada,
+                "Linhas saída": e.linhas_saida,
+                "Pico alocado (MB)": (
+                    round(e.pico_alocado_bytes / mb, 1) if e.pico_alocado_bytes is not None else None
+                ),
+                "RSS máximo (MB)": (
+                    round(e.rss_maximo_bytes / mb, 1) if e.rss_maximo_bytes is not None else None
+                ),
+            }
+            for e in self.etapas
+        ]
+
+    def para_json(self) -> str:
+        return json.dumps(
+            {
+                "etapas": [e.como_dict() for e in self.etapas],
+                "contadores": dict(self.contadores),
+            },
+            ensure_ascii=False,
+            indent=2,
+        )
+
+    def para_prometheus(self) -> str:
+        """Formato de texto do Prometheus (ex.: para o textfile collector).
+
+        Etapas repetidas são somadas no tempo; das linhas vale a última
+        execução e da memória, o maior pico.
+        """
+        por_nome: Dict[str, Dict[str, Any]] = {}
+        for e in self.etapas:
+            atual = por_nome.setdefault(
+                e.nome, {"segundos": 0.0, "linhas_entrada": None, "linhas_saida": None, "pico_alocado_bytes": None}
+            )
+            atual["segundos"] += e.segundos
+            for campo in ("linhas_entrada", "linhas_saida"):
+                if getattr(e, campo) is not None:
+                    atual[campo] = getattr(e, campo)
+            if e.pico_alocado_bytes is not None:
+                atual["pico_alocado_bytes"] = max(atual["pico_alocado_bytes"] or 0, e.pico_alocado_bytes)
+
+        metricas = [
+            ("etapa_segundos", "Duração da etapa em segundos.", "segundos"),
+            ("etapa_linhas_entrada", "Linhas recebidas pela etapa.", "linhas_entrada"),
+            ("etapa_linhas_saida", "Linhas produzidas pela etapa.", "linhas_saida"),
+            ("etapa_pico_alocado_bytes", "Pico de memória alocada na etapa (tracemalloc).", "pico_alocado_bytes"),
+        ]
+        linhas: List[str] = []
+        for sufixo, ajuda, campo in metricas:
+            valores = [(nome, v[campo]) for nome, v in por_nome.items() if v[campo] is not None]
+            if not valores:
+                continue
+            nome_metrica = f"{PREFIXO_PROMETHEUS}_{sufixo}"
+            linhas += [f"# HELP {nome_metrica} {ajuda}", f"# TYPE {nome_metrica} gauge"]
+            linhas += [f'{nome_metrica}{{etapa="{_rotulo(nome)}"}} {valor}' for nome, valor in valores]
+        rss = _rss_maximo_bytes()
+        if rss is not None:
+            nome_metrica = f"{PREFIXO_PROMETHEUS}_rss_maximo_bytes"
+            linhas += [
+                f"# HELP {nome_metrica} Maior RSS do processo.",
+                f"# TYPE {nome_metrica} gauge",
+                f"{nome_metrica} {rss}",
+            ]
+        if self.contadores:
+            nome_metrica = f"{PREFIXO_PROMETHEUS}_contador_total"
+            linhas += [f"# HELP {nome_metrica} Contadores da extração.", f"# TYPE {nome_metrica} counter"]
+            linhas += [
+                f'{nome_metrica}{{nome="{_rotulo(nome)}"}} {valor}'
+                for nome, valor in sorted(self.contadores.items())
+            ]
+        return "\n".join(linhas) + "\n"
+
+    def salvar(self, caminho: str) -> None:
+        """Grava em Prometheus (``.prom``/``.txt``) ou JSON (demais extensões)."""
+        prometheus = caminho.lower().endswith((".prom", ".txt"))
+        with open(caminho, "w", encoding="utf-8") as f:
+            f.write(self.para_prometheus() if prometheus else self.para_json())
+
+
+def _rotulo(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+_medidor_atual: ContextVar[Optional[MedidorEtapas]] = ContextVar("medidor_etapas", default=None)
+_etapa_atual: ContextVar[Optional[Etapa]] = ContextVar("etapa_atual", default=None)
+
+
+def medidor_atual() -> Optional[MedidorEtapas]:
+    return _medidor_atual.get()
+
+
+@contextmanager
+def coletar_metricas(medidor: Optional[MedidorEtapas] = None) -> Iterator[MedidorEtapas]:
+    """Ativa ``medidor`` (ou um novo) para as etapas executadas no bloco."""
+    medidor = medidor if medidor is not None else MedidorEtapas()
+    token = _medidor_atual.set(medidor)
+    try:
+        yield medidor
+    finally:
+        _medidor_atual.reset(token)
+
+
+@contextmanager
+def etapa(nome: str, entrada: Any = None) -> Iterator[Etapa]:
+    """Mede o bloco como a etapa ``nome`` no medidor ativo, se houver.
+
+    ``entrada`` (um DataFrame ou lista) define as linhas de entrada; as de
+    saída são informadas com :meth:`Etapa.saida`.
+    """
+    medidor = _medidor_atual.get()
+    if medidor is None:
+        yield Etapa(nome)
+        return
+    with medidor.etapa(nome, entrada) as registro:
+        yield registro
+
+
+def contar(nome: str, quantidade: int = 1) -> None:
+    """Soma ``quantidade`` ao contador ``nome`` do medidor ativo, se houver."""
+    medidor = _medidor_atual.get()
+    if medidor is not None:
+        medidor.contar(nome, quantidade)
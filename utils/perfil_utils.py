@@ -0,0 +1,128 @@
+"""Perfil de CPU (cProfile) e de memória (tracemalloc) sob demanda.
+
+:func:`perfilar` envolve um trecho e grava em ``destino`` os artefatos
+brutos, para anexar a chamados e abrir com ``pstats``/``snakeviz`` ou
+``tracemalloc.Snapshot.load``, e resumos em texto com as funções e os
+pontos de alocação mais custosos:
+
+* ``perfil.prof`` e ``perfil.txt`` (cProfile);
+* ``memoria.snapshot`` e ``memoria.txt`` (tracemalloc).
+
+O cProfile acompanha apenas a thread que executa o trecho; workers de
+threads ou processos não aparecem no perfil.
+"""
+
+from __future__ import annotations
+
+import cProfile
+import io
+import os
+import pstats
+import tracemalloc
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+from utils.metricas_utils import MedidorEtapas
+
+TOP_PADRAO = 25
+# Um quadro basta para agrupar por linha e custa cerca de um terço de dez;
+# para tracebacks completos, inicie o Python com PYTHONTRACEMALLOC=10
+QUADROS_TRACEMALLOC = 1
+# Alocações do próprio tracemalloc e do mecanismo de import não interessam
+_FILTROS_MEMORIA = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+    tracemalloc.Filter(False, cProfile.__file__),
+)
+
+
+def resumo_cpu(perfil: cProfile.Profile, top: int = TOP_PADRAO) -> str:
+    """Funções com maior tempo acumulado e com maior tempo próprio."""
+    saida = io.StringIO()
+    estatisticas = pstats.Stats(perfil, stream=saida).strip_dirs()
+    estatisticas.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+    estatisticas.sort_stats(pstats.SortKey.TIME).print_stats(top)
+    return saida.getvalue()
+
+
+def resumo_memoria(snapshot: tracemalloc.Snapshot, pico: int, top: int = TOP_PADRAO) -> str:
+    """Linhas de código que mais retêm memória no fim do trecho, e o pico."""
+    linhas = [f"Pico de memória alocada no trecho: {pico / 1024 / 1024:.1f} MB", ""]
+    estatisticas = snapshot.filter_traces(_FILTROS_MEMORIA).statistics("lineno")
+    total = sum(stat.size for stat in estatisticas)
+    linhas.append(f"Retido no fim: {total / 1024 / 1024:.1f} MB em {len(estatisticas)} linhas")
+    for posicao, stat in enumerate(estatisticas[:top], 1):
+        quadro = stat.traceback[0]
+        linhas.append(
+            f"{posicao:>3}. {quadro.filename}:{quadro.lineno}: "
+            f"{stat.size / 1024:.1f} KB em {stat.count} blocos"
+        )
+    return "\n".join(linhas) + "\n"
+
+
+class ResultadoPerfil:
+    """Caminhos gravados por :func:`perfilar` e os resumos em texto."""
+
+    def __init__(self):
+        self.arquivos: List[str] = []
+        self.cpu: Optional[str] = None
+        self.memoria: Optional[str] = None
+
+
+@contextmanager
+def perfilar(
+    destino: str,
+    cpu: bool = True,
+    memoria: bool = False,
+    top: int = TOP_PADRAO,
+) -> Iterator[ResultadoPerfil]:
+    """Perfila o bloco e grava os artefatos em ``destino``.
+
+    O :class:`ResultadoPerfil` entregue é preenchido ao final do bloco. Se
+    o tracemalloc já estiver ativo, ele continua ativo depois.
+    """
+    resultado = ResultadoPerfil()
+    os.makedirs(destino, exist_ok=True)
+    perfil = cProfile.Profile() if cpu else None
+    iniciou_tracemalloc = memoria and not tracemalloc.is_tracing()
+    if iniciou_tracemalloc:
+        tracemalloc.start(QUADROS_TRACEMALLOC)
+    if perfil is not None:
+        perfil.enable()
+    try:
+        # Medido como etapa: as etapas internas zeram o pico do tracemalloc
+        # e repassam o seu à etapa que as contém
+        with MedidorEtapas().etapa("perfil") as medida:
+            yield resultado
+    finally:
+        if perfil is not None:
+            perfil.disable()
+        if memoria:
+            # Antes do resumo de CPU, para não contar as alocações do pstats
+            snapshot = tracemalloc.take_snapshot()
+            pico = medida.pico_alocado_bytes or 0
+            if iniciou_tracemalloc:
+                tracemalloc.stop()
+            caminho = os.path.join(destino, "memoria.snapshot")
+            snapshot.dump(caminho)
+            resultado.memoria = resumo_memoria(snapshot, pico, top)
+            resultado.arquivos += [
+                caminho,
+                _gravar_texto(os.path.join(destino, "memoria.txt"), resultado.memoria),
+            ]
+        if perfil is not None:
+            caminho = os.path.join(destino, "perfil.prof")
+            perfil.dump_stats(caminho)
+            resultado.cpu = resumo_cpu(perfil, top)
+            resultado.arquivos = [
+                caminho,
+                _gravar_texto(os.path.join(destino, "perfil.txt"), resultado.cpu),
+            ] + resultado.arquivos
+
+
+def _gravar_texto(caminho: str, texto: str) -> str:
+    with open(caminho, "w", encoding="utf-8") as f:
+        f.write(texto)
+    return caminho
@@ -0,0 +1,107 @@
+"""Quarentena de XMLs que falharam no parse.
+
+Cada falha é guardada pelo SHA-256 do conteúdo, com o caminho em que o
+arquivo foi visto e o motivo. Em execuções seguintes o mesmo conteúdo é
+descartado sem novo parse, esteja onde estiver; um arquivo corrigido tem
+outro resumo e volta a ser processado. :meth:`Quarentena.liberar` força a
+reverificação.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+log = logging.getLogger(__name__)
+
+
+def resumo_conteudo(conteudo) -> str:
+    """SHA-256 (hexadecimal) de ``conteudo`` (bytes ou memoryview)."""
+    return hashlib.sha256(conteudo).hexdigest()
+
+
+class Quarentena:
+    """Falhas de parse por resumo do conteúdo, opcionalmente persistidas em ``arquivo``.
+
+    Pode ser compartilhada entre threads. Para processos, os workers
+    recebem :meth:`entradas` e devolvem o que registraram com :meth:`novas`.
+    """
+
+    def __init__(self, arquivo: Optional[str] = None):
+        self.arquivo = arquivo
+        self._entradas: Dict[str, list] = {}
+        self._novas: Dict[str, list] = {}
+        self._alterado = False
+        self._lock = threading.Lock()
+        if arquivo and os.path.exists(arquivo):
+            try:
+                with open(arquivo, encoding="utf-8") as f:
+                    self._entradas = json.load(f)
+            except (OSError, ValueError) as e:
+                log.warning(f"Quarentena ignorada ({arquivo}): {e}")
+
+    def motivo(self, resumo: str) -> Optional[str]:
+        """Motivo da quarentena do conteúdo ``resumo``; ``None`` se não estiver nela."""
+        entrada = self._entradas.get(resumo)
+        return entrada[1] if entrada else None
+
+    def registrar(self, resumo: str, caminho: str, motivo: str) -> None:
+        entrada = [caminho, motivo, datetime.now().isoformat(timespec="seconds")]
+        with self._lock:
+            self._entradas[resumo] = entrada
+            self._novas[resumo] = entrada
+            self._alterado = True
+
+    def incluir(self, entradas: Dict[str, list]) -> None:
+        """Acrescenta entradas registradas em outra instância (ex.: num worker)."""
+        if not entradas:
+            return
+        with self._lock:
+            self._entradas.update(entradas)
+            self._alterado = True
+
+    def entradas(self) -> Dict[str, list]:
+        with self._lock:
+            return dict(self._entradas)
+
+    def novas(self) -> Dict[str, list]:
+        """Entradas registradas desde a última chamada."""
+        with self._lock:
+            novas, self._novas = self._novas, {}
+        return novas
+
+    def liberar(self, resumos: Optional[Iterable[str]] = None) -> int:
+        """Remove ``resumos`` (todos, se omitido) para que sejam reverificados."""
+        with self._lock:
+            alvos = list(self._entradas) if resumos is None else list(resumos)
+            removidos = sum(self._entradas.pop(r, None) is not None for r in alvos)
+            self._alterado = self._alterado or bool(removidos)
+        return removidos
+
+    def relatorio(self) -> List[Dict[str, str]]:
+        """Uma linha por conteúdo em quarentena, da mais recente para a mais antiga."""
+        linhas = [
+            {"Arquivo": caminho, "Motivo": motivo, "Registrado em": data, "SHA-256": resumo}
+            for resumo, (caminho, motivo, data) in self.entradas().items()
+        ]
+        return sorted(linhas, key=lambda linha: linha["Registrado em"], reverse=True)
+
+    def salvar(self) -> None:
+        if not self.arquivo or not self._alterado:
+            return
+        temporario = f"{self.arquivo}.tmp"
+        os.makedirs(os.path.dirname(os.path.abspath(self.arquivo)), exist_ok=True)
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump(self.entradas(), f)
+        os.replace(temporario, self.arquivo)
+        self._alterado = False
+
+
+def quarentena_padrao() -> Quarentena:
+    """Quarentena persistida em ``NFE_QUARENTENA``, ou apenas em memória."""
+    return Quarentena(os.getenv("NFE_QUARENTENA") or None)
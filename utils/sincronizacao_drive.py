@@ -0,0 +1,170 @@
+"""Sincronização concorrente dos XMLs de todas as empresas com o Google Drive."""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from .drive_utils import (
+    LimitadorTaxa,
+    ServicoLimitado,
+    baixar_xmls_empresa_zip,
+    criar_servico_drive,
+)
+from .google_drive_utils import ROOT_FOLDER_ID, sincronizar_empresa_incremental
+
+log = logging.getLogger(__name__)
+
+CONFIG_EMPRESAS = os.path.join(
+    os.path.dirname(__file__), "..", "config", "empresas_config.json"
+)
+
+# Limite padrão de chamadas à API do Drive compartilhado por todos os workers
+CHAMADAS_POR_SEGUNDO = 10.0
+
+
+def carregar_empresas(caminho: str = CONFIG_EMPRESAS) -> List[str]:
+    """Retorna os nomes das empresas definidas em ``empresas_config.json``."""
+    with open(caminho, encoding="utf-8") as f:
+        return list(json.load(f).keys())
+
+
+def _nome_diretorio(nome_empresa: str) -> str:
+    """Converte o nome da empresa em um nome de diretório seguro."""
+    return re.sub(r"[^\w.-]+", "_", nome_empresa).strip("_") or "empresa"
+
+
+def sincronizar_empresas(
+    destino: str,
+    empresas: Optional[Iterable[str]] = None,
+    *,
+    pasta_principal_id: str = ROOT_FOLDER_ID,
+    fabrica_servico: Optional[Callable[[], Any]] = None,
+    max_workers: int = 4,
+    chamadas_por_segundo: float = CHAMADAS_POR_SEGUNDO,
+    tentativas: int = 5,
+    dormir: Callable[[float], None] = time.sleep,
+    por_mudancas: bool = False,
+) -> Dict[str, Dict[str, Any]]:
+    """Baixa e extrai os ZIPs de todas as ``empresas`` em paralelo.
+
+    Com ``por_mudancas`` os XMLs são sincronizados individualmente pelo feed
+    de mudanças do Drive, no cache local, em vez de baixar o ZIP, e entregues
+    na mesma pasta de ``destino`` (ver
+    :func:`utils.google_drive_utils.sincronizar_por_mudancas`); a fábrica
+    padrão pede então o escopo de escrita, para regravar o
+    ``index_arquivos.json``.
+
+    Cada worker obtém o serviço com ``fabrica_servico``; a fábrica padrão
+    devolve o mesmo serviço a todos, que pode ser usado por várias threads
+    (ver :mod:`utils.drive_cliente`). Todos compartilham um
+    :class:`LimitadorTaxa`, de modo que o total de chamadas à API respeita
+    ``chamadas_por_segundo`` independentemente do número de workers; erros
+    transitórios são repetidos com backoff exponencial.
+
+    Retorna ``{empresa: {"xmls": [...], "erro": str | None, "duracao": s}}``.
+    Falhas de uma empresa não interrompem as demais.
+    """
+    if empresas is None:
+        empresas = carregar_empresas()
+    empresas = list(empresas)
+    if fabrica_servico is None:
+        fabrica_servico = partial(criar_servico_drive, escrita=por_mudancas)
+    limitador = LimitadorTaxa(chamadas_por_segundo, dormir=dormir)
+    local = threading.local()
+
+    def _servico():
+        if not hasattr(local, "servico"):
+            local.servico = ServicoLimitado(
+                fabrica_servico(),
+                limitador=limitador,
+                tentativas=tentativas,
+                dormir=dormir,
+            )
+        return local.servico
+
+    def _sincronizar(nome: str) -> Dict[str, Any]:
+        inicio = time.perf_counter()
+        resultado: Dict[str, Any] = {"xmls": [], "erro": None}
+        try:
+            if por_mudancas:
+                resultado["xmls"] = sincronizar_empresa_incremental(
+                    _servico(),
+                    pasta_principal_id,
+                    nome,
+                    por_mudancas=True,
+                    destino=os.path.join(destino, _nome_diretorio(nome)),
+                )["xmls"]
+            else:
+                resultado["xmls"] = baixar_xmls_empresa_zip(
+                    _servico(),
+                    pasta_principal_id,
+                    nome,
+                    os.path.join(destino, _nome_diretorio(nome)),
+                )
+            log.info("Empresa '%s' sincronizada: %d XMLs", nome, len(resultado["xmls"]))
+        except Exception as exc:
+            log.error("Falha ao sincronizar '%s': %s", nome, exc)
+            resultado["erro"] = f"{type(exc).__name__}: {exc}"
+        resultado["duracao"] = time.perf_counter() - inicio
+        return resultado
+
+    if not empresas:
+        return {}
+    with ThreadPoolExecutor(
+        max_workers=max(1, min(max_workers, len(empresas))),
+        thread_name_prefix="sync-drive",
+    ) as executor:
+        resultados = dict(zip(empresas, executor.map(_sincronizar, empresas)))
+    return resultados
+
+
+if __name__ == "__main__":  # pragma: no cover - uso via linha de comando
+    import argparse
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s: %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    parser = argparse.ArgumentParser(
+        description="Sincroniza os XMLs de todas as empresas a partir do Google Drive"
+    )
+    parser.add_argument("--destino", required=True, help="Diretório local dos XMLs")
+    parser.add_argument("--empresa", nargs="+", help="Empresas específicas (padrão: todas)")
+    parser.add_argument("--workers", type=int, default=4, help="Empresas processadas em paralelo")
+    parser.add_argument(
+        "--taxa",
+        type=float,
+        default=CHAMADAS_POR_SEGUNDO,
+        help="Máximo de chamadas à API do Drive por segundo",
+    )
+    parser.add_argument(
+        "--mudancas",
+        action="store_true",
+        help="Sincroniza XMLs individuais pelo feed de mudanças em vez do ZIP",
+    )
+    args = parser.parse_args()
+
+    resultados = sincronizar_empresas(
+        args.destino,
+        args.empresa,
+        max_workers=args.workers,
+        chamadas_por_segundo=args.taxa,
+        por_mudancas=args.mudancas,
+    )
+    falhas = 0
+    for nome, res in resultados.items():
+        if res["erro"]:
+            falhas += 1
+            log.error("%s: %s", nome, res["erro"])
+        else:
+            log.info("%s: %d XMLs em %.1fs", nome, len(res["xmls"]), res["duracao"])
+    raise SystemExit(1 if falhas else 0)
@@ -0,0 +1,208 @@
+"""Triagem rápida de XMLs fiscais pelos primeiros bytes do arquivo.
+
+O elemento raiz e a chave de acesso (``infNFe/@Id``) aparecem logo no
+início do documento. Lê-los com expressões regulares sobre alguns KB
+permite encaminhar cada arquivo sem o parse completo:
+
+* ``NFe``/``nfeProc`` seguem para a extração, uma vez por chave de acesso;
+* eventos (``procEventoNFe`` e afins) só têm o cancelamento registrado;
+* qualquer outro documento é ignorado.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+log = logging.getLogger(__name__)
+
+BYTES_TRIAGEM = 8192
+TIPO_NFE = "nfe"
+TIPO_EVENTO = "evento"
+TIPO_OUTRO = "outro"
+RAIZES_NFE = {"NFe", "nfeProc"}
+RAIZES_EVENTO = {"procEventoNFe", "evento", "envEvento"}
+EVENTO_CANCELAMENTO = "110111"
+# 135: evento vinculado à NF-e; 155: cancelamento homologado fora de prazo
+STATUS_EVENTO_HOMOLOGADO = {"135", "155"}
+
+_RE_RAIZ = re.compile(rb"<(?![?!])(?:[\w.-]+:)?([\w.-]+)")
+_RE_CHAVE = re.compile(
+    rb"<(?:[\w.-]+:)?infNFe\b[^>]*?\bId\s*=\s*[\"']NFe(\d{44})[\"']", re.S
+)
+
+Triagem = Tuple[str, Optional[str], bool]
+
+
+def _tipo_documento(inicio: bytes) -> str:
+    achado = _RE_RAIZ.search(inicio)
+    if achado is None:
+        # Raiz fora do trecho lido: a extração decide
+        return TIPO_NFE
+    raiz = achado.group(1).decode("ascii", "replace")
+    if raiz in RAIZES_NFE:
+        return TIPO_NFE
+    if raiz in RAIZES_EVENTO:
+        return TIPO_EVENTO
+    return TIPO_OUTRO
+
+
+def triar_conteudo(inicio: bytes) -> Triagem:
+    """Retorna ``(tipo, chave, autorizada)`` a partir dos primeiros bytes.
+
+    ``tipo`` é :data:`TIPO_NFE`, :data:`TIPO_EVENTO` ou :data:`TIPO_OUTRO`.
+    Para NF-e, ``chave`` são os 44 dígitos da chave de acesso (``None`` se
+    não estiver no trecho lido) e ``autorizada`` indica um ``nfeProc``, que
+    traz o protocolo de autorização e é preferido ao ``NFe`` avulso. Para
+    eventos, ``chave`` é preenchida por :func:`chave_cancelada`.
+    """
+    tipo = _tipo_documento(inicio)
+    if tipo != TIPO_NFE:
+        return tipo, None, False
+    achado = _RE_CHAVE.search(inicio)
+    chave = achado.group(1).decode("ascii") if achado else None
+    raiz = _RE_RAIZ.search(inicio)
+    return tipo, chave, bool(raiz and raiz.group(1) == b"nfeProc")
+
+
+def chave_cancelada(conteudo: bytes) -> Optional[str]:
+    """Chave da NF-e cancelada por um XML de evento, se for o caso.
+
+    Retorna ``None`` para outros eventos (CC-e, manifestações) e para
+    cancelamentos sem retorno homologado da SEFAZ, inclusive pedidos
+    (``envEvento``) ainda sem ``retEvento``.
+    """
+    try:
+        raiz = ET.fromstring(conteudo)
+    except ET.ParseError as e:
+        log.warning(f"Evento ilegível ignorado: {e}")
+        return None
+    campos: Dict[str, str] = {}
+    status: Optional[str] = None
+    for elemento in raiz.iter():
+        nome = elemento.tag.rsplit("}", 1)[-1]
+        if nome == "cStat":
+            status = (elemento.text or "").strip()
+        elif nome in ("tpEvento", "chNFe") and nome not in campos:
+            campos[nome] = (elemento.text or "").strip()
+    if campos.get("tpEvento") != EVENTO_CANCELAMENTO:
+        return None
+    if status not in STATUS_EVENTO_HOMOLOGADO:
+        return None
+    return campos.get("chNFe") or None
+
+
+def triar_arquivo(caminho: str, limite: int = BYTES_TRIAGEM) -> Triagem:
+    """Como :func:`triar_conteudo`, lendo apenas ``limite`` bytes de ``caminho``.
+
+    Eventos são lidos por inteiro (são pequenos) para obter o cancelamento.
+    """
+    with open(caminho, "rb") as f:
+        inicio = f.read(limite)
+        tipo, chave, autorizada = triar_conteudo(inicio)
+        if tipo == TIPO_EVENTO:
+            chave = chave_cancelada(inicio + f.read())
+    return tipo, chave, autorizada
+
+
+class IndiceChaves:
+    """Triagens já feitas, opcionalmente persistidas em ``arquivo``.
+
+    O índice guarda, por caminho, o tamanho e o ``mtime`` do arquivo junto
+    com o resultado da triagem; enquanto o arquivo não muda, execuções
+    seguintes não precisam abri-lo de novo.
+    """
+
+    def __init__(self, arquivo: Optional[str] = None):
+        self.arquivo = arquivo
+        self._entradas: Dict[str, list] = {}
+        self._alterado = False
+        if arquivo and os.path.exists(arquivo):
+            try:
+                with open(arquivo, encoding="utf-8") as f:
+                    self._entradas = json.load(f)
+            except (OSError, ValueError) as e:
+                log.warning(f"Índice de chaves ignorado ({arquivo}): {e}")
+
+    def triar(self, caminho: str) -> Triagem:
+        caminho = os.path.abspath(caminho)
+        st = os.stat(caminho)
+        entrada = self._entradas.get(caminho)
+        if entrada and len(entrada) == 5 and entrada[:2] == [st.st_size, st.st_mtime_ns]:
+            return entrada[2], entrada[3], entrada[4]
+        tipo, chave, autorizada = triar_arquivo(caminho)
+        self._entradas[caminho] = [st.st_size, st.st_mtime_ns, tipo, chave, autorizada]
+        self._alterado = True
+        return tipo, chave, autorizada
+
+    def salvar(self) -> None:
+        if not self.arquivo or not self._alterado:
+            return
+        temporario = f"{self.arquivo}.tmp"
+        os.makedirs(os.path.dirname(os.path.abspath(self.arquivo)), exist_ok=True)
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump(self._entradas, f)
+        os.replace(temporario, self.arquivo)
+        self._alterado = False
+
+
+def indice_padrao() -> IndiceChaves:
+    """Índice persistido em ``NFE_INDICE_CHAVES``, ou apenas em memória."""
+    return IndiceChaves(os.getenv("NFE_INDICE_CHAVES") or None)
+
+
+def triar_xmls(
+    xml_paths: Iterable[str],
+    indice: Optional[IndiceChaves] = None,
+    duplicadas: Optional[List[str]] = None,
+    canceladas: Optional[Set[str]] = None,
+) -> List[str]:
+    """Retorna apenas as NF-e de ``xml_paths`` a extrair, uma por chave.
+
+    Fica uma cópia por chave de acesso, na posição da primeira ocorrência;
+    entre as cópias, um ``nfeProc`` substitui o ``NFe`` avulso. Arquivos
+    sem chave nos primeiros bytes (ou ilegíveis) seguem sem triagem. Os
+    caminhos repetidos vão para ``duplicadas`` e as chaves das notas
+    canceladas por eventos, para ``canceladas``. Outros documentos são
+    descartados.
+    """
+    indice = indice or IndiceChaves()
+    mantidos: List[str] = []
+    posicoes: Dict[str, Tuple[int, bool]] = {}
+    outros = 0
+    for caminho in xml_paths:
+        try:
+            tipo, chave, autorizada = indice.triar(caminho)
+        except OSError:
+            tipo, chave, autorizada = TIPO_NFE, None, False
+        if tipo == TIPO_EVENTO:
+            if chave and canceladas is not None:
+                canceladas.add(chave)
+            continue
+        if tipo == TIPO_OUTRO:
+            outros += 1
+            continue
+        if chave is None:
+            mantidos.append(caminho)
+            continue
+        if chave not in posicoes:
+            posicoes[chave] = (len(mantidos), autorizada)
+            mantidos.append(caminho)
+            continue
+        posicao, ja_autorizada = posicoes[chave]
+        if autorizada and not ja_autorizada:
+            caminho, mantidos[posicao] = mantidos[posicao], caminho
+            posicoes[chave] = (posicao, True)
+        if duplicadas is not None:
+            duplicadas.append(caminho)
+    if outros:
+        log.info(f"{outros} XMLs ignorados por não serem NF-e nem eventos")
+    try:
+        indice.salvar()
+    except OSError as e:
+        log.warning(f"Não foi possível gravar o índice de chaves: {e}")
+    return mantidos